@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Asset-Pipeline für das Web-Interface der Marstek PV-Akku Steuerung
+Statische Dateien und Seiten werden beim Start einmal gehasht und mit gzip
+vorkomprimiert - ausgeliefert ohne Festplattenzugriff und ohne Komprimierung pro Anfrage
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, Any, Optional
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+class Asset:
+    """Vorbereitete Datei: Inhalt, gzip-Variante und Inhalts-Hash"""
+
+    __slots__ = ('name', 'mimetype', 'body', 'gzip_body', 'digest')
+
+    def __init__(self, name: str, body: bytes, mimetype: str, gzip_level: int = 9, min_gzip_size: int = 256):
+        self.name = name
+        self.mimetype = mimetype
+        self.body = body
+        self.digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+
+        # mtime=0: gleiche Datei ergibt gleiche Bytes (stabil über Neustarts)
+        compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0) if len(body) >= min_gzip_size else None
+        self.gzip_body = compressed if compressed is not None and len(compressed) < len(body) else None
+
+    @property
+    def hashed_name(self) -> str:
+        """Dateiname mit Inhalts-Hash, z.B. css/base.3f2a9c1e0b7d4a55.css"""
+        root, ext = os.path.splitext(self.name)
+        return f"{root}.{self.digest}{ext}"
+
+    def response(self, cache_control: str) -> Response:
+        """Antwort mit gzip (falls vom Client akzeptiert), ETag und Cache-Headern"""
+        use_gzip = self.gzip_body is not None and request.accept_encodings['gzip'] > 0
+
+        response = Response(self.gzip_body if use_gzip else self.body, mimetype=self.mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        # Eigener ETag je Kodierung - Caches dürfen die Varianten nicht vertauschen
+        response.set_etag(f"{self.digest}-gz" if use_gzip else self.digest)
+        response.headers['Cache-Control'] = cache_control
+        if self.gzip_body is not None:
+            response.vary.add('Accept-Encoding')
+        return response.make_conditional(request)
+
+
+class AssetPipeline:
+    """Baut alle statischen Dateien beim Start und stellt gehashte URLs bereit"""
+
+    def __init__(self, static_dir: str = 'static', url_prefix: str = '/static', gzip_level: int = 9):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.gzip_level = gzip_level
+
+        self._assets: Dict[str, Asset] = {}   # Originalname -> Asset
+        self._hashed: Dict[str, Asset] = {}   # gehashter Name -> Asset
+        self._pages: Dict[str, Asset] = {}    # Seitenname -> Asset
+
+    def build(self):
+        """Liest, hasht und komprimiert alle Dateien unter static_dir"""
+        self._assets.clear()
+        self._hashed.clear()
+
+        raw_size = compressed_size = 0
+        for root, _, files in os.walk(self.static_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+
+                asset = Asset(name, body, self._guess_mimetype(name), self.gzip_level)
+                self._assets[name] = asset
+                self._hashed[asset.hashed_name] = asset
+                raw_size += len(body)
+                compressed_size += len(asset.gzip_body or body)
+
+        logger.info(f"Assets vorbereitet: {len(self._assets)} Dateien, "
+                    f"{raw_size / 1024:.1f} KB -> {compressed_size / 1024:.1f} KB (gzip)")
+
+    def add_page(self, name: str, html: str) -> Asset:
+        """Registriert eine fertig gerenderte HTML-Seite"""
+        page = Asset(name, html.encode('utf-8'), 'text/html', self.gzip_level)
+        self._pages[name] = page
+        return page
+
+    def page_response(self, name: str) -> Response:
+        """Liefert eine registrierte Seite - Revalidierung per ETag kostet nur eine 304-Antwort"""
+        return self._pages[name].response(REVALIDATE_CACHE)
+
+    def url(self, name: str) -> str:
+        """URL mit Inhalts-Hash für Templates (unbekannte Dateien: normale URL)"""
+        asset = self._assets.get(name)
+        return f"{self.url_prefix}/{asset.hashed_name if asset else name}"
+
+    def static_response(self, filename: str) -> Optional[Response]:
+        """Antwort für /static/<filename> oder None, wenn die Datei nicht vorbereitet ist"""
+        asset = self._hashed.get(filename)
+        if asset is not None:
+            # Gehashte URL ändert sich mit dem Inhalt - darf unbegrenzt gecacht werden
+            return asset.response(IMMUTABLE_CACHE)
+
+        asset = self._assets.get(filename)
+        if asset is not None:
+            return asset.response(REVALIDATE_CACHE)
+        return None
+
+    @staticmethod
+    def _guess_mimetype(name: str) -> str:
+        mimetype, _ = mimetypes.guess_type(name)
+        return mimetype or 'application/octet-stream'
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Übersicht der vorbereiteten Dateien zurück"""
+        return {
+            'assets': {name: {'url': self.url(name), 'size': len(asset.body),
+                              'gzip_size': len(asset.gzip_body) if asset.gzip_body else None}
+                       for name, asset in self._assets.items()},
+            'pages': {name: {'size': len(page.body), 'gzip_size': len(page.gzip_body) if page.gzip_body else None}
+                      for name, page in self._pages.items()}
+        }
@@ -9,6 +9,10 @@ import time
 from typing import Optional, Dict, Any, Tuple
 from pymodbus.client import ModbusTcpClient
 from pymodbus.exceptions import ModbusException
+from power_allocation import PowerAllocator
+from soc_estimator import SocEstimator
+import metrics
+import timing
 
 logger = logging.getLogger(__name__)
 
@@ -23,10 +27,19 @@ REG_MODBUS_ADDRESS = 41100   # Modbus-Adresse
 REG_TEMPERATURE_1 = 35001    # Temperatur 1
 REG_TEMPERATURE_2 = 35002    # Temperatur 2
 
+# Ergebnis der letzten Modbus-Operation (Flugschreiber)
+RESULT_NONE = 0              # Keine Operation
+RESULT_OK = 1
+RESULT_CONNECT_FAILED = 2    # Verbindung nicht aufgebaut
+RESULT_MODBUS_ERROR = 3      # Gerät meldet Fehler
+RESULT_EXCEPTION = 4         # Timeout/Protokollfehler
+RESULT_IMPLAUSIBLE = 5       # Unplausibler Registerwert
+
 class BatteryClient:
     """Client für einen einzelnen Akku - OHNE FALLBACK-WERTE"""
     
-    def __init__(self, ip: str, port: int, slave_id: int, timeout: int = 3):
+    def __init__(self, ip: str, port: int, slave_id: int, timeout: int = 3,
+                 soc_estimator: Optional[SocEstimator] = None):
         self.ip = ip
         self.port = port
         self.slave_id = slave_id
@@ -40,6 +53,21 @@ class BatteryClient:
         self.error_count = 0
         self.is_modbus_active = False
         self.last_active_mode = 0
+        self.stop_confirmed = False  # Stopp wurde erfolgreich geschrieben
+        self.last_result = RESULT_NONE  # Ergebnis der letzten Modbus-Operation
+        self.last_result_time = 0.0
+        self.last_write_time = 0.0  # Letzter erfolgreich geschriebener Sollwert
+        
+        # SoC-Schätzung zwischen den Registerlesungen
+        self.soc_estimator = soc_estimator or SocEstimator(capacity_wh=5120)
+        
+        # Metriken je Akku (werden bei jeder Operation direkt aktualisiert)
+        label = str(slave_id)
+        self._metric_power = metrics.BATTERY_POWER.labels(label)
+        self._metric_soc = metrics.BATTERY_SOC.labels(label)
+        self._metric_mode = metrics.BATTERY_MODE.labels(label)
+        self._metric_errors = metrics.BATTERY_ERRORS.labels(label)
+        self.publish_metrics()
         
         logger.info(f"Duravolt-Akku-Client erstellt - ID: {slave_id}, IP: {ip}:{port}")
     
@@ -52,7 +80,9 @@ class BatteryClient:
                 timeout=self.timeout
             )
             
-            if client.connect():
+            with timing.span('modbus_connect'):
+                connected = client.connect()
+            if connected:
                 return client
             else:
                 logger.warning(f"Akku {self.slave_id}: Modbus-Verbindung fehlgeschlagen")
@@ -62,26 +92,47 @@ class BatteryClient:
             logger.error(f"Akku {self.slave_id}: Fehler beim Verbinden: {e}")
             return None
     
+    def _set_result(self, code: int):
+        self.last_result = code
+        self.last_result_time = time.time()
+    
+    def publish_metrics(self):
+        """Überträgt den aktuellen Stand in die Metriken (ohne Geräte-I/O)"""
+        self._metric_power.set(-self.current_power if self.current_mode == 1 else self.current_power)
+        self._metric_soc.set(self.get_soc())
+        self._metric_mode.set(self.current_mode)
+        self._metric_errors.set(self.error_count)
+    
     def read_soc(self) -> Optional[float]:
         """
         Liest SoC vom Akku - OHNE Fallback-Werte
         """
+        with timing.span('read_soc') as span:
+            soc = self._read_soc()
+        metrics.MODBUS_OP_SECONDS.labels('read_soc', 'ok' if soc is not None else 'error').observe(span.duration)
+        self.publish_metrics()
+        return soc
+    
+    def _read_soc(self) -> Optional[float]:
         client = self._create_connection()
         if not client:
             self.error_count += 1
+            self._set_result(RESULT_CONNECT_FAILED)
             return None
         
         try:
             # SoC lesen mit exakt derselben Methode
-            result = client.read_holding_registers(
-                address=REG_SOC,     # 32104 
-                count=1,
-                slave=self.slave_id
-            )
+            with timing.span('modbus_read'):
+                result = client.read_holding_registers(
+                    address=REG_SOC,     # 32104 
+                    count=1,
+                    slave=self.slave_id
+                )
             
             if result.isError():
                 logger.warning(f"Akku {self.slave_id}: SoC-Lese-Fehler: {result}")
                 self.error_count += 1
+                self._set_result(RESULT_MODBUS_ERROR)
                 return None
             
             # SoC konvertieren (Duravolt liefert direkte Prozentwerte)
@@ -92,40 +143,55 @@ class BatteryClient:
             if 0 <= soc <= 100:
                 self.last_soc = soc  # Echter Wert setzen
                 self.last_soc_update = time.time()
+                self.soc_estimator.correct(soc, self.last_soc_update)
                 self.error_count = max(0, self.error_count - 1)
                 logger.debug(f"Akku {self.slave_id}: SoC = {soc}%")
+                self._set_result(RESULT_OK)
                 return soc
             else:
                 logger.warning(f"Akku {self.slave_id}: Unplausibler SoC-Wert: {soc}%")
+                self._set_result(RESULT_IMPLAUSIBLE)
                 return None
                 
         except Exception as e:
             logger.error(f"Akku {self.slave_id}: SoC-Fehler: {e}")
             self.error_count += 1
+            self._set_result(RESULT_EXCEPTION)
             return None
         finally:
             # Verbindung sofort trennen
             client.close()
     
     def set_power(self, power: float, mode: int) -> bool:
+        """Setzt Leistung und Modus (Laden/Entladen/Stopp)"""
+        with timing.span('set_power') as span:
+            success = self._set_power(power, mode)
+        metrics.MODBUS_OP_SECONDS.labels('set_power', 'ok' if success else 'error').observe(span.duration)
+        self.publish_metrics()
+        return success
+    
+    def _write_register(self, client: ModbusTcpClient, address: int, value: int):
+        """Schreibt ein Register (Phase 'modbus_write')"""
+        with timing.span('modbus_write'):
+            return client.write_register(address=address, value=value, slave=self.slave_id)
+    
+    def _set_power(self, power: float, mode: int) -> bool:
 
         client = self._create_connection()
         if not client:
             self.error_count += 1
+            self._set_result(RESULT_CONNECT_FAILED)
             return False
         
         try:
             # SCHRITT 1: RS485-Kontrolle aktivieren
-            result = client.write_register(
-                address=REG_485_CONTROL,  
-                value=21930,              
-                slave=self.slave_id
-            )
+            result = self._write_register(client, REG_485_CONTROL, 21930)
             if result.isError():
                 logger.error(f"Akku {self.slave_id}: RS485-Kontrolle fehlgeschlagen")
+                self._set_result(RESULT_MODBUS_ERROR)
                 return False
             
-            time.sleep(0.1)  # Kurze Pause
+            timing.sleep(0.1)  # Kurze Pause
             
             # SCHRITT 2: Leistung begrenzen wie im alten System
             if power > 0:
@@ -139,61 +205,73 @@ class BatteryClient:
             if mode == 1:  # Laden
                 if mode_changed:
                     # Erst Entladung stoppen
-                    client.write_register(REG_DISCHARGE_POWER, 0, slave=self.slave_id)
-                    time.sleep(0.2)
+                    self._write_register(client, REG_DISCHARGE_POWER, 0)
+                    timing.sleep(0.2)
                     # Dann Lademodus aktivieren
-                    client.write_register(REG_CHARGE_MODE, 1, slave=self.slave_id)
-                    time.sleep(0.5)
+                    self._write_register(client, REG_CHARGE_MODE, 1)
+                    timing.sleep(0.5)
                 # Lade-Leistung setzen
-                client.write_register(REG_CHARGE_POWER, int(power), slave=self.slave_id)
+                self._write_register(client, REG_CHARGE_POWER, int(power))
                 
             elif mode == 2:  # Entladen
                 if mode_changed:
                     # Erst Ladung stoppen
-                    client.write_register(REG_CHARGE_POWER, 0, slave=self.slave_id)
-                    time.sleep(0.2)
+                    self._write_register(client, REG_CHARGE_POWER, 0)
+                    timing.sleep(0.2)
                     # Dann Entlademodus aktivieren
-                    client.write_register(REG_CHARGE_MODE, 2, slave=self.slave_id)
-                    time.sleep(0.5)
+                    self._write_register(client, REG_CHARGE_MODE, 2)
+                    timing.sleep(0.5)
                 # Entlade-Leistung setzen
-                client.write_register(REG_DISCHARGE_POWER, int(power), slave=self.slave_id)
+                self._write_register(client, REG_DISCHARGE_POWER, int(power))
                 
             else:  # Stopp (mode == 0)
                 # Beide Leistungen auf 0, dann Modus auf 0
-                client.write_register(REG_CHARGE_POWER, 0, slave=self.slave_id)
-                time.sleep(0.1)
-                client.write_register(REG_DISCHARGE_POWER, 0, slave=self.slave_id)
-                time.sleep(0.1)
-                client.write_register(REG_CHARGE_MODE, 0, slave=self.slave_id)
+                self._write_register(client, REG_CHARGE_POWER, 0)
+                timing.sleep(0.1)
+                self._write_register(client, REG_DISCHARGE_POWER, 0)
+                timing.sleep(0.1)
+                self._write_register(client, REG_CHARGE_MODE, 0)
             
             # Status aktualisieren wie im alten System
             self.current_mode = mode
             self.current_power = power if mode > 0 else 0
             
+            # SoC-Schätzung mit neuer Leistung fortschreiben (Entladen positiv)
+            signed_power = self.current_power if mode == 2 else -self.current_power
+            self.soc_estimator.set_power(signed_power)
+            
             if mode > 0:
                 self.last_active_mode = mode
+            self.stop_confirmed = (mode == 0)
+            self.last_write_time = time.time()
             
             self.error_count = max(0, self.error_count - 1)
             logger.debug(f"Akku {self.slave_id}: {power}W, Modus {mode}")
+            self._set_result(RESULT_OK)
             return True
             
         except Exception as e:
             logger.error(f"Akku {self.slave_id}: Fehler beim Setzen der Leistung: {e}")
             self.error_count += 1
+            self._set_result(RESULT_EXCEPTION)
             return False
         finally:
             # Verbindung sofort trennen
             client.close()
     
-    0
+    def get_soc(self) -> Optional[float]:
+        """Aktueller SoC-Schätzwert (zwischen Lesungen fortgeschrieben) oder None"""
+        return self.soc_estimator.get_soc()
     
     def get_status(self) -> Dict[str, Any]:
         """Gibt aktuellen Status des Duravolt Akkus zurück - OHNE Fallback-Werte"""
         soc_age = time.time() - self.last_soc_update if self.last_soc_update > 0 else 999
+        soc_estimate = self.get_soc()
         
         return {
             'slave_id': self.slave_id,
             'soc': self.last_soc,  # Kann None sein!
+            'soc_estimate': round(soc_estimate, 1) if soc_estimate is not None else None,
             'soc_age_seconds': int(soc_age),
             'current_power': self.current_power,
             'current_mode': self.current_mode,
@@ -208,20 +286,37 @@ class BatteryClient:
     def reset_error_count(self):
         """Setzt Fehlerzähler zurück"""
         self.error_count = 0
+        self._metric_errors.set(0)
         logger.info(f"Akku {self.slave_id}: Fehlerzähler zurückgesetzt")
 
 class BatteryManager:
     """Manager für mehrere Duravolt Akkus - OHNE Fallback-Werte"""
     
-    def __init__(self, ip: str, port: int, akku_ids: list, timeout: int = 3):
+    def __init__(self, ip: str, port: int, akku_ids: list, timeout: int = 3,
+                 allocation_config: Optional[Dict[str, Any]] = None):
         self.ip = ip
         self.port = port
         self.timeout = timeout
         
-        # Erstelle Duravolt Akku-Clients
+        # Leistungsverteilung (ohne Konfiguration: gleichmäßig auf alle Akkus wie bisher)
+        if allocation_config is not None:
+            self.allocator = PowerAllocator.from_config(allocation_config)
+        else:
+            self.allocator = PowerAllocator(min_power=50, max_power=2500, strategy='equal', concentrate=False)
+        
+        # Unveränderte Sollwerte nach dieser Zeit erneut schreiben (Akku-Neustart, verlorener Schreibvorgang)
+        allocation_config = allocation_config or {}
+        self.setpoint_refresh_seconds = allocation_config.get('setpoint_refresh_seconds', 300)
+        
+        # Erstelle Duravolt Akku-Clients mit SoC-Schätzer je Akku
         self.batteries = {}
         for akku_id in akku_ids:
-            self.batteries[akku_id] = BatteryClient(ip, port, akku_id, timeout)
+            estimator = SocEstimator(
+                capacity_wh=self.allocator.get_capacity(akku_id),
+                charge_efficiency=allocation_config.get('charge_efficiency', 0.95),
+                discharge_efficiency=allocation_config.get('discharge_efficiency', 0.95)
+            )
+            self.batteries[akku_id] = BatteryClient(ip, port, akku_id, timeout, soc_estimator=estimator)
         
         logger.info(f"Duravolt Battery-Manager erstellt für {len(akku_ids)} Akkus: {akku_ids}")
     
@@ -233,36 +328,48 @@ class BatteryManager:
             soc_values[akku_id] = soc
         return soc_values
     
+    def update_soc(self, akku_id: int) -> Optional[float]:
+        """Aktualisiert SoC eines einzelnen Duravolt Akkus"""
+        return self.batteries[akku_id].read_soc()
+    
     def distribute_power(self, total_power: float, mode: int, min_soc: int, max_soc: int) -> bool:
         """Verteilt Gesamtleistung auf verfügbare Duravolt Akkus"""
+        with timing.span('distribute'):
+            return self._distribute_power(total_power, mode, min_soc, max_soc)
+    
+    def _distribute_power(self, total_power: float, mode: int, min_soc: int, max_soc: int) -> bool:
         logger.info(f"DISTRIBUTE: Power={total_power:.0f}W, Modus={mode}, SoC-Range={min_soc}-{max_soc}%")
         
         if mode == 0:  # Stopp alle - aber nur wenn wirklich gewollt!
             logger.info("Expliciter STOPP-Modus - alle Akkus stoppen")
             return self.stop_all()
         
-        # Verfügbare Akkus ermitteln - NUR mit echten SoC-Werten
+        # Verfügbare Akkus ermitteln - NUR mit echten (fortgeschriebenen) SoC-Werten
         available_batteries = []
+        soc_values = {}
         for battery in self.batteries.values():
-            logger.info(f"Debug Akku {battery.slave_id}: SoC={battery.last_soc}, Modus={mode}, Min-SoC={min_soc}, Max-SoC={max_soc}")
+            soc = battery.get_soc()
+            logger.info(f"Debug Akku {battery.slave_id}: SoC={soc if soc is None else round(soc, 1)}, Modus={mode}, Min-SoC={min_soc}, Max-SoC={max_soc}")
             
             # KEIN Fallback! Nur Akkus mit echtem SoC-Wert verwenden
-            if battery.last_soc is None:
+            if soc is None:
                 logger.warning(f"Akku {battery.slave_id}: Kein SoC-Wert verfügbar - übersprungen")
                 continue
                 
             if mode == 1:  # Laden - nur Akkus unter max_soc
-                if battery.last_soc < max_soc:
+                if soc < max_soc:
                     available_batteries.append(battery)
-                    logger.info(f"Akku {battery.slave_id}: Zum Laden verfügbar ({battery.last_soc}% < {max_soc}%)")
+                    soc_values[battery.slave_id] = soc
+                    logger.info(f"Akku {battery.slave_id}: Zum Laden verfügbar ({soc:.1f}% < {max_soc}%)")
                 else:
-                    logger.info(f"Akku {battery.slave_id}: Zu voll zum Laden ({battery.last_soc}% >= {max_soc}%)")
+                    logger.info(f"Akku {battery.slave_id}: Zu voll zum Laden ({soc:.1f}% >= {max_soc}%)")
             elif mode == 2:  # Entladen - nur Akkus über min_soc
-                if battery.last_soc > min_soc:
+                if soc > min_soc:
                     available_batteries.append(battery)
-                    logger.info(f"Akku {battery.slave_id}: Zum Entladen verfügbar ({battery.last_soc}% > {min_soc}%)")
+                    soc_values[battery.slave_id] = soc
+                    logger.info(f"Akku {battery.slave_id}: Zum Entladen verfügbar ({soc:.1f}% > {min_soc}%)")
                 else:
-                    logger.warning(f"Akku {battery.slave_id}: SoC zu niedrig zum Entladen ({battery.last_soc}% <= {min_soc}%)")
+                    logger.warning(f"Akku {battery.slave_id}: SoC zu niedrig zum Entladen ({soc:.1f}% <= {min_soc}%)")
         
         if not available_batteries:
             logger.error(f"KRITISCH: Keine Duravolt Akkus verfügbar für Modus {mode}!")
@@ -272,7 +379,7 @@ class BatteryManager:
             logger.error(f"Anforderung: Modus={mode}, Min-SoC={min_soc}%, Max-SoC={max_soc}%")
             
             # NUR stoppen wenn wirklich ALLE Akkus ungültig sind
-            all_invalid = all(b.last_soc is None for b in self.batteries.values())
+            all_invalid = all(b.get_soc() is None for b in self.batteries.values())
             if all_invalid:
                 logger.error("Alle Akkus haben ungültigen SoC - stoppe alle")
                 return self.stop_all()
@@ -280,27 +387,36 @@ class BatteryManager:
                 logger.error("Einige Akkus haben gültigen SoC, aber keine verfügbar - prüfe SoC-Grenzen!")
                 return False  # NICHT stoppen!
         
-        # Leistung gleichmäßig verteilen
-        num_batteries = len(available_batteries)
-        power_per_battery = total_power / num_batteries
+        # Leistung nach SoC-Reserve und Kapazität verteilen
+        allocation = self.allocator.allocate(total_power, mode, soc_values, min_soc, max_soc)
+        active_batteries = [battery for battery in available_batteries if battery.slave_id in allocation]
+        num_batteries = len(active_batteries)
         
-        # Stoppe nicht verwendete Akkus
+        # Stoppe nicht verwendete Akkus (bereits gestoppte nicht erneut beschreiben)
         for battery in self.batteries.values():
-            if battery not in available_batteries:
+            if battery not in active_batteries and not battery.stop_confirmed:
                 battery.stop()
         
-        # Setze Leistung für verfügbare Akkus
+        # Setze Leistung für aktive Akkus - unveränderte Sollwerte nur zur Auffrischung erneut schreiben
         success_count = 0
         failed_batteries = []
-        for battery in available_batteries:
-            if battery.set_power(power_per_battery, mode):
+        now = time.time()
+        for battery in active_batteries:
+            power = allocation[battery.slave_id]
+            if battery.current_mode == mode and round(battery.current_power) == round(power):
+                if not self._refresh_due(battery, now):
+                    success_count += 1
+                    continue
+                logger.debug(f"Akku {battery.slave_id}: Sollwert {power:.0f}W wird aufgefrischt")
+            if battery.set_power(power, mode):
                 success_count += 1
             else:
                 failed_batteries.append(battery.slave_id)
                 logger.error(f"Akku {battery.slave_id}: Leistung setzen fehlgeschlagen!")
         
         # Logging der Verteilung
-        logger.info(f"Duravolt Leistungsverteilung: {total_power}W auf {success_count}/{num_batteries} Akkus")
+        allocation_text = ", ".join(f"Akku {akku_id}: {power:.0f}W" for akku_id, power in allocation.items())
+        logger.info(f"Duravolt Leistungsverteilung: {total_power}W auf {success_count}/{num_batteries} Akkus ({allocation_text})")
         
         # NUR bei kompletten Fehlern FALSE zurückgeben
         if success_count == 0:
@@ -314,6 +430,25 @@ class BatteryManager:
         
         return success_count > 0  # Mindestens ein Akku muss funktionieren
     
+    def _refresh_due(self, battery, now: float) -> bool:
+        return self.setpoint_refresh_seconds > 0 and now - battery.last_write_time >= self.setpoint_refresh_seconds
+    
+    def refresh_setpoints(self) -> int:
+        """
+        Schreibt aktive Sollwerte, die seit setpoint_refresh_seconds unverändert sind, erneut
+        Ein Akku, der seinen Sollwert verloren hat (Neustart, Modbus-Timeout), wird so korrigiert.
+        Returns: Anzahl aufgefrischter Akkus
+        """
+        now = time.time()
+        refreshed = 0
+        for battery in self.batteries.values():
+            if battery.current_mode == 0 or not self._refresh_due(battery, now):
+                continue
+            logger.debug(f"Akku {battery.slave_id}: Sollwert {battery.current_power:.0f}W wird aufgefrischt")
+            if battery.set_power(battery.current_power, battery.current_mode):
+                refreshed += 1
+        return refreshed
+    
     def stop_all(self) -> bool:
         """Stoppt alle Duravolt Akkus sofort"""
         import traceback
@@ -321,6 +456,8 @@ class BatteryManager:
         logger.warning(f"Aufgerufen von: {traceback.format_stack()[-2].strip()}")
         logger.warning("======================================")
         
+        self.allocator.reset()
+        
         success_count = 0
         for battery in self.batteries.values():
             if battery.stop():
@@ -328,29 +465,45 @@ class BatteryManager:
         
         return success_count == len(self.batteries)
     
+    def get_allocation_status(self) -> Dict[str, Any]:
+        """Gibt Zustand von Leistungsverteilung und Staging zurück"""
+        return self.allocator.get_status()
+    
+    def publish_metrics(self):
+        """Metriken aller Akkus aktualisieren - je Regelzyklus, damit der SoC-Schätzwert auch ohne Modbus-Zugriff aktuell bleibt"""
+        for battery in self.batteries.values():
+            battery.publish_metrics()
+    
+    def get_signed_powers(self) -> Dict[int, float]:
+        """Sollleistung je Akku mit Vorzeichen (Entladen positiv, Laden negativ, Stopp 0)"""
+        sign = {1: -1, 2: 1}
+        return {akku_id: sign.get(battery.current_mode, 0) * battery.current_power
+                for akku_id, battery in self.batteries.items()}
+    
     def get_total_power(self) -> float:
         """Gibt aktuelle Gesamtleistung aller Duravolt Akkus zurück"""
-        total = 0.0
-        for battery in self.batteries.values():
-            if battery.current_mode == 2:  # Entladen = positiv
-                total += battery.current_power
-            elif battery.current_mode == 1:  # Laden = negativ
-                total -= battery.current_power
-        return total
+        return sum(self.get_signed_powers().values())
     
-    def get_average_soc(self) -> float:
-        """Gibt durchschnittlichen SoC aller Duravolt Akkus zurück"""
-        valid_soc_values = []
-        for battery in self.batteries.values():
-            if battery.last_soc is not None:
-                valid_soc_values.append(battery.last_soc)
+    def get_average_soc(self) -> Optional[float]:
+        """
+        Gibt kapazitätsgewichteten durchschnittlichen SoC aller Duravolt Akkus zurück
+        KEIN Fallback - None, wenn noch kein Akku einen SoC geliefert hat
+        """
+        weighted_sum = 0.0
+        total_capacity = 0.0
+        for akku_id, battery in self.batteries.items():
+            soc = battery.get_soc()
+            if soc is not None:
+                capacity = self.allocator.get_capacity(akku_id)
+                weighted_sum += soc * capacity
+                total_capacity += capacity
         
-        if not valid_soc_values:
-            logger.warning("Keine gültigen SoC-Werte verfügbar - verwende 50% als Fallback")
-            return 50.0  # Fallback nur für Berechnungen
+        if total_capacity <= 0:
+            logger.warning("Keine gültigen SoC-Werte verfügbar")
+            return None
         
-        average = sum(valid_soc_values) / len(valid_soc_values)
-        logger.debug(f"Durchschnittlicher SoC: {average:.1f}% (aus {len(valid_soc_values)} Akkus)")
+        average = weighted_sum / total_capacity
+        logger.debug(f"Durchschnittlicher SoC: {average:.1f}%")
         return average
     
     def get_all_status(self) -> Dict[int, Dict[str, Any]]:
@@ -364,8 +517,9 @@ class BatteryManager:
         """Gibt minimalen und maximalen SoC zurück"""
         valid_soc_values = []
         for battery in self.batteries.values():
-            if battery.last_soc is not None:
-                valid_soc_values.append(battery.last_soc)
+            soc = battery.get_soc()
+            if soc is not None:
+                valid_soc_values.append(soc)
         
         if not valid_soc_values:
             return None, None
@@ -7,8 +7,9 @@ Lädt nur aus config.json - keine Fallback-Werte!
 import json
 import logging
 import os
+import threading
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -127,6 +128,46 @@ class ConfigLoader:
     def get_logging_config(self) -> Dict[str, Any]:
         """Gibt Logging-Konfiguration zurück"""
         return self.config.get('logging', {})
+    
+    def get_energy_config(self) -> Dict[str, Any]:
+        """Gibt Energiebilanz-Konfiguration zurück (optional)"""
+        return self.config.get('energy', {})
+    
+    def get_history_config(self) -> Dict[str, Any]:
+        """Gibt Verlaufs-Konfiguration zurück (optional)"""
+        return self.config.get('history', {})
+    
+    def get_flight_recorder_config(self) -> Dict[str, Any]:
+        """Gibt Flugschreiber-Konfiguration zurück (optional)"""
+        return self.config.get('flight_recorder', {})
+
+class ConfigFileCache:
+    """Hält config.json für das Web-Interface im Speicher - neu gelesen wird nur nach Änderung der Datei"""
+    
+    def __init__(self, config_file: str = "config.json"):
+        self.config_file = Path(config_file)
+        self._key: Optional[Tuple[int, int]] = None  # (mtime_ns, Größe)
+        self._data: Dict[str, Any] = {}
+        self._raw = b''
+        self._lock = threading.Lock()
+    
+    def get(self) -> Tuple[Dict[str, Any], bytes]:
+        """Gibt (Konfiguration, Dateiinhalt) zurück - wirft Exception, wenn die Datei fehlt oder ungültig ist"""
+        stat = self.config_file.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._key:
+                raw = self.config_file.read_bytes()
+                self._data = json.loads(raw.decode('utf-8'))
+                self._raw = raw
+                self._key = key
+                logger.debug(f"Konfigurationsdatei neu eingelesen: {self.config_file}")
+            return self._data, self._raw
+    
+    def invalidate(self):
+        """Erzwingt erneutes Einlesen (z.B. nach dem Speichern innerhalb derselben mtime-Auflösung)"""
+        with self._lock:
+            self._key = None
 
 # Globale Instanz
 config = ConfigLoader()
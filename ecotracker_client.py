@@ -9,6 +9,8 @@ import time
 import requests
 from typing import Optional, Dict, Any
 from collections import deque
+import metrics
+import timing
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +28,9 @@ class EcoTrackerClient:
         self.power_history = deque(maxlen=3)
         self.last_poll_time = 0
         
+        # Letzte Zählerstände (Bezug/Einspeisung in Wh) oder None, wenn das Gerät keine liefert
+        self.energy_counters: Optional[Dict[str, float]] = None
+        
         logger.info(f"EcoTracker-Client initialisiert: {ip} (mit 3-Werte-Durchschnitt)")
     
     def poll_current_power(self) -> Optional[float]:
@@ -33,6 +38,17 @@ class EcoTrackerClient:
         Holt AKTUELLE Leistung vom EcoTracker und fügt sie zur History hinzu
         Returns: Aktuelle Leistung in Watt (positiv=Bezug, negativ=Einspeisung) oder None bei Fehler
         """
+        with timing.span('meter_read') as span:
+            power = self._poll_current_power()
+        metrics.METER_POLL_SECONDS.labels('ecotracker').observe(span.duration)
+        if power is None:
+            metrics.METER_POLL_FAILURES.labels('ecotracker').inc()
+        else:
+            metrics.GRID_POWER.set(power)
+        metrics.METER_FAILURE_COUNT.labels('ecotracker').set(self.failure_count)
+        return power
+    
+    def _poll_current_power(self) -> Optional[float]:
         try:
             url = f"{self.base_url}/v1/json"
             response = requests.get(url, timeout=self.timeout)
@@ -45,6 +61,14 @@ class EcoTrackerClient:
             current_power = float(data.get('power', 0))
             current_time = time.time()
             
+            # Zählerstände aus derselben Antwort (Wh) für die Energiebilanz
+            if 'energyCounterIn' in data and 'energyCounterOut' in data:
+                self.energy_counters = {
+                    'import_wh': float(data['energyCounterIn']),
+                    'export_wh': float(data['energyCounterOut']),
+                    'timestamp': current_time
+                }
+            
             # Zur History hinzufügen
             self.power_history.append({
                 'power': current_power,
@@ -165,6 +189,28 @@ class EcoTrackerClient:
     
     def get_status(self) -> Dict[str, Any]:
         """Gibt aktuellen Status des EcoTracker-Clients zurück"""
+        return self._build_status(online=self.is_online(), current_average=self.get_power())
+    
+    def get_cached_status(self) -> Dict[str, Any]:
+        """
+        Status ohne Netzwerkzugriff - abgeleitet aus den letzten Abrufen
+        Für Status-Snapshots, damit Web-Anfragen das Messgerät nicht zusätzlich belasten
+        """
+        online = self.failure_count == 0 and self.last_poll_time > 0
+        return self._build_status(online=online, current_average=self.get_cached_power())
+    
+    def get_energy_counters(self) -> Optional[Dict[str, float]]:
+        """Zählerstände aus dem letzten Abruf (ohne neuen Abruf)"""
+        return self.energy_counters
+    
+    def get_cached_power(self) -> Optional[float]:
+        """Durchschnitt der vorhandenen History ohne neuen Abruf (None ohne Daten)"""
+        if not self.power_history:
+            return None
+        return self.get_power()
+    
+    def _build_status(self, online: bool, current_average: Optional[float]) -> Dict[str, Any]:
+        """Erstellt Status-Dict aus History und Fehlerzählern"""
         current_time = time.time()
         history_info = {
             'count': len(self.power_history),
@@ -176,12 +222,12 @@ class EcoTrackerClient:
         
         return {
             'ip': self.ip,
-            'online': self.is_online(),
+            'online': online,
             'failure_count': self.failure_count,
             'last_success': self.last_success,
             'seconds_since_success': int(current_time - self.last_success),
             'history': history_info,
-            'current_average': self.get_power()
+            'current_average': current_average
         }
     
     def reset_failure_count(self):
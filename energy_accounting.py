@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Energiebilanz für Marstek PV-Akku Steuerung
+Integriert Netzbezug/-einspeisung und Lade-/Entladeenergie je Akku fortlaufend,
+speichert die Summen regelmäßig und liefert Kennzahlen ohne Rückgriff auf den Rohverlauf
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Längere Lücken (Ausfall, Neustart) werden nicht integriert
+MAX_INTEGRATION_GAP = 30
+
+# Kennzahlen erst ab dieser Energiemenge berechnen (sonst nur Rauschen)
+MIN_RATIO_ENERGY_WH = 100
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {'grid_import_wh': 0.0, 'grid_export_wh': 0.0, 'batteries': {}}
+
+
+def _next_midnight(timestamp: float) -> float:
+    """Beginn des folgenden Tages (Ortszeit)"""
+    following = date.fromtimestamp(timestamp) + timedelta(days=1)
+    return datetime.combine(following, datetime.min.time()).timestamp()
+
+
+class EnergyAccountant:
+    """Fortlaufende Energiebilanz: gesamt und je Tag"""
+
+    def __init__(self, path: str = 'history/energy.json', persist_interval_seconds: float = 300, days_kept: int = 31):
+        self.path = path
+        self.persist_interval = persist_interval_seconds
+        self.days_kept = days_kept
+
+        self.totals = _empty_totals()
+        self.days: Dict[str, Dict[str, Any]] = {}  # 'YYYY-MM-DD' -> Summen des Tages
+        self.since = time.time()
+        self.grid_source = 'integriert'
+
+        self._last_grid: Optional[tuple] = None       # (Zeit, Leistung)
+        self._last_counters: Optional[Dict[str, float]] = None
+        self._last_battery: Dict[int, tuple] = {}     # ID -> (Zeit, Leistung mit Vorzeichen)
+        self._last_persist = time.time()
+        self._lock = threading.Lock()
+
+        self._load()
+
+    def _day(self, timestamp: float) -> Dict[str, Any]:
+        key = date.fromtimestamp(timestamp).isoformat()
+        if key not in self.days:
+            self.days[key] = _empty_totals()
+            # Älteste Tage verwerfen
+            for old in sorted(self.days)[:-self.days_kept]:
+                del self.days[old]
+        return self.days[key]
+
+    @staticmethod
+    def _book(totals: Dict[str, Any], key: str, wh: float, akku_id: Optional[int]):
+        if akku_id is None:
+            totals[key] += wh
+        else:
+            battery = totals['batteries'].setdefault(str(akku_id), {'charge_wh': 0.0, 'discharge_wh': 0.0})
+            battery[key] += wh
+
+    def _add(self, start: float, end: float, key: str, wh: float, akku_id: Optional[int] = None):
+        """
+        Bucht die Energie des Intervalls [start, end] in Gesamt- und Tagessummen
+        Über Mitternacht wird zeitanteilig auf beide Tage aufgeteilt
+        """
+        if wh <= 0:
+            return
+        self._book(self.totals, key, wh, akku_id)
+        remaining = wh
+        current = start
+        while end > start:
+            boundary = _next_midnight(current)
+            if boundary >= end:
+                break
+            share = wh * (boundary - current) / (end - start)
+            self._book(self._day(current), key, share, akku_id)
+            remaining -= share
+            current = boundary
+        self._book(self._day(current), key, remaining, akku_id)
+
+    def update_grid(self, timestamp: float, power: Optional[float], counters: Optional[Dict[str, float]] = None):
+        """
+        Neuer Zählerwert (positiv = Bezug, negativ = Einspeisung)
+        Liefert das Messgerät Zählerstände, werden deren Differenzen gebucht statt integriert
+        """
+        with self._lock:
+            if counters is not None:
+                self._update_grid_counters(timestamp, counters)
+            elif power is not None:
+                self._integrate_grid(timestamp, power)
+
+            if power is not None:
+                self._last_grid = (timestamp, power)
+            self._maybe_persist(timestamp)
+
+    def _update_grid_counters(self, timestamp: float, counters: Dict[str, float]):
+        self.grid_source = 'zähler'
+        previous = self._last_counters
+        self._last_counters = counters
+        if previous is None:
+            return
+        delta_import = counters['import_wh'] - previous['import_wh']
+        delta_export = counters['export_wh'] - previous['export_wh']
+        # Rückwärts laufende Zähler (Geräte-Reset) oder Sprünge nicht buchen
+        if delta_import < 0 or delta_export < 0:
+            logger.warning("Energiezähler zurückgesetzt - neue Basis")
+            return
+        start = previous.get('timestamp', timestamp)
+        self._add(start, timestamp, 'grid_import_wh', delta_import)
+        self._add(start, timestamp, 'grid_export_wh', delta_export)
+
+    def _integrate_grid(self, timestamp: float, power: float):
+        """Trapezregel mit Aufteilung am Nulldurchgang in Bezug und Einspeisung"""
+        if self._last_grid is None:
+            return
+        last_time, last_power = self._last_grid
+        gap = timestamp - last_time
+        if not 0 < gap <= MAX_INTEGRATION_GAP:
+            return
+
+        if (last_power >= 0) == (power >= 0):
+            wh = (last_power + power) / 2 * gap / 3600
+            self._add(last_time, timestamp, 'grid_import_wh' if wh >= 0 else 'grid_export_wh', abs(wh))
+        else:
+            # Vorzeichenwechsel: Fläche beider Dreiecke getrennt buchen
+            crossing = last_time + gap * abs(last_power) / (abs(last_power) + abs(power))
+            first = last_power / 2 * (crossing - last_time) / 3600
+            second = power / 2 * (timestamp - crossing) / 3600
+            self._add(last_time, crossing, 'grid_import_wh' if first >= 0 else 'grid_export_wh', abs(first))
+            self._add(crossing, timestamp, 'grid_import_wh' if second >= 0 else 'grid_export_wh', abs(second))
+
+    def update_batteries(self, timestamp: float, powers: Dict[int, float]):
+        """
+        Akku-Leistungen mit Vorzeichen (Entladen positiv, Laden negativ)
+        Sollwerte gelten bis zum nächsten Schreiben - daher Halteglied statt Trapez.
+        Gebucht werden die geschriebenen Sollwerte, keine am Akku gemessene Leistung.
+        """
+        with self._lock:
+            for akku_id, power in powers.items():
+                previous = self._last_battery.get(akku_id)
+                self._last_battery[akku_id] = (timestamp, power)
+                if previous is None:
+                    continue
+                last_time, last_power = previous
+                gap = timestamp - last_time
+                if not 0 < gap <= MAX_INTEGRATION_GAP:
+                    continue
+                wh = last_power * gap / 3600
+                self._add(last_time, timestamp, 'discharge_wh' if wh > 0 else 'charge_wh', abs(wh), akku_id)
+            self._maybe_persist(timestamp)
+
+    @staticmethod
+    def _ratios(totals: Dict[str, Any]) -> Dict[str, Any]:
+        """Kennzahlen aus Summen (None bei zu wenig Energie)"""
+        batteries = {}
+        charge_total = discharge_total = 0.0
+        for akku_id, battery in totals['batteries'].items():
+            charge, discharge = battery['charge_wh'], battery['discharge_wh']
+            charge_total += charge
+            discharge_total += discharge
+            batteries[akku_id] = {
+                'charge_kwh': round(charge / 1000, 3),
+                'discharge_kwh': round(discharge / 1000, 3),
+                'commanded_round_trip_ratio': round(discharge / charge, 3) if charge >= MIN_RATIO_ENERGY_WH else None
+            }
+
+        grid_import, grid_export = totals['grid_import_wh'], totals['grid_export_wh']
+        surplus = charge_total + grid_export
+        demand = discharge_total + grid_import
+        return {
+            'grid_import_kwh': round(grid_import / 1000, 3),
+            'grid_export_kwh': round(grid_export / 1000, 3),
+            'battery_charge_kwh': round(charge_total / 1000, 3),
+            'battery_discharge_kwh': round(discharge_total / 1000, 3),
+            # Verhältnis der Sollwert-Energien - kein gemessener Wirkungsgrad
+            'commanded_round_trip_ratio': round(discharge_total / charge_total, 3) if charge_total >= MIN_RATIO_ENERGY_WH else None,
+            # Anteil des PV-Überschusses, der in die Akkus statt ins Netz ging
+            'self_consumption_ratio': round(charge_total / surplus, 3) if surplus >= MIN_RATIO_ENERGY_WH else None,
+            # Anteil des Bedarfs hinter dem Zähler, den die Akkus statt des Netzes gedeckt haben
+            'autarky_ratio': round(discharge_total / demand, 3) if demand >= MIN_RATIO_ENERGY_WH else None,
+            'batteries': batteries
+        }
+
+    def get_summary(self) -> Dict[str, Any]:
+        """Gesamt-, Tages- und Kennzahlen für /api/energy"""
+        with self._lock:
+            today_key = date.today().isoformat()
+            return {
+                'since': datetime.fromtimestamp(self.since).isoformat(timespec='seconds'),
+                'grid_source': self.grid_source,
+                'battery_source': 'sollwerte',  # Akku-Energie aus geschriebenen Sollwerten, nicht gemessen
+                'total': self._ratios(self.totals),
+                'today': self._ratios(self.days.get(today_key, _empty_totals())),
+                'days': {day: self._ratios(totals) for day, totals in sorted(self.days.items())}
+            }
+
+    def _maybe_persist(self, timestamp: float):
+        if timestamp - self._last_persist >= self.persist_interval:
+            self._last_persist = timestamp
+            self._persist()
+
+    def _persist(self):
+        """Schreibt die Summen atomar (temporäre Datei + Umbenennen)"""
+        data = {'version': 1, 'since': self.since, 'totals': self.totals, 'days': self.days}
+        tmp_path = self.path + '.tmp'
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Energiebilanz konnte nicht gespeichert werden: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.since = data['since']
+            self.totals = data['totals']
+            self.days = data.get('days', {})
+            logger.info(f"Energiebilanz geladen: {self.totals['grid_import_wh'] / 1000:.1f} kWh Bezug, "
+                        f"{self.totals['grid_export_wh'] / 1000:.1f} kWh Einspeisung seit "
+                        f"{datetime.fromtimestamp(self.since):%d.%m.%Y}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Energiebilanz nicht lesbar ({e}) - beginne neu")
+
+    def close(self):
+        """Speichert die Summen (Aufruf beim Shutdown)"""
+        with self._lock:
+            self._persist()
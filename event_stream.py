@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events für Marstek PV-Akku Steuerung
+Jedes Ereignis wird einmal serialisiert und als gemeinsamer Byte-Block an
+alle verbundenen Dashboards verteilt
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """Verteilt Status- und Log-Ereignisse an alle SSE-Clients"""
+
+    def __init__(self, max_events: int = 200, max_clients: int = 8, heartbeat_seconds: float = 15):
+        self.max_clients = max_clients
+        self.heartbeat_seconds = heartbeat_seconds
+
+        self._events = deque(maxlen=max_events)  # (seq, fertiger SSE-Block)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self.client_count = 0
+
+    @staticmethod
+    def format_event(event: str, payload: bytes, seq: Optional[int] = None) -> bytes:
+        """Baut einen SSE-Block aus bereits serialisierten JSON-Daten"""
+        header = f"id: {seq}\nevent: {event}\n" if seq is not None else f"event: {event}\n"
+        return header.encode('utf-8') + b"data: " + payload + b"\n\n"
+
+    def publish(self, event: str, payload: bytes) -> int:
+        """Veröffentlicht ein Ereignis mit fertig serialisierter JSON-Nutzlast"""
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq, self.format_event(event, payload, self._seq)))
+            self._condition.notify_all()
+            return self._seq
+
+    def publish_json(self, event: str, data: Dict[str, Any]) -> int:
+        """Serialisiert und veröffentlicht ein Ereignis"""
+        return self.publish(event, json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'))
+
+    def try_register(self) -> bool:
+        """Meldet einen neuen Client an - False, wenn das Client-Limit erreicht ist"""
+        with self._condition:
+            if self.client_count >= self.max_clients:
+                return False
+            self.client_count += 1
+            return True
+
+    def _unregister(self):
+        with self._condition:
+            self.client_count = max(0, self.client_count - 1)
+
+    def cursor(self) -> int:
+        """Aktuelle Ereignis-Sequenz - vor dem Zusammenstellen der Startdaten lesen und an stream() übergeben"""
+        with self._condition:
+            return self._seq
+
+    def stream(self, initial_blocks: List[bytes], since: int) -> Iterator[bytes]:
+        """
+        Generator für einen angemeldeten Client: erst die Startdaten, dann alle Ereignisse nach 'since'
+        Ereignisse zwischen cursor() und dem Start des Streams werden nachgeliefert (der Client
+        verwirft doppelte Log-Einträge über die Sequenznummer).
+        Heartbeat-Kommentare erkennen getrennte Verbindungen und halten Proxies offen
+        """
+        last_seq = since
+        try:
+            yield b"retry: 3000\n\n"
+            for block in initial_blocks:
+                yield block
+
+            while True:
+                with self._condition:
+                    if self._seq == last_seq:
+                        self._condition.wait(self.heartbeat_seconds)
+                    pending = [block for seq, block in self._events if seq > last_seq]
+                    last_seq = self._seq
+
+                if pending:
+                    yield b"".join(pending)
+                else:
+                    yield b": ping\n\n"
+        finally:
+            self._unregister()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Anzahl Clients und Ereignisse zurück"""
+        return {
+            'clients': self.client_count,
+            'max_clients': self.max_clients,
+            'last_event_id': self._seq
+        }
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Flugschreiber für Marstek PV-Akku Steuerung
+Speichert jeden Regelzyklus als gepackten Datensatz in einer Ringdatei fester Größe (mmap).
+Geschriebene Daten liegen sofort im Page-Cache und überstehen damit einen Absturz des Prozesses.
+
+Auswertung: python flight_recorder.py history/flight.bin -o flug.csv
+"""
+
+import argparse
+import csv
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MFR1'
+VERSION = 1
+
+# Dateikopf: Magic, Version, Anzahl Akkus, Datensatzgröße, Kapazität, nächste Sequenznummer
+_FILE_HEADER = struct.Struct('<4sHHIIQ')
+FILE_HEADER_SIZE = 64
+_NEXT_SEQ_OFFSET = _FILE_HEADER.size - 8
+
+# Zyklus: Sequenz, Zeit, Netz roh, Netz gefiltert, Modus, Gesamtleistung, Flags, Zyklusdauer (ms)
+_CYCLE = struct.Struct('<QdffBfBf')
+# Je Akku: ID, SoC, Modus, Leistung (Entladen positiv), Modbus-Ergebnis
+_BATTERY = struct.Struct('<BfBfB')
+
+FLAG_SUCCESS = 0x01
+FLAG_RATE_LIMITED = 0x02
+FLAG_WRITE_SUPPRESSED = 0x04
+FLAG_METER_OUTAGE = 0x08
+
+RESULT_NAMES = {0: 'none', 1: 'ok', 2: 'connect_failed', 3: 'modbus_error', 4: 'exception', 5: 'implausible'}
+
+
+def _float(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else round(value, 1)
+
+
+def record_size(battery_count: int) -> int:
+    return _CYCLE.size + battery_count * _BATTERY.size
+
+
+class FlightRecorder:
+    """Ringdatei mit den letzten capacity Regelzyklen"""
+
+    def __init__(self, path: str, battery_count: int, capacity: int = 86400, flush_interval_seconds: float = 60):
+        self.path = path
+        self.battery_count = battery_count
+        self.capacity = capacity
+        self.record_size = record_size(battery_count)
+        self.flush_interval = flush_interval_seconds
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+        self._file, self._map, self.next_seq = self._open()
+        logger.info(f"Flugschreiber: {path} ({capacity} Zyklen à {self.record_size} Bytes, "
+                    f"{self.next_seq} bisher geschrieben)")
+
+    def _open(self) -> Tuple[Any, mmap.mmap, int]:
+        size = FILE_HEADER_SIZE + self.capacity * self.record_size
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        next_seq = 0
+        header = read_header(self.path) if os.path.exists(self.path) else None
+        if header and (header['battery_count'], header['record_size'], header['capacity']) == \
+                (self.battery_count, self.record_size, self.capacity) and os.path.getsize(self.path) == size:
+            next_seq = header['next_seq']
+            f = open(self.path, 'r+b')
+        else:
+            if header:
+                logger.warning("Flugschreiber: Format geändert (Akkus/Kapazität) - Datei wird neu angelegt")
+            f = open(self.path, 'w+b')
+            f.truncate(size)
+
+        mapped = mmap.mmap(f.fileno(), size)
+        _FILE_HEADER.pack_into(mapped, 0, MAGIC, VERSION, self.battery_count, self.record_size, self.capacity, next_seq)
+        return f, mapped, next_seq
+
+    def record(self, timestamp: float, grid_raw: Optional[float], grid_filtered: Optional[float],
+               mode: int, power: float, flags: int, cycle_ms: float,
+               batteries: Sequence[Tuple[int, Optional[float], int, float, int]]):
+        """
+        Schreibt einen Zyklus
+        batteries: (ID, SoC, Modus, Leistung mit Vorzeichen, Modbus-Ergebnis) je Akku
+        """
+        buffer = bytearray(self.record_size)
+        _CYCLE.pack_into(buffer, 0, 0, timestamp, _float(grid_raw), _float(grid_filtered),
+                         mode, power, flags, cycle_ms)
+        for index, (akku_id, soc, akku_mode, akku_power, result) in enumerate(batteries[:self.battery_count]):
+            _BATTERY.pack_into(buffer, _CYCLE.size + index * _BATTERY.size,
+                               akku_id, _float(soc), akku_mode, akku_power, result)
+
+        with self._lock:
+            if self._map is None:
+                return
+            seq = self.next_seq
+            struct.pack_into('<Q', buffer, 0, seq)
+            offset = FILE_HEADER_SIZE + (seq % self.capacity) * self.record_size
+            self._map[offset:offset + self.record_size] = buffer
+            # Sequenz im Kopf erst nach dem Datensatz weiterzählen
+            self.next_seq = seq + 1
+            struct.pack_into('<Q', self._map, _NEXT_SEQ_OFFSET, self.next_seq)
+
+            # Gegen Stromausfall regelmäßig auf die Karte schreiben
+            if timestamp - self._last_flush >= self.flush_interval:
+                self._last_flush = timestamp
+                self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'capacity': self.capacity,
+            'record_size': self.record_size,
+            'recorded': min(self.next_seq, self.capacity),
+            'total_written': self.next_seq
+        }
+
+
+def read_header(path: str) -> Optional[Dict[str, Any]]:
+    """Dateikopf lesen (None bei fremder oder beschädigter Datei)"""
+    with open(path, 'rb') as f:
+        data = f.read(_FILE_HEADER.size)
+    if len(data) < _FILE_HEADER.size:
+        return None
+    magic, version, battery_count, size, capacity, next_seq = _FILE_HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION or size != record_size(battery_count) or capacity == 0:
+        return None
+    return {'battery_count': battery_count, 'record_size': size, 'capacity': capacity, 'next_seq': next_seq}
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Liefert alle gültigen Zyklen in zeitlicher Reihenfolge (auch während die Steuerung schreibt)"""
+    header = read_header(path)
+    if header is None:
+        raise ValueError(f"{path} ist keine Flugschreiber-Datei")
+    size, capacity, next_seq = header['record_size'], header['capacity'], header['next_seq']
+
+    with open(path, 'rb') as f:
+        for seq in range(max(0, next_seq - capacity), next_seq):
+            f.seek(FILE_HEADER_SIZE + (seq % capacity) * size)
+            data = f.read(size)
+            if len(data) < size:
+                break
+            stored_seq, timestamp, grid_raw, grid_filtered, mode, power, flags, cycle_ms = _CYCLE.unpack_from(data)
+            if stored_seq != seq:
+                continue  # Halb geschriebener oder bereits überschriebener Datensatz
+            batteries = []
+            for index in range(header['battery_count']):
+                akku_id, soc, akku_mode, akku_power, result = _BATTERY.unpack_from(data, _CYCLE.size + index * _BATTERY.size)
+                if akku_id:
+                    batteries.append({'id': akku_id, 'soc': _optional(soc), 'mode': akku_mode,
+                                      'power': round(akku_power, 1), 'result': RESULT_NAMES.get(result, str(result))})
+            yield {
+                'seq': seq,
+                'timestamp': timestamp,
+                'grid_raw': _optional(grid_raw),
+                'grid_filtered': _optional(grid_filtered),
+                'mode': mode,
+                'power': round(power, 1),
+                'success': bool(flags & FLAG_SUCCESS),
+                'rate_limited': bool(flags & FLAG_RATE_LIMITED),
+                'write_suppressed': bool(flags & FLAG_WRITE_SUPPRESSED),
+                'meter_outage': bool(flags & FLAG_METER_OUTAGE),
+                'cycle_ms': round(cycle_ms, 1),
+                'batteries': batteries
+            }
+
+
+def dump_csv(path: str, output, since: Optional[float] = None) -> int:
+    """Schreibt die Zyklen als CSV (eine Spalte je Akku-Wert), liefert die Anzahl Zeilen"""
+    writer = None
+    rows = 0
+    for record in read_records(path):
+        if since is not None and record['timestamp'] < since:
+            continue
+        if writer is None:
+            battery_columns: List[str] = []
+            for battery in record['batteries']:
+                battery_columns += [f"{key}_{battery['id']}" for key in ('soc', 'mode', 'power', 'result')]
+            writer = csv.writer(output)
+            writer.writerow(['seq', 'time', 'grid_raw_w', 'grid_filtered_w', 'mode', 'power_w', 'success',
+                             'rate_limited', 'write_suppressed', 'meter_outage', 'cycle_ms'] + battery_columns)
+        row = [record['seq'], datetime.fromtimestamp(record['timestamp']).isoformat(timespec='milliseconds'),
+               record['grid_raw'], record['grid_filtered'], record['mode'], record['power'],
+               int(record['success']), int(record['rate_limited']), int(record['write_suppressed']),
+               int(record['meter_outage']), record['cycle_ms']]
+        for battery in record['batteries']:
+            row += [battery['soc'], battery['mode'], battery['power'], battery['result']]
+        writer.writerow(row)
+        rows += 1
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flugschreiber-Datei als CSV ausgeben")
+    parser.add_argument('path', nargs='?', default='history/flight.bin', help="Ringdatei (Standard: history/flight.bin)")
+    parser.add_argument('-o', '--output', help="CSV-Datei (Standard: stdout)")
+    parser.add_argument('--minutes', type=float, help="Nur die letzten x Minuten")
+    args = parser.parse_args()
+
+    since = time.time() - args.minutes * 60 if args.minutes else None
+    try:
+        if args.output:
+            with open(args.output, 'w', newline='', encoding='utf-8') as output:
+                rows = dump_csv(args.path, output, since)
+            print(f"{rows} Zyklen nach {args.output} geschrieben", file=sys.stderr)
+        else:
+            dump_csv(args.path, sys.stdout, since)
+    except (OSError, ValueError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
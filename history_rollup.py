@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Verdichtungsstufen für den Verlauf der Marstek PV-Akku Steuerung
+Regelzyklen werden fortlaufend zu 1-Minuten-, 15-Minuten- und Stundenwerten
+(Minimum, Maximum, Mittelwert, Energie) zusammengefasst. Die feinste Stufe sind die
+Regelzyklen selbst (Rohdaten im Abstand von control.poll_interval_seconds) - eine
+eigene 1-Sekunden-Stufe gibt es nicht.
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import struct
+import threading
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+logger = logging.getLogger(__name__)
+
+# (Auflösung in Sekunden, Aufbewahrung in Buckets)
+TIERS = [
+    (60, 7 * 24 * 60),        # 1 Minute, 7 Tage
+    (900, 90 * 24 * 4),       # 15 Minuten, 90 Tage
+    (3600, 2 * 365 * 24)      # 1 Stunde, 2 Jahre
+]
+
+# Längere Lücken (Ausfall, Neustart) werden nicht als Energie integriert
+MAX_INTEGRATION_GAP = 30
+
+NAN = float('nan')
+
+
+def series_values(grid_power: Optional[float], mode: int, total_power: float,
+                  batteries: Iterable[Tuple[int, int, float, Optional[float]]]) -> Dict[str, Optional[float]]:
+    """
+    Messreihen eines Regelzyklus - Akkuleistung mit Vorzeichen (Entladen positiv, Laden negativ)
+    grid, battery, soc (Mittel), power_<id>, soc_<id>
+    """
+    sign = {1: -1, 2: 1}
+    values = {
+        'grid': grid_power,
+        'battery': sign.get(mode, 0) * total_power
+    }
+    socs = []
+    for akku_id, akku_mode, power, soc in batteries:
+        values[f'power_{akku_id}'] = sign.get(akku_mode, 0) * power
+        values[f'soc_{akku_id}'] = soc
+        if soc is not None:
+            socs.append(soc)
+    values['soc'] = sum(socs) / len(socs) if socs else None
+    return values
+
+
+def default_series(akku_ids: Iterable[int]) -> List[str]:
+    """Alle Messreihen für die konfigurierten Akkus"""
+    series = ['grid', 'battery', 'soc']
+    for akku_id in akku_ids:
+        series += [f'power_{akku_id}', f'soc_{akku_id}']
+    return series
+
+
+def is_power_series(name: str) -> bool:
+    """Energie-Integral nur für Leistungsreihen sinnvoll"""
+    return not name.startswith('soc')
+
+
+def lttb(points: List[Tuple[float, float]], threshold: int) -> List[Tuple[float, float]]:
+    """Largest-Triangle-Three-Buckets: reduziert auf 'threshold' Punkte, Spitzen bleiben erhalten"""
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (count - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Mittelwert des nächsten Buckets als dritter Dreieckspunkt
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, count)
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+class Aggregate:
+    """Kennzahlen einer Messreihe in einem Bucket"""
+
+    __slots__ = ('min', 'max', 'total', 'count', 'energy_wh')
+
+    def __init__(self, min_value: float = math.inf, max_value: float = -math.inf,
+                 total: float = 0.0, count: int = 0, energy_wh: float = 0.0):
+        self.min = min_value
+        self.max = max_value
+        self.total = total
+        self.count = count
+        self.energy_wh = energy_wh
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def add(self, value: float, energy_wh: float = 0.0):
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.total += value
+        self.count += 1
+        self.energy_wh += energy_wh
+
+    def merge(self, other: 'Aggregate'):
+        if not other.count:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.total += other.total
+        self.count += other.count
+        self.energy_wh += other.energy_wh
+
+
+class RollupTier:
+    """Eine Verdichtungsstufe: offener Bucket plus abgeschlossene Buckets im Speicher und auf Platte"""
+
+    def __init__(self, resolution: int, retention: int, series: List[str], path: Optional[str] = None):
+        self.resolution = resolution
+        self.retention = retention
+        self.series = series
+        self.path = path
+
+        # Je Messreihe: Minimum, Maximum, Mittelwert, Energie (Wh), Anzahl
+        self._record = struct.Struct('<d' + 'fffff' * len(series))
+        # Listen statt deque: bisect braucht Indexzugriff in O(1). Gekürzt wird blockweise,
+        # es können also bis zu _trim_chunk Buckets mehr als retention vorhanden sein.
+        self.buckets: List[Tuple[int, Dict[str, Aggregate]]] = []   # (Start, {Reihe: Aggregate})
+        self._starts: List[int] = []                                # Startzeiten für bisect
+        self._trim_chunk = max(1, retention // 8)
+        self._pending = bytearray()
+
+        self.current_start: Optional[int] = None
+        self.current: Dict[str, Aggregate] = {}
+
+    def bucket_start(self, timestamp: float) -> int:
+        return int(timestamp // self.resolution) * self.resolution
+
+    def add(self, timestamp: float, aggregates: Dict[str, Aggregate]) -> Optional[Tuple[int, Dict[str, Aggregate]]]:
+        """Fügt Werte hinzu - gibt den abgeschlossenen Bucket zurück, wenn ein neuer beginnt"""
+        start = self.bucket_start(timestamp)
+        completed = None
+        if self.current_start is not None and start != self.current_start:
+            completed = self._close()
+        if self.current_start is None:
+            self.current_start = start
+
+        for name, aggregate in aggregates.items():
+            self.current.setdefault(name, Aggregate()).merge(aggregate)
+        return completed
+
+    def _close(self) -> Tuple[int, Dict[str, Aggregate]]:
+        bucket = (self.current_start, self.current)
+        self._store(bucket)
+        self._pending += self._encode(bucket)
+        self.current_start = None
+        self.current = {}
+        return bucket
+
+    def _store(self, bucket: Tuple[int, Dict[str, Aggregate]]):
+        self.buckets.append(bucket)
+        self._starts.append(bucket[0])
+        excess = len(self.buckets) - self.retention
+        if excess >= self._trim_chunk:
+            del self.buckets[:excess]
+            del self._starts[:excess]
+
+    def _encode(self, bucket: Tuple[int, Dict[str, Aggregate]]) -> bytes:
+        start, aggregates = bucket
+        fields = [float(start)]
+        for name in self.series:
+            aggregate = aggregates.get(name)
+            if aggregate is None or not aggregate.count:
+                fields.extend((NAN, NAN, NAN, NAN, 0.0))
+            else:
+                fields.extend((aggregate.min, aggregate.max, aggregate.mean, aggregate.energy_wh, aggregate.count))
+        return self._record.pack(*fields)
+
+    def _decode(self, data: bytes, offset: int) -> Tuple[int, Dict[str, Aggregate]]:
+        fields = self._record.unpack_from(data, offset)
+        aggregates = {}
+        for i, name in enumerate(self.series):
+            min_value, max_value, mean, energy, count = fields[1 + i * 5:6 + i * 5]
+            if count > 0 and not math.isnan(mean):
+                aggregates[name] = Aggregate(min_value, max_value, mean * count, int(count), energy)
+        return int(fields[0]), aggregates
+
+    def load(self):
+        """Lädt gespeicherte Buckets - bei geänderten Messreihen wird neu begonnen"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            header = f.readline()
+            data = f.read()
+        try:
+            if json.loads(header)['series'] != self.series:
+                raise ValueError("Messreihen geändert")
+        except (ValueError, KeyError):
+            os.replace(self.path, self.path + '.old')
+            logger.warning(f"Verdichtungsstufe {self.resolution}s neu angelegt (Format/Messreihen geändert)")
+            return
+
+        size = self._record.size
+        complete = len(data) - len(data) % size
+        for offset in range(max(0, complete - self.retention * size), complete, size):
+            self._store(self._decode(data, offset))
+
+    def take_pending(self) -> bytes:
+        """Übernimmt die noch nicht geschriebenen Buckets (unter der Sperre des RollupStore aufrufen)"""
+        pending = bytes(self._pending)
+        self._pending = bytearray()
+        return pending
+
+    def write(self, pending: bytes):
+        """Hängt Buckets an die Datei an, begrenzt die Datei auf die doppelte Aufbewahrung (ohne Sperre)"""
+        if not self.path or not pending:
+            return
+        try:
+            exists = os.path.exists(self.path)
+            if exists and os.path.getsize(self.path) > 2 * self.retention * self._record.size:
+                self._rewrite(pending)
+            else:
+                with open(self.path, 'ab') as f:
+                    if not exists:
+                        f.write(self._header())
+                    f.write(pending)
+        except OSError as e:
+            logger.error(f"Verdichtungsstufe {self.resolution}s konnte nicht geschrieben werden: {e}")
+
+    def _header(self) -> bytes:
+        return json.dumps({'resolution': self.resolution, 'series': self.series}).encode('utf-8') + b'\n'
+
+    def _rewrite(self, pending: bytes):
+        """Schreibt nur die aufbewahrten Buckets aus Datei und Puffer neu (atomar über temporäre Datei)"""
+        with open(self.path, 'rb') as f:
+            f.readline()
+            data = f.read()
+        size = self._record.size
+        data = data[:len(data) - len(data) % size] + pending
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header())
+            f.write(data[-self.retention * size:])
+        os.replace(tmp_path, self.path)
+
+    def range(self, start: float, end: float) -> List[Tuple[int, Dict[str, Aggregate]]]:
+        """Abgeschlossene Buckets im Bereich plus ggf. den offenen Bucket"""
+        first = bisect.bisect_left(self._starts, self.bucket_start(start))
+        last = bisect.bisect_right(self._starts, end)
+        result = self.buckets[first:last]
+        if self.current_start is not None and start <= self.current_start + self.resolution and self.current_start <= end:
+            result.append((self.current_start, self.current))
+        return result
+
+
+class RollupStore:
+    """Verdichtet Regelzyklen fortlaufend: Rohwerte (Regelzyklus) -> 1 min -> 15 min -> 1 h"""
+
+    RESAMPLE_FACTOR = 4  # Stufenwahl: bis zu 4x mehr Buckets als angefragte Punkte, dann LTTB
+
+    def __init__(self, series: List[str], directory: Optional[str] = None, tiers: List[Tuple[int, int]] = TIERS,
+                 raw_resolution: float = 2):
+        self.series = series
+        self.raw_resolution = raw_resolution  # Abstand der Rohdaten (Regelzyklus)
+        self.tiers = [
+            RollupTier(resolution, retention, series,
+                       os.path.join(directory, f"rollup_{resolution}.bin") if directory else None)
+            for resolution, retention in tiers
+        ]
+        self._last_sample: Dict[str, Tuple[float, float]] = {}  # Reihe -> (Zeit, Wert)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Reihenfolge der Dateizugriffe bei parallelem flush()
+
+        for tier in self.tiers:
+            tier.load()
+        self._catch_up()
+
+    def _catch_up(self):
+        """
+        Baut die offenen Buckets gröberer Stufen aus den gespeicherten feineren Buckets wieder auf
+        (und ergänzt nach einem Absturz fehlende) - Stufe für Stufe, ohne Weiterreichen
+        """
+        for lower, higher in zip(self.tiers, self.tiers[1:]):
+            last = higher.buckets[-1][0] + higher.resolution if higher.buckets else 0
+            for start, aggregates in list(lower.buckets):
+                if start >= last:
+                    higher.add(start, aggregates)
+
+    def _cascade(self, tier: RollupTier, timestamp: float, aggregates: Dict[str, Aggregate]):
+        """Gibt Werte an eine Stufe und abgeschlossene Buckets an die nächstgröbere weiter"""
+        completed = tier.add(timestamp, aggregates)
+        index = self.tiers.index(tier)
+        if completed and index + 1 < len(self.tiers):
+            self._cascade(self.tiers[index + 1], completed[0], completed[1])
+
+    def add_sample(self, timestamp: float, values: Dict[str, Optional[float]]):
+        """Nimmt einen Regelzyklus auf (Werte None werden ignoriert)"""
+        aggregates = {}
+        for name, value in values.items():
+            if value is None or name not in self.series:
+                continue
+            energy = 0.0
+            previous = self._last_sample.get(name)
+            if previous and is_power_series(name):
+                gap = timestamp - previous[0]
+                if 0 < gap <= MAX_INTEGRATION_GAP:
+                    # Trapezregel zwischen zwei Zyklen
+                    energy = (previous[1] + value) / 2 * gap / 3600
+            self._last_sample[name] = (timestamp, value)
+            aggregate = Aggregate()
+            aggregate.add(value, energy)
+            aggregates[name] = aggregate
+
+        with self._lock:
+            self._cascade(self.tiers[0], timestamp, aggregates)
+
+    def flush(self):
+        """Schreibt abgeschlossene Buckets - die Dateizugriffe laufen außerhalb der Sperre von add_sample"""
+        with self._lock:
+            pending = [(tier, tier.take_pending()) for tier in self.tiers]
+        with self._write_lock:
+            for tier, data in pending:
+                tier.write(data)
+
+    def select_tier(self, start: float, end: float, points: int) -> Optional[RollupTier]:
+        """
+        Stufe für einen Zeitraum: kurze Zeiträume aus Rohdaten (None), sonst die feinste Stufe
+        mit höchstens RESAMPLE_FACTOR * points Buckets (wird danach per LTTB auf 'points' reduziert)
+        """
+        span = max(end - start, 1)
+        if span / self.raw_resolution <= points * self.RESAMPLE_FACTOR:
+            return None
+        for tier in self.tiers:
+            if span / tier.resolution <= points * self.RESAMPLE_FACTOR:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, tier: RollupTier, series: List[str], start: float, end: float) -> Dict[str, Dict[str, Any]]:
+        """Buckets einer Stufe als [Zeit, Mittel, Min, Max] je Messreihe plus Energiesumme"""
+        with self._lock:
+            buckets = tier.range(start, end)
+            result = {}
+            for name in series:
+                rows = []
+                energy = 0.0
+                for bucket_start, aggregates in buckets:
+                    aggregate = aggregates.get(name)
+                    if aggregate is None or not aggregate.count:
+                        continue
+                    rows.append([bucket_start, round(aggregate.mean, 1), round(aggregate.min, 1), round(aggregate.max, 1)])
+                    energy += aggregate.energy_wh
+                result[name] = {'points': rows, 'energy_wh': round(energy, 1) if is_power_series(name) else None}
+            return result
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'series': self.series,
+            'raw_resolution': self.raw_resolution,
+            'tiers': {tier.resolution: len(tier.buckets) for tier in self.tiers}
+        }
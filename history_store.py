@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Verlaufsspeicher für Marstek PV-Akku Steuerung
+Jeder Regelzyklus wird als kompakter Binärdatensatz an stündliche Segmentdateien
+angehängt - begrenzter Plattenplatz, schnelle Zeitbereichsabfragen
+"""
+
+import itertools
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from history_rollup import RollupStore, series_values, is_power_series, lttb, MAX_INTEGRATION_GAP
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b'MHS1'
+SEGMENT_SUFFIX = '.seg'
+
+# Datensatz: Länge (uint32) + Kopf + Akkus + Begründung, Little Endian
+_LENGTH = struct.Struct('<I')
+_HEADER = struct.Struct('<dfBfB')       # Zeit, Netz W, Modus, Gesamtleistung W, Anzahl Akkus
+_BATTERY = struct.Struct('<BBff')       # ID, Modus, Leistung W, SoC %
+_REASON_LENGTH = struct.Struct('<H')
+
+NAN = float('nan')
+
+
+def _pack_float(value: Optional[float]) -> float:
+    return NAN if value is None else float(value)
+
+
+def _unpack_float(value: float) -> Optional[float]:
+    return None if math.isnan(value) else round(value, 2)
+
+
+def encode_record(timestamp: float, grid_power: Optional[float], mode: int, total_power: float,
+                  batteries: List[Tuple[int, int, float, Optional[float]]], reasoning: str = '') -> bytes:
+    """Kodiert einen Regelzyklus als längenpräfixierten Binärdatensatz"""
+    reason = reasoning.encode('utf-8')[:0xFFFF]
+    body = bytearray(_HEADER.pack(timestamp, _pack_float(grid_power), mode, total_power, len(batteries)))
+    for akku_id, akku_mode, power, soc in batteries:
+        body += _BATTERY.pack(akku_id, akku_mode, power, _pack_float(soc))
+    body += _REASON_LENGTH.pack(len(reason)) + reason
+    return _LENGTH.pack(len(body)) + bytes(body)
+
+
+def decode_record(body: bytes) -> Dict[str, Any]:
+    """Dekodiert einen Datensatz (ohne Längenpräfix)"""
+    timestamp, grid, mode, total_power, count = _HEADER.unpack_from(body, 0)
+    offset = _HEADER.size
+    batteries = {}
+    for _ in range(count):
+        akku_id, akku_mode, power, soc = _BATTERY.unpack_from(body, offset)
+        batteries[akku_id] = {'mode': akku_mode, 'power': round(power, 1), 'soc': _unpack_float(soc)}
+        offset += _BATTERY.size
+    (reason_length,) = _REASON_LENGTH.unpack_from(body, offset)
+    offset += _REASON_LENGTH.size
+    return {
+        'timestamp': timestamp,
+        'grid_power': _unpack_float(grid),
+        'mode': mode,
+        'power': round(total_power, 1),
+        'batteries': batteries,
+        'reasoning': body[offset:offset + reason_length].decode('utf-8', errors='replace')
+    }
+
+
+def read_timestamp(body: bytes) -> float:
+    """Liest nur den Zeitstempel - für schnelles Überspringen außerhalb des Bereichs"""
+    return struct.unpack_from('<d', body, 0)[0]
+
+
+class HistoryQueries(ABC):
+    """
+    Gemeinsame Abfragen der Verlaufsspeicher (Segmente, SQLite)
+    Unterklassen liefern read_range() und setzen das Attribut rollups
+    """
+
+    rollups: Optional[RollupStore] = None
+
+    @abstractmethod
+    def read_range(self, start: float, end: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Regelzyklen im Zeitbereich [start, end] (aufsteigend)"""
+
+    def append_meter_sample(self, timestamp: float, power: Optional[float]):
+        """Einzelner Zählerwert (1 s) - nur von Speichern mit eigener Tabelle dafür gespeichert"""
+
+    def append_event(self, timestamp: float, level: str, message: str):
+        """Log-Ereignis - nur von Speichern mit eigener Tabelle dafür gespeichert"""
+
+    def query(self, series: List[str], start: float, end: float, points: int = 500) -> Dict[str, Any]:
+        """
+        Verlauf für Diagramme: wählt die passende Verdichtungsstufe, sodass höchstens 'points'
+        Punkte je Messreihe geliefert werden (Rohdaten werden per LTTB reduziert)
+        Punkte: [Zeit, Mittel, Min, Max]
+        """
+        tier = self.rollups.select_tier(start, end, points) if self.rollups else None
+        if tier is not None:
+            result = self.rollups.query(tier, series, start, end)
+            resolution = tier.resolution
+        else:
+            result = self._query_raw(series, start, end, points)
+            resolution = self.rollups.raw_resolution if self.rollups else 0
+
+        # Auch die gröbste Stufe kann bei sehr langen Zeiträumen zu viele Punkte haben
+        for data in result.values():
+            if len(data['points']) > points:
+                keep = {row[0] for row in lttb([(row[0], row[1]) for row in data['points']], points)}
+                data['points'] = [row for row in data['points'] if row[0] in keep]
+
+        return {'from': start, 'to': end, 'resolution': resolution, 'series': result}
+
+    def _query_raw(self, series: List[str], start: float, end: float, points: int) -> Dict[str, Dict[str, Any]]:
+        """Rohdaten je Messreihe inkl. Energie-Integral, per LTTB auf 'points' reduziert"""
+        samples: Dict[str, List[Tuple[float, float]]] = {name: [] for name in series}
+        for record in self.read_range(start, end):
+            batteries = [(akku_id, b['mode'], b['power'], b['soc']) for akku_id, b in record['batteries'].items()]
+            values = series_values(record['grid_power'], record['mode'], record['power'], batteries)
+            for name in series:
+                value = values.get(name)
+                if value is not None:
+                    samples[name].append((record['timestamp'], value))
+
+        result = {}
+        for name, values in samples.items():
+            energy = None
+            if is_power_series(name):
+                energy = 0.0
+                for (t0, v0), (t1, v1) in zip(values, values[1:]):
+                    if t1 - t0 <= MAX_INTEGRATION_GAP:
+                        energy += (v0 + v1) / 2 * (t1 - t0) / 3600
+                energy = round(energy, 1)
+            result[name] = {
+                'points': [[round(t, 1), round(v, 1), round(v, 1), round(v, 1)] for t, v in lttb(values, points)],
+                'energy_wh': energy
+            }
+        return result
+
+
+class HistoryStore(HistoryQueries):
+    """Anhängender Segmentspeicher für Regelzyklen"""
+
+    def __init__(self, directory: str = 'history', max_disk_mb: float = 200, segment_seconds: int = 3600,
+                 flush_interval_seconds: float = 10, max_reasoning_chars: int = 200,
+                 rollups: Optional[RollupStore] = None):
+        self.directory = directory
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self.segment_seconds = segment_seconds
+        self.flush_interval = flush_interval_seconds
+        self.max_reasoning_chars = max_reasoning_chars
+        self.rollups = rollups  # Verdichtungsstufen für lange Zeiträume (optional)
+
+        self._buffer = bytearray()
+        self._buffer_segment: Optional[int] = None  # Segment-Start der gepufferten Datensätze
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+        self.records_written = 0
+        self.segments_deleted = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._repair_latest_segment()
+        logger.info(f"Verlaufsspeicher: {self.directory} (max. {max_disk_mb} MB, Segmente à {segment_seconds}s)")
+
+    def _segment_start(self, timestamp: float) -> int:
+        return int(timestamp // self.segment_seconds) * self.segment_seconds
+
+    def _segment_path(self, segment_start: int) -> str:
+        return os.path.join(self.directory, f"{segment_start}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self) -> List[int]:
+        """Gibt alle Segment-Startzeiten aufsteigend zurück"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(name[:-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def append(self, timestamp: float, grid_power: Optional[float], mode: int, total_power: float,
+               batteries: List[Tuple[int, int, float, Optional[float]]], reasoning: str = ''):
+        """Puffert einen Regelzyklus - geschrieben wird gesammelt alle flush_interval Sekunden"""
+        record = encode_record(timestamp, grid_power, mode, total_power, batteries,
+                               reasoning[:self.max_reasoning_chars])
+        segment = self._segment_start(timestamp)
+
+        with self._lock:
+            # Segmentwechsel: Puffer des alten Segments zuerst schreiben
+            if self._buffer_segment is not None and segment != self._buffer_segment:
+                self._flush_locked()
+            self._buffer_segment = segment
+            self._buffer += record
+            self.records_written += 1
+
+            flush_due = time.time() - self._last_flush >= self.flush_interval
+            if flush_due:
+                self._flush_locked()
+
+        if self.rollups:
+            self.rollups.add_sample(timestamp, series_values(grid_power, mode, total_power, batteries))
+            if flush_due:
+                self.rollups.flush()
+
+    def flush(self):
+        """Schreibt gepufferte Datensätze sofort"""
+        with self._lock:
+            self._flush_locked()
+        if self.rollups:
+            self.rollups.flush()
+
+    def _flush_locked(self):
+        self._last_flush = time.time()
+        if not self._buffer:
+            return
+
+        path = self._segment_path(self._buffer_segment)
+        try:
+            is_new = not os.path.exists(path)
+            with open(path, 'ab') as f:
+                if is_new:
+                    f.write(SEGMENT_MAGIC)
+                f.write(self._buffer)
+            if is_new:
+                self._enforce_disk_limit()
+        except OSError as e:
+            logger.error(f"Verlauf konnte nicht geschrieben werden ({path}): {e}")
+        finally:
+            # Bei Schreibfehlern verwerfen statt unbegrenzt zu puffern
+            self._buffer = bytearray()
+
+    def _enforce_disk_limit(self):
+        """Löscht die ältesten Segmente, bis der Plattenplatz wieder im Rahmen ist"""
+        segments = self._list_segments()
+        sizes = {s: os.path.getsize(self._segment_path(s)) for s in segments}
+        total = sum(sizes.values())
+
+        # Das aktuelle Segment wird nie gelöscht
+        for segment in segments[:-1]:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(self._segment_path(segment))
+                total -= sizes[segment]
+                self.segments_deleted += 1
+                logger.info(f"Verlaufssegment gelöscht (Speicherlimit): {segment}")
+            except OSError as e:
+                logger.warning(f"Verlaufssegment {segment} konnte nicht gelöscht werden: {e}")
+
+    def _repair_latest_segment(self):
+        """Kürzt einen unvollständigen letzten Datensatz (z.B. nach Stromausfall)"""
+        segments = self._list_segments()
+        if not segments:
+            return
+
+        path = self._segment_path(segments[-1])
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        valid_end = len(SEGMENT_MAGIC) if data.startswith(SEGMENT_MAGIC) else 0
+        for _, end in self._scan(data):
+            valid_end = end
+
+        if valid_end < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(valid_end)
+            logger.warning(f"Verlaufssegment {segments[-1]}: {len(data) - valid_end} Bytes unvollständiger Daten entfernt")
+
+    @staticmethod
+    def _scan(data: bytes) -> Iterator[Tuple[bytes, int]]:
+        """Liefert (Datensatz, Endposition) für alle vollständigen Datensätze eines Segments"""
+        if not data.startswith(SEGMENT_MAGIC):
+            return
+        offset = len(SEGMENT_MAGIC)
+        while offset + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            start = offset + _LENGTH.size
+            end = start + length
+            if end > len(data) or length < _HEADER.size + _REASON_LENGTH.size:
+                return
+            yield data[start:end], end
+            offset = end
+
+    def read_range(self, start: float, end: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Gibt alle Regelzyklen im Zeitbereich [start, end] zurück (aufsteigend)
+        Noch gepufferte Datensätze werden aus dem Speicher gelesen - Abfragen schreiben nie auf die Platte
+        """
+        with self._lock:
+            pending = SEGMENT_MAGIC + bytes(self._buffer)
+
+        records: List[Dict[str, Any]] = []
+        last_timestamp = -math.inf
+        for data in itertools.chain(self._read_segments(start, end), [pending]):
+            # Puffer ohne Datensätze, die inzwischen bereits auf die Platte geschrieben wurden
+            already_read = last_timestamp
+            for body, _ in self._scan(data):
+                timestamp = read_timestamp(body)
+                last_timestamp = max(last_timestamp, timestamp)
+                if timestamp < start or timestamp <= already_read:
+                    continue
+                if timestamp > end:
+                    break
+                records.append(decode_record(body))
+                if limit is not None and len(records) >= limit:
+                    return records
+        return records
+
+    def _read_segments(self, start: float, end: float) -> Iterator[bytes]:
+        """Inhalt aller Segmente, die den Bereich überlappen (aufsteigend)"""
+        first_segment = self._segment_start(start)
+        for segment in self._list_segments():
+            if segment < first_segment or segment > end:
+                continue
+            try:
+                with open(self._segment_path(segment), 'rb') as f:
+                    yield f.read()
+            except OSError:
+                continue  # Zwischenzeitlich gelöscht
+
+    def close(self):
+        """Schreibt verbleibende Daten (Aufruf beim Shutdown)"""
+        self.flush()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Speicherbelegung und Zähler zurück"""
+        segments = self._list_segments()
+        disk_bytes = sum(os.path.getsize(self._segment_path(s)) for s in segments)
+        return {
+            'directory': self.directory,
+            'segments': len(segments),
+            'oldest': segments[0] if segments else None,
+            'disk_mb': round(disk_bytes / 1024 / 1024, 2),
+            'max_disk_mb': round(self.max_disk_bytes / 1024 / 1024, 2),
+            'records_written': self.records_written,
+            'buffered_bytes': len(self._buffer),
+            'segments_deleted': self.segments_deleted,
+            'rollups': self.rollups.get_status() if self.rollups else None
+        }
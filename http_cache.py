@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+HTTP-Caching für das Web-Interface der Marstek PV-Akku Steuerung
+Inhalts-ETags und bedingte GET-Anfragen (If-None-Match -> 304 ohne Body)
+"""
+
+import hashlib
+from flask import Response, request
+
+
+def content_etag(payload: bytes) -> str:
+    """Berechnet einen ETag aus dem Inhalt (ohne Anführungszeichen)"""
+    return hashlib.blake2b(payload, digest_size=12).hexdigest()
+
+
+def conditional_response(payload: bytes, etag: str, mimetype: str = 'application/json') -> Response:
+    """
+    Antwort mit schwachem ETag - stimmt If-None-Match überein, wird 304 ohne Body gesendet
+    no-cache: Browser dürfen speichern, müssen aber bei jedem Abruf revalidieren
+    """
+    response = Response(payload, mimetype=mimetype)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Log-Ringpuffer für das Web-Interface der Marstek PV-Akku Steuerung
+Feste Kapazität, fortlaufende Sequenznummern und Thread-Sicherheit zwischen
+Regelschleife (schreibt) und Web-Threads (lesen)
+"""
+
+import threading
+from collections import deque
+from itertools import islice
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+
+class LogRingBuffer:
+    """Ringpuffer für Log-Einträge mit Cursor-Abfrage über Sequenznummern"""
+
+    def __init__(self, capacity: int = 500):
+        if capacity < 1:
+            raise ValueError(f"Ungültige Log-Puffergröße: {capacity}")
+
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+
+    def append(self, level: str, message: str) -> Dict[str, Any]:
+        """Fügt Eintrag hinzu und gibt ihn mit Sequenznummer zurück"""
+        with self._lock:
+            self._last_seq += 1
+            entry = {
+                'seq': self._last_seq,
+                'timestamp': datetime.now().strftime('%H:%M:%S'),
+                'level': level,
+                'message': message
+            }
+            self._entries.append(entry)
+        return entry
+
+    def since(self, seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Gibt alle Einträge nach 'seq' zurück
+        Returns: (Einträge, truncated) - truncated=True, wenn Einträge bereits überschrieben wurden
+        """
+        with self._lock:
+            if seq > self._last_seq:
+                # Cursor aus einer früheren Laufzeit (Neustart) - alles neu liefern
+                return list(self._entries), True
+            if seq == self._last_seq:
+                return [], False
+            oldest_seq = self._entries[0]['seq'] if self._entries else self._last_seq + 1
+            truncated = seq < oldest_seq - 1
+            # Einträge sind nach seq sortiert - nur das neue Ende kopieren
+            return self._newest(self._last_seq - seq), truncated
+
+    def tail(self, count: int) -> List[Dict[str, Any]]:
+        """Gibt die letzten 'count' Einträge zurück"""
+        with self._lock:
+            return self._newest(count)
+
+    def tail_with_cursor(self, count: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Gibt die letzten 'count' Einträge und die dazu passende letzte Sequenznummer zurück"""
+        with self._lock:
+            return self._newest(count), self._last_seq
+
+    def _newest(self, count: int) -> List[Dict[str, Any]]:
+        """Kopiert die neuesten 'count' Einträge (Lock muss gehalten werden)"""
+        if count <= 0:
+            return []
+        entries = list(islice(reversed(self._entries), count))
+        entries.reverse()
+        return entries
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Gibt alle gepufferten Einträge zurück"""
+        with self._lock:
+            return list(self._entries)
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -4,6 +4,7 @@ Marstek PV-Akku Steuerung - Hauptanwendung v3.4
 Schlanke, robuste Implementierung mit Web-Integration für Regelungslogs
 """
 
+import os
 import sys
 import time
 import logging
@@ -18,6 +19,12 @@ from shelly_client import ShellyClient
 from ecotracker_client import EcoTrackerClient
 from battery_client import BatteryManager
 from zero_feed_control import ZeroFeedController
+from telemetry_scheduler import SocPollScheduler
+from history_store import HistoryStore
+from history_rollup import RollupStore, default_series
+from sqlite_store import SqliteHistoryStore
+from energy_accounting import EnergyAccountant
+from flight_recorder import FlightRecorder, FLAG_SUCCESS, FLAG_RATE_LIMITED, FLAG_WRITE_SUPPRESSED, FLAG_METER_OUTAGE
 from web_server import SimpleWebServer
 
 # Logging-Setup
@@ -76,6 +83,11 @@ class MartekSystem:
         self.energy_meter = None  # Kann Shelly oder EcoTracker sein
         self.batteries = None
         self.controller = None
+        self.soc_scheduler = None
+        self.history = None
+        self.energy = None
+        self.flight_recorder = None
+        self.last_flight_record = 0.0
         self.web_server = None
         self.web_thread = None
         
@@ -137,10 +149,55 @@ class MartekSystem:
                 ip=battery_config['ip'],
                 port=battery_config['port'],
                 akku_ids=battery_config['akku_ids'],
-                timeout=battery_config.get('timeout_seconds', 3)
+                timeout=battery_config.get('timeout_seconds', 3),
+                allocation_config=battery_config
             )
             self.logger.info("✓ Battery-Manager erstellt")
             
+            # SoC-Abfrageplaner (adaptiv oder festes Intervall, immer gestaffelt)
+            control_config = self.config.get_control_config()
+            soc_interval = control_config.get('soc_update_interval_seconds', 30)
+            adaptive = control_config.get('adaptive_soc_polling', True)
+            self.soc_scheduler = SocPollScheduler(
+                akku_ids=battery_config['akku_ids'],
+                min_interval=control_config.get('soc_poll_min_seconds', 10) if adaptive else soc_interval,
+                max_interval=control_config.get('soc_poll_max_seconds', 120) if adaptive else soc_interval,
+                max_power=battery_config['max_power_per_battery'],
+                min_soc=battery_config['min_soc_for_discharge'],
+                max_soc=battery_config['max_soc_for_charge'],
+                near_limit_margin=control_config.get('soc_poll_near_limit_percent', 5),
+                min_spacing=control_config.get('soc_poll_spacing_seconds', 3)
+            )
+            
+            # Verlaufsspeicher für Regelzyklen (optional)
+            history_config = self.config.get_history_config()
+            if history_config.get('enabled', True):
+                self.history = self._create_history_store(history_config, battery_config['akku_ids'])
+                self.logger.info("✓ Verlaufsspeicher bereit")
+            
+            # Energiebilanz (Netz, Akkus, Kennzahlen)
+            energy_config = self.config.get_energy_config()
+            if energy_config.get('enabled', True):
+                self.energy = EnergyAccountant(
+                    path=energy_config.get('file', 'history/energy.json'),
+                    persist_interval_seconds=energy_config.get('persist_interval_seconds', 300),
+                    days_kept=energy_config.get('days_kept', 31)
+                )
+                self.logger.info("✓ Energiebilanz bereit")
+            
+            # Flugschreiber: jeder Regelzyklus als Binärdatensatz in einer Ringdatei
+            flight_config = self.config.get_flight_recorder_config()
+            if flight_config.get('enabled', True):
+                try:
+                    self.flight_recorder = FlightRecorder(
+                        path=flight_config.get('file', 'history/flight.bin'),
+                        battery_count=len(battery_config['akku_ids']),
+                        capacity=flight_config.get('capacity_cycles', 86400),
+                        flush_interval_seconds=flight_config.get('flush_interval_seconds', 60)
+                    )
+                except OSError as e:
+                    self.logger.warning(f"Flugschreiber nicht verfügbar: {e}")
+            
             # 4. Web-Server ZUERST erstellen (ohne Controller)
             self.web_server = SimpleWebServer(
                 shelly_client=self.energy_meter,  # Funktioniert für beide Meter-Typen
@@ -158,8 +215,11 @@ class MartekSystem:
                 web_server=self.web_server  # NEU: Web-Server übergeben
             )
             
-            # 6. Controller im Web-Server setzen
+            # 6. Controller und Verlauf im Web-Server setzen
             self.web_server.controller = self.controller
+            self.web_server.history = self.history
+            self.web_server.energy = self.energy
+            self.web_server.soc_scheduler = self.soc_scheduler
             self.logger.info("✓ Zero-Feed-Controller erstellt und verknüpft")
             
             self.logger.info("=== System erfolgreich initialisiert ===")
@@ -179,6 +239,7 @@ class MartekSystem:
             self.web_thread = threading.Thread(
                 target=self.web_server.run,
                 kwargs={'host': host, 'port': port, 'debug': False},
+                name='web-server',
                 daemon=True
             )
             self.web_thread.start()
@@ -201,6 +262,7 @@ class MartekSystem:
     def run_main_loop(self):
         """Hauptsteuerungsschleife"""
         self.logger.info("🎯 Starte Hauptsteuerungsschleife")
+        threading.current_thread().name = 'control-loop'  # Erkennbar in /api/debug/profile
         
         control_config = self.config.get_control_config()
         control_interval = control_config.get('poll_interval_seconds', 2)  # Steuerung alle 2s
@@ -208,15 +270,17 @@ class MartekSystem:
         soc_interval = control_config.get('soc_update_interval_seconds', 30)
         meter_type = self.config.get_energy_meter_type()
         
-        self.logger.info(f"Optimierte Intervalle: {meter_type}-Poll={meter_poll_interval}s, Steuerung={control_interval}s, SoC={soc_interval}s")
+        self.logger.info(f"Optimierte Intervalle: {meter_type}-Poll={meter_poll_interval}s, Steuerung={control_interval}s, "
+                         f"SoC={self.soc_scheduler.min_interval}-{self.soc_scheduler.max_interval}s (adaptiv, gestaffelt)")
         self.logger.info(f"Durchschnittsbildung: Letzten 3 {meter_type}-Abrufe für Regelung verwenden")
         
         last_control = 0
-        last_soc_update = 0
+        last_soc_log = time.time()  # Erste Meldung nach den ersten Lesungen
         last_meter_poll = 0
         iteration = 0
         
         self.running = True
+        self.web_server.publish_status()
         
         while self.running:
             try:
@@ -226,6 +290,10 @@ class MartekSystem:
                 # 1. Energy Meter alle 1s abrufen für Durchschnittsbildung
                 if current_time - last_meter_poll >= meter_poll_interval:
                     current_power = self.energy_meter.poll_current_power()
+                    if self.history:
+                        self.history.append_meter_sample(current_time, current_power)
+                    if self.energy:
+                        self.energy.update_grid(current_time, current_power, self.energy_meter.get_energy_counters())
                     if current_power is not None:
                         # Erfolgreicher Abruf - Fehlerzähler zurücksetzen
                         if self.meter_failure_count > 0:
@@ -244,8 +312,11 @@ class MartekSystem:
                 
                 # 2. Steuerungszyklus alle 2s (basierend auf Durchschnitt)
                 if current_time - last_control >= control_interval:
-                    if self.meter_failure_count < self.max_meter_failures:
+                    cycle_grid_power = None
+                    cycle_ran = self.meter_failure_count < self.max_meter_failures
+                    if cycle_ran:
                         success, status = self.controller.execute_control_cycle()
+                        cycle_grid_power = self.controller.cycle_grid_power
                         
                         if success:
                             # Kompakte Ausgabe mit Durchschnittswerten
@@ -264,16 +335,32 @@ class MartekSystem:
                             self.web_server.add_log_entry('warning', f"Steuerung: {status}")
                     else:
                         # Energy Meter-Ausfall: Akkus gestoppt
+                        status = f"{meter_type}-Ausfall: Akkus gestoppt"
                         if iteration % (60 // control_interval) == 1:  # Alle 60s loggen bei Ausfall
                             self.logger.error(f"🚨 {meter_type}-Ausfall: Akkus gestoppt!")
                             self.web_server.add_log_entry('error', f"{meter_type}-Ausfall: Akkus gestoppt")
                     
+                    # Regelzyklus im Verlauf festhalten
+                    self._record_history(current_time, cycle_grid_power, status)
+                    self._record_flight(current_time, cycle_ran)
+                    if self.energy:
+                        self.energy.update_batteries(current_time, self.batteries.get_signed_powers())
+                    self.batteries.publish_metrics()
+                    
+                    # Status-Snapshot für Web-Interface veröffentlichen
+                    self.web_server.publish_status()
                     last_control = current_time
                 
-                # 3. SoC-Updates
-                if current_time - last_soc_update >= soc_interval:
-                    self._update_battery_soc()
-                    last_soc_update = current_time
+                # 3. SoC-Updates: adaptiv je Akku, höchstens eine Lesung pro Durchlauf
+                for akku_id, battery in self.batteries.batteries.items():
+                    self.soc_scheduler.update_load(akku_id, current_time, battery.get_soc(), battery.current_power)
+                due_akku_id = self.soc_scheduler.get_due(current_time)
+                if due_akku_id is not None:
+                    self._update_battery_soc(due_akku_id, current_time)
+                
+                if current_time - last_soc_log >= soc_interval:
+                    self._log_battery_soc()
+                    last_soc_log = current_time
                 
                 # 4. Kurz warten
                 time.sleep(1)
@@ -287,29 +374,115 @@ class MartekSystem:
         
         self.logger.info("Hauptschleife beendet")
     
-    def _update_battery_soc(self):
-        """Aktualisiert SoC aller Akkus"""
+    def _update_battery_soc(self, akku_id: int, current_time: float):
+        """Liest SoC eines Akkus und plant die nächste Lesung"""
         try:
-            soc_values = self.batteries.update_all_soc()
-            
-            # **NUR für Web-Interface loggen, NICHT auf Konsole**
-            soc_parts = []
-            for akku_id, soc in soc_values.items():
-                if soc is not None:
-                    soc_parts.append(f"Akku {akku_id}: {soc:.0f}%")
-                else:
-                    soc_parts.append(f"Akku {akku_id}: --")
+            self.batteries.update_soc(akku_id)
+        except Exception as e:
+            # Fehler weiterhin loggen
+            self.logger.warning(f"SoC-Update Akku {akku_id} fehlgeschlagen: {e}")
+            self.web_server.add_log_entry('warning', f"SoC-Update Akku {akku_id}: {e}")
+        
+        battery = self.batteries.batteries[akku_id]
+        self.soc_scheduler.mark_read(akku_id, current_time, battery.get_soc(), battery.current_power)
+    
+    def _create_history_store(self, history_config, akku_ids):
+        """Erstellt den konfigurierten Verlaufsspeicher ('segments' oder 'sqlite')"""
+        history_dir = history_config.get('directory', 'history')
+        flush_interval = history_config.get('flush_interval_seconds', 10)
+        max_reasoning_chars = history_config.get('max_reasoning_chars', 200)
+        
+        rollups = None
+        if history_config.get('rollups_enabled', True):
+            os.makedirs(history_dir, exist_ok=True)
+            # Rohdaten sind die Regelzyklen - ihr Abstand bestimmt, ab wann verdichtete Stufen gelesen werden
+            raw_resolution = self.config.get_control_config().get('poll_interval_seconds', 2)
+            rollups = RollupStore(default_series(akku_ids), history_dir, raw_resolution=raw_resolution)
+        
+        backend = history_config.get('backend', 'segments')
+        if backend == 'sqlite':
+            return SqliteHistoryStore(
+                path=history_config.get('sqlite_path', os.path.join(history_dir, 'marstek.db')),
+                flush_interval_seconds=flush_interval,
+                retention_days=history_config.get('retention_days', 365),
+                events_retention_days=history_config.get('events_retention_days', 365),
+                max_reasoning_chars=max_reasoning_chars,
+                rollups=rollups
+            )
+        if backend != 'segments':
+            raise ValueError(f"Unbekanntes Verlaufs-Backend: {backend}")
+        
+        return HistoryStore(
+            directory=history_dir,
+            max_disk_mb=history_config.get('max_disk_mb', 200),
+            segment_seconds=history_config.get('segment_seconds', 3600),
+            flush_interval_seconds=flush_interval,
+            max_reasoning_chars=max_reasoning_chars,
+            rollups=rollups
+        )
+    
+    def _record_history(self, timestamp: float, grid_power, reasoning: str):
+        """Schreibt Netzleistung, Akku-Sollwerte, SoC und Begründung des Zyklus in den Verlauf"""
+        if not self.history:
+            return
+        try:
+            batteries = [
+                (akku_id, battery.current_mode, battery.current_power, battery.get_soc())
+                for akku_id, battery in self.batteries.batteries.items()
+            ]
+            self.history.append(timestamp, grid_power, self.controller.current_mode,
+                                self.controller.current_total_power, batteries, reasoning)
+        except Exception as e:
+            self.logger.warning(f"Verlauf konnte nicht gespeichert werden: {e}")
+    
+    def _record_flight(self, timestamp: float, cycle_ran: bool):
+        """Schreibt den Zyklus in den Flugschreiber (Modbus-Ergebnisse seit dem letzten Datensatz)"""
+        if not self.flight_recorder:
+            return
+        try:
+            cycle = self.controller.last_cycle if cycle_ran else None
+            flags = 0
+            if cycle is None:
+                flags |= FLAG_METER_OUTAGE
+            else:
+                flags |= FLAG_SUCCESS if cycle['success'] else 0
+                flags |= FLAG_RATE_LIMITED if cycle['rate_limited'] else 0
+                flags |= FLAG_WRITE_SUPPRESSED if cycle['suppress_reason'] else 0
             
-            if soc_parts:
-                soc_msg = " | ".join(soc_parts)
-                # **KEIN Logger.info mehr! Nur Web-Interface**
-                # Konsolen-Log entfernt - nur noch Web-Interface
-                self.web_server.add_log_entry('info', f"🔋 SoC: {soc_msg}")
+            batteries = []
+            for akku_id, battery in self.batteries.batteries.items():
+                result = battery.last_result if battery.last_result_time >= self.last_flight_record else 0
+                signed_power = -battery.current_power if battery.current_mode == 1 else battery.current_power
+                batteries.append((akku_id, battery.get_soc(), battery.current_mode, signed_power, result))
             
+            self.flight_recorder.record(
+                timestamp,
+                grid_raw=cycle['grid_power'] if cycle else None,
+                grid_filtered=self.energy_meter.get_cached_power(),
+                mode=self.controller.current_mode,
+                power=self.controller.current_total_power,
+                flags=flags,
+                cycle_ms=cycle['duration_ms'] if cycle else 0.0,
+                batteries=batteries
+            )
+            self.last_flight_record = timestamp
         except Exception as e:
-            # Fehler weiterhin loggen
-            self.logger.warning(f"SoC-Update fehlgeschlagen: {e}")
-            self.web_server.add_log_entry('warning', f"SoC-Update: {e}")
+            self.logger.warning(f"Flugschreiber-Eintrag fehlgeschlagen: {e}")
+    
+    def _log_battery_soc(self):
+        """Meldet SoC aller Akkus im Web-Interface"""
+        soc_parts = []
+        for akku_id, battery in self.batteries.batteries.items():
+            soc = battery.get_soc()
+            if soc is not None:
+                soc_parts.append(f"Akku {akku_id}: {soc:.0f}%")
+            else:
+                soc_parts.append(f"Akku {akku_id}: --")
+        
+        if soc_parts:
+            soc_msg = " | ".join(soc_parts)
+            # **KEIN Logger.info mehr! Nur Web-Interface**
+            self.web_server.add_log_entry('info', f"🔋 SoC: {soc_msg}")
     
     def shutdown(self):
         """Fährt System sauber herunter"""
@@ -321,7 +494,22 @@ class MartekSystem:
                 self.batteries.stop_all()
                 self.logger.info("✓ Akkus gestoppt")
             
-            # Web-Server wird automatisch beendet (daemon thread)
+            # Energiebilanz speichern
+            if self.energy:
+                self.energy.close()
+            
+            # Flugschreiber auf die Karte schreiben
+            if self.flight_recorder:
+                self.flight_recorder.close()
+            
+            # Gepufferten Verlauf schreiben
+            if self.history:
+                self.history.close()
+                self.logger.info("✓ Verlauf gespeichert")
+            
+            # Web-Server beenden (Flask-Entwicklungsserver endet mit dem daemon thread)
+            if self.web_server:
+                self.web_server.shutdown()
             
             self.logger.info("✓ System sauber heruntergefahren")
             
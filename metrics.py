@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Metriken für Marstek PV-Akku Steuerung (Prometheus/OpenMetrics)
+Zähler, Messwerte und Histogramme werden dort aktualisiert, wo das Ereignis
+passiert - ein Abruf von /metrics rendert nur den aktuellen Stand, ohne Geräte-I/O
+"""
+
+import bisect
+import math
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CYCLE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else f"{value:.1f}"
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_string(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric(ABC):
+    """Basis: Metrik-Familie mit optionalen Labels, Kinder je Label-Kombination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """Kind-Metrik für eine Label-Kombination (wird beim ersten Zugriff angelegt)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: erwartet Labels {self.labelnames}, erhalten {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Neues Kind für eine Label-Kombination"""
+
+    def _default(self):
+        """Metrik ohne Labels direkt verwenden"""
+        return self.labels()
+
+    @abstractmethod
+    def render(self, openmetrics: bool) -> List[str]:
+        """Zeilen des Exposition-Formats für alle Kinder"""
+
+    def _header(self, type_name: str, family: str) -> List[str]:
+        return [f"# HELP {family} {_escape(self.documentation)}", f"# TYPE {family} {type_name}"]
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+
+class _CounterChild(_Value):
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild(_Value):
+    def set(self, value: Optional[float]):
+        self.value = math.nan if value is None else float(value)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monoton steigender Zähler"""
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        # OpenMetrics: Familie ohne _total, Sample mit _total
+        family = self.name if openmetrics else f"{self.name}_total"
+        lines = self._header('counter', family)
+        for key, child in list(self._children.items()):
+            lines.append(f"{self.name}_total{_label_string(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Aktueller Messwert"""
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: Optional[float]):
+        self._default().set(value)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = self._header('gauge', self.name)
+        for key, child in list(self._children.items()):
+            lines.append(f"{self.name}{_label_string(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # letzter Bucket: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    """Verteilung (z.B. Latenzen) in festen Buckets"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = self._header('histogram', self.name)
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _label_string(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_string(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Sammlung aller Metriken - rendert das Exposition-Format"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, openmetrics: bool = True) -> bytes:
+        """OpenMetrics (mit '# EOF') oder klassisches Prometheus-Textformat"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append('# EOF')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+# Globale Registry und Metriken der Anlage
+REGISTRY = MetricsRegistry()
+
+GRID_POWER = REGISTRY.gauge('marstek_grid_power_watts', 'Netzleistung letzter Abruf (positiv = Bezug)')
+METER_POLL_SECONDS = REGISTRY.histogram('marstek_meter_poll_seconds', 'Dauer eines Energiezähler-Abrufs', ['meter'])
+METER_POLL_FAILURES = REGISTRY.counter('marstek_meter_poll_failures', 'Fehlgeschlagene Energiezähler-Abrufe', ['meter'])
+METER_FAILURE_COUNT = REGISTRY.gauge('marstek_meter_failure_count', 'Aufeinanderfolgende Abruffehler (failure_count)', ['meter'])
+
+BATTERY_POWER = REGISTRY.gauge('marstek_battery_power_watts', 'Sollleistung je Akku (Entladen positiv, Laden negativ)', ['akku'])
+BATTERY_SOC = REGISTRY.gauge('marstek_battery_soc_percent', 'SoC je Akku (Schätzwert)', ['akku'])
+BATTERY_MODE = REGISTRY.gauge('marstek_battery_mode', 'Modus je Akku (0 = Stopp, 1 = Laden, 2 = Entladen)', ['akku'])
+BATTERY_ERRORS = REGISTRY.gauge('marstek_battery_error_count', 'Fehlerzähler je Akku (error_count)', ['akku'])
+MODBUS_OP_SECONDS = REGISTRY.histogram('marstek_modbus_op_seconds', 'Dauer einer Modbus-Operation', ['op', 'result'])
+
+CONTROLLER_MODE = REGISTRY.gauge('marstek_controller_mode', 'Aktueller Modus des Reglers')
+CONTROLLER_SETPOINT = REGISTRY.gauge('marstek_controller_setpoint_watts', 'Aktuelle Gesamtleistung des Reglers')
+CONTROLLER_MODE_CHANGES = REGISTRY.counter('marstek_controller_mode_changes', 'Moduswechsel des Reglers (mode_change_count)')
+CONTROLLER_WRITES_AVOIDED = REGISTRY.counter('marstek_controller_writes_avoided', 'Unterdrückte Schreibvorgänge', ['reason'])
+CONTROL_CYCLE_SECONDS = REGISTRY.histogram('marstek_control_cycle_seconds', 'Dauer eines Regelzyklus',
+                                           buckets=CYCLE_BUCKETS)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Leistungsverteilung für Marstek PV-Akku Steuerung
+Gewichtet nach SoC-Reserve und Kapazität, bündelt kleine Sollwerte auf
+möglichst wenige Akkus und hält die Zuordnung stabil (weniger Modbus-Writes)
+
+Staging: Zusätzliche Akkus werden erst zugeschaltet, wenn die aktiven Akkus
+einen Anteil ihrer Maximalleistung überschreiten (mit Hysterese). Der
+führende Akku rotiert zum Verschleißausgleich.
+"""
+
+import logging
+import math
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY_WH = 5120  # Marstek Venus / Duravolt: 5,12 kWh
+
+
+class StagingPolicy:
+    """Bestimmt die Anzahl aktiver Akkus mit Hysterese und rotierendem Lead-Akku"""
+
+    def __init__(self, max_power: float, stage_up_fraction: float = 0.8,
+                 stage_down_fraction: float = 0.6, lead_rotation_hours: float = 24):
+        if not 0 < stage_down_fraction < stage_up_fraction <= 1:
+            raise ValueError("Staging-Schwellen ungültig: 0 < stage_down_fraction < stage_up_fraction <= 1")
+
+        self.max_power = max_power
+        self.stage_up_fraction = stage_up_fraction
+        self.stage_down_fraction = stage_down_fraction
+        self.lead_rotation_seconds = lead_rotation_hours * 3600
+
+        self.active_count = 0
+        self.lead_id: Optional[int] = None
+        self.lead_since = 0.0
+        self.stage_changes = 0
+        self.lead_rotations = 0
+
+        # Energiedurchsatz je Akku (Wh) als Verschleißmaß
+        self.throughput_wh: Dict[int, float] = {}
+        self.last_update = 0.0
+
+        logger.info(f"Staging: Zuschalten ab {stage_up_fraction:.0%}, Abschalten unter {stage_down_fraction:.0%} "
+                    f"von {max_power}W je Akku, Lead-Rotation alle {lead_rotation_hours}h")
+
+    def record_throughput(self, allocation: Dict[int, float], now: float):
+        """Integriert die bisher zugewiesene Leistung als Energiedurchsatz"""
+        if self.last_update > 0:
+            hours = (now - self.last_update) / 3600
+            for akku_id, power in allocation.items():
+                self.throughput_wh[akku_id] = self.throughput_wh.get(akku_id, 0.0) + abs(power) * hours
+        self.last_update = now
+
+    def stage_count(self, total_power: float, available: int) -> int:
+        """Anzahl aktiver Akkus - Zuschalten/Abschalten mit Hysterese"""
+        count = min(max(self.active_count, 1), available)
+
+        while count < available and total_power > count * self.max_power * self.stage_up_fraction:
+            count += 1
+        while count > 1 and total_power < (count - 1) * self.max_power * self.stage_down_fraction:
+            count -= 1
+
+        # Harte Grenze: Die aktiven Akkus müssen die Leistung auch liefern können
+        count = max(count, min(math.ceil(total_power / self.max_power), available))
+
+        if count != self.active_count and self.active_count > 0:
+            self.stage_changes += 1
+            logger.info(f"Staging: {self.active_count} -> {count} aktive Akkus ({total_power:.0f}W)")
+        self.active_count = count
+        return count
+
+    def select_lead(self, weights: Dict[int, float], session_start: bool, now: float) -> int:
+        """
+        Wählt den führenden Akku: bei Sitzungsbeginn oder nach Ablauf der Rotationszeit
+        den mit dem geringsten Durchsatz unter den Akkus mit ausreichender SoC-Reserve
+        """
+        rotation_due = now - self.lead_since >= self.lead_rotation_seconds
+        if self.lead_id in weights and not session_start and not rotation_due:
+            return self.lead_id
+
+        best_weight = max(weights.values())
+        eligible = [akku_id for akku_id, weight in weights.items() if weight >= best_weight * 0.5]
+        lead = min(eligible, key=lambda akku_id: (self.throughput_wh.get(akku_id, 0.0), -weights[akku_id]))
+
+        if lead != self.lead_id:
+            if self.lead_id is not None:
+                self.lead_rotations += 1
+            logger.info(f"Staging: Lead-Akku {self.lead_id} -> {lead}")
+        self.lead_id = lead
+        self.lead_since = now
+        return lead
+
+    def reset(self):
+        """Setzt aktive Stufe zurück (alle Akkus gestoppt)"""
+        self.active_count = 0
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Staging-Zustand zurück"""
+        return {
+            'active_count': self.active_count,
+            'lead_id': self.lead_id,
+            'stage_up_fraction': self.stage_up_fraction,
+            'stage_down_fraction': self.stage_down_fraction,
+            'stage_changes': self.stage_changes,
+            'lead_rotations': self.lead_rotations,
+            'throughput_wh': {akku_id: round(wh, 1) for akku_id, wh in self.throughput_wh.items()}
+        }
+
+
+class PowerAllocator:
+    """Berechnet die Leistung je Akku für einen Gesamt-Sollwert"""
+
+    def __init__(self, min_power: float, max_power: float, strategy: str = 'weighted',
+                 capacities_wh: Optional[Dict[int, float]] = None,
+                 default_capacity_wh: float = DEFAULT_CAPACITY_WH,
+                 concentrate: bool = True, rebalance_threshold: float = 0.15,
+                 staging: Optional[StagingPolicy] = None):
+        if strategy not in ('weighted', 'equal'):
+            raise ValueError(f"Unbekannte Verteilungsstrategie: {strategy}")
+
+        self.min_power = min_power
+        self.max_power = max_power
+        self.strategy = strategy
+        self.capacities_wh = capacities_wh or {}
+        self.default_capacity_wh = default_capacity_wh
+        self.concentrate = concentrate
+        self.rebalance_threshold = rebalance_threshold
+        self.staging = staging
+
+        # Letzte Zuordnung für stabile Verteilung
+        self.last_allocation: Dict[int, float] = {}
+        self.last_mode = 0
+
+        bundling = 'Staging' if staging else ('an' if concentrate else 'aus')
+        logger.info(f"Leistungsverteilung: Strategie={strategy}, Bündelung={bundling}, "
+                    f"Rebalance ab {rebalance_threshold:.0%} Abweichung")
+        if staging and concentrate:
+            # _select_active nimmt die Akku-Anzahl dann aus dem Staging, _required_count wird nicht verwendet
+            logger.info("Staging aktiv - concentrate_small_setpoints wird ignoriert, "
+                        "die Anzahl aktiver Akkus bestimmt das Staging")
+
+    @classmethod
+    def from_config(cls, battery_config: Dict[str, Any]) -> 'PowerAllocator':
+        """Erstellt Verteiler aus der battery-Sektion der config.json"""
+        capacities = {int(akku_id): float(capacity)
+                      for akku_id, capacity in battery_config.get('capacities_wh', {}).items()}
+        staging = None
+        if battery_config.get('staging_enabled', True):
+            staging = StagingPolicy(
+                max_power=battery_config['max_power_per_battery'],
+                stage_up_fraction=battery_config.get('stage_up_fraction', 0.8),
+                stage_down_fraction=battery_config.get('stage_down_fraction', 0.6),
+                lead_rotation_hours=battery_config.get('lead_rotation_hours', 24)
+            )
+        return cls(
+            min_power=battery_config['min_power_per_battery'],
+            max_power=battery_config['max_power_per_battery'],
+            strategy=battery_config.get('allocation_strategy', 'weighted'),
+            capacities_wh=capacities,
+            default_capacity_wh=battery_config.get('capacity_wh', DEFAULT_CAPACITY_WH),
+            concentrate=battery_config.get('concentrate_small_setpoints', True),
+            rebalance_threshold=battery_config.get('allocation_rebalance_threshold', 0.15),
+            staging=staging
+        )
+
+    def get_capacity(self, slave_id: int) -> float:
+        """Gibt die konfigurierte Kapazität eines Akkus in Wh zurück"""
+        return self.capacities_wh.get(slave_id, self.default_capacity_wh)
+
+    def allocate(self, total_power: float, mode: int, soc_values: Dict[int, float],
+                 min_soc: float, max_soc: float) -> Dict[int, float]:
+        """
+        Verteilt total_power auf die übergebenen (verfügbaren) Akkus
+
+        soc_values: slave_id -> SoC nur der Akkus, die für den Modus zulässig sind
+        Returns: slave_id -> Leistung in Watt (nur aktive Akkus)
+        """
+        now = time.time()
+        if self.staging:
+            self.staging.record_throughput(self.last_allocation, now)
+
+        if mode == 0 or total_power <= 0 or not soc_values:
+            self.last_allocation = {}
+            self.last_mode = mode
+            if self.staging:
+                self.staging.reset()
+            return {}
+
+        weights = self._calculate_weights(mode, soc_values, min_soc, max_soc)
+        active_ids = self._select_active(total_power, mode, weights, now)
+        active_weights = {akku_id: weights[akku_id] for akku_id in active_ids}
+
+        # Stabile Verteilung: bisherige Anteile beibehalten, solange sie nah am Ziel liegen
+        if mode == self.last_mode and set(active_ids) == set(self.last_allocation):
+            previous_total = sum(self.last_allocation.values())
+            weight_total = sum(active_weights.values())
+            if previous_total > 0 and weight_total > 0:
+                drift = max(abs(self.last_allocation[akku_id] / previous_total - active_weights[akku_id] / weight_total)
+                            for akku_id in active_ids)
+                if drift < self.rebalance_threshold:
+                    active_weights = dict(self.last_allocation)
+
+        allocation = self._split(total_power, active_weights)
+
+        self.last_allocation = allocation
+        self.last_mode = mode
+        return allocation
+
+    def _calculate_weights(self, mode: int, soc_values: Dict[int, float],
+                           min_soc: float, max_soc: float) -> Dict[int, float]:
+        """Gewicht = nutzbare SoC-Reserve × Kapazität"""
+        weights = {}
+        for akku_id, soc in soc_values.items():
+            if self.strategy == 'equal':
+                weights[akku_id] = 1.0
+                continue
+
+            if mode == 1:  # Laden: Abstand zur Ladegrenze
+                headroom = max_soc - soc
+            else:  # Entladen: Abstand zur Entladegrenze
+                headroom = soc - min_soc
+
+            # Kleine Untergrenze, damit Akkus knapp an der Grenze nicht komplett herausfallen
+            weights[akku_id] = max(headroom, 0.5) * self.get_capacity(akku_id)
+        return weights
+
+    def _required_count(self, total_power: float, available: int) -> int:
+        """Anzahl der benötigten Akkus für die Gesamtleistung"""
+        if not self.concentrate:
+            # Ohne Bündelung alle verfügbaren Akkus (wie die frühere Gleichverteilung,
+            # Anteile unter min_power werden in _split auf min_power angehoben)
+            return available
+
+        # Jeder aktive Akku muss mindestens min_power bekommen
+        count = min(math.ceil(total_power / self.max_power), int(total_power // self.min_power))
+        return max(1, min(count, available))
+
+    def _select_active(self, total_power: float, mode: int, weights: Dict[int, float], now: float) -> list:
+        """Wählt die aktiven Akkus - Lead-Akku und bisherige Zuordnung haben Vorrang"""
+        session_start = (mode != self.last_mode or not self.last_allocation)
+        if session_start and self.staging:
+            self.staging.reset()
+
+        if self.staging:
+            count = self.staging.stage_count(total_power, len(weights))
+            count = max(1, min(count, int(total_power // self.min_power)))
+        else:
+            count = self._required_count(total_power, len(weights))
+
+        by_weight = sorted(weights, key=lambda akku_id: weights[akku_id], reverse=True)
+        if not session_start:
+            previous = [akku_id for akku_id in by_weight if akku_id in self.last_allocation]
+            others = [akku_id for akku_id in by_weight if akku_id not in self.last_allocation]
+            ordered = previous + others
+        else:
+            ordered = by_weight
+
+        if self.staging:
+            lead = self.staging.select_lead(weights, session_start, now)
+            ordered = [lead] + [akku_id for akku_id in ordered if akku_id != lead]
+
+        return ordered[:count]
+
+    def _split(self, total_power: float, weights: Dict[int, float]) -> Dict[int, float]:
+        """Proportionale Aufteilung mit Begrenzung auf min_power..max_power (Water-Filling)"""
+        remaining = dict(weights)
+        result = {}
+        power_left = total_power
+
+        while remaining:
+            weight_sum = sum(remaining.values())
+            if weight_sum <= 0:
+                shares = {akku_id: power_left / len(remaining) for akku_id in remaining}
+            else:
+                shares = {akku_id: power_left * weight / weight_sum for akku_id, weight in remaining.items()}
+
+            over = [akku_id for akku_id, share in shares.items() if share > self.max_power]
+            if over:
+                for akku_id in over:
+                    result[akku_id] = self.max_power
+                    power_left -= self.max_power
+                    del remaining[akku_id]
+                continue
+
+            under = [akku_id for akku_id, share in shares.items() if share < self.min_power]
+            if under:
+                for akku_id in under:
+                    result[akku_id] = self.min_power
+                    power_left -= self.min_power
+                    del remaining[akku_id]
+                continue
+
+            result.update(shares)
+            break
+
+        return {akku_id: round(power) for akku_id, power in result.items()}
+
+    def reset(self):
+        """Vergisst die letzte Zuordnung (z.B. nach Stopp aller Akkus)"""
+        if self.staging and self.last_allocation:
+            self.staging.record_throughput(self.last_allocation, time.time())
+        self.last_allocation = {}
+        self.last_mode = 0
+        if self.staging:
+            self.staging.reset()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Zustand der Verteilung zurück"""
+        return {
+            'strategy': self.strategy,
+            'concentrate': self.concentrate and not self.staging,
+            'last_mode': self.last_mode,
+            'last_allocation': dict(self.last_allocation),
+            'staging': self.staging.get_status() if self.staging else None
+        }
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Sampling-Profiler für Marstek PV-Akku Steuerung
+Tastet die Stacks aller Threads über sys._current_frames() ab und liefert
+Collapsed Stacks (flamegraph.pl, speedscope.app) - ohne Neustart, Debugger oder externe Tools
+"""
+
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Maximale Stack-Tiefe je Probe (tiefere Frames werden abgeschnitten)
+MAX_STACK_DEPTH = 64
+
+
+def _frame_label(code) -> str:
+    """Funktionsname mit Datei und Startzeile - ohne ';' (Trennzeichen des Formats)"""
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    """Ein Profiling-Lauf zur Zeit - parallele Anfragen werden abgewiesen"""
+
+    def __init__(self, max_seconds: float = 60, interval_seconds: float = 0.01):
+        self.max_seconds = max_seconds
+        self.interval = interval_seconds
+        self._running = threading.Lock()
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def profile(self, seconds: float, interval: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Tastet alle übrigen Threads für seconds Sekunden ab (blockiert den Aufrufer)
+        Returns: Ergebnis mit Collapsed Stacks oder None, wenn bereits ein Lauf aktiv ist
+        Raises: ValueError bei nicht endlicher Dauer bzw. Intervall (NaN/inf)
+        """
+        if not math.isfinite(seconds) or (interval is not None and not math.isfinite(interval)):
+            raise ValueError("Dauer und Intervall müssen endliche Zahlen sein")
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            return self._sample(min(max(seconds, 0.1), self.max_seconds), interval or self.interval)
+        finally:
+            self._running.release()
+
+    def _sample(self, seconds: float, interval: float) -> Dict[str, Any]:
+        own_ident = threading.get_ident()
+        stacks: Counter = Counter()
+        cache: Dict[Any, str] = {}
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        logger.info(f"Profiling gestartet: {seconds:.0f}s, Intervall {interval * 1000:.0f}ms")
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    label = cache.get(code)
+                    if label is None:
+                        label = cache[code] = _frame_label(code)
+                    labels.append(label)
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}").replace(';', ':').replace(' ', '_'))
+                stacks[';'.join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(max(0.0, interval - (time.perf_counter() - now)))
+
+        duration = time.perf_counter() - start
+        self.last_run = {
+            'timestamp': time.time(),
+            'duration_seconds': round(duration, 2),
+            'samples': samples,
+            'interval_ms': round(interval * 1000, 1),
+            'unique_stacks': len(stacks)
+        }
+        logger.info(f"Profiling beendet: {samples} Proben, {len(stacks)} verschiedene Stacks")
+        return dict(self.last_run, stacks=stacks)
+
+    @staticmethod
+    def collapsed(result: Dict[str, Any]) -> str:
+        """Collapsed-Stack-Format: 'thread;func_a;func_b <Anzahl>' je Zeile"""
+        return ''.join(f"{stack} {count}\n" for stack, count in result['stacks'].most_common())
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'running': self._running.locked(),
+            'max_seconds': self.max_seconds,
+            'interval_ms': round(self.interval * 1000, 1),
+            'last_run': self.last_run
+        }
@@ -9,6 +9,8 @@ import time
 import requests
 from typing import Optional, Dict, Any
 from collections import deque
+import metrics
+import timing
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +28,9 @@ class ShellyClient:
         self.power_history = deque(maxlen=3)
         self.last_poll_time = 0
         
+        # Letzte Zählerstände (Bezug/Einspeisung in Wh) oder None, wenn das Gerät keine liefert
+        self.energy_counters: Optional[Dict[str, float]] = None
+        
         logger.info(f"Shelly-Client initialisiert: {ip} (mit 3-Werte-Durchschnitt)")
     
     def poll_current_power(self) -> Optional[float]:
@@ -33,6 +38,17 @@ class ShellyClient:
         Holt AKTUELLE Leistung vom Shelly und fügt sie zur History hinzu
         Returns: Aktuelle Leistung in Watt (positiv=Bezug, negativ=Einspeisung) oder None bei Fehler
         """
+        with timing.span('meter_read') as span:
+            power = self._poll_current_power()
+        metrics.METER_POLL_SECONDS.labels('shelly').observe(span.duration)
+        if power is None:
+            metrics.METER_POLL_FAILURES.labels('shelly').inc()
+        else:
+            metrics.GRID_POWER.set(power)
+        metrics.METER_FAILURE_COUNT.labels('shelly').set(self.failure_count)
+        return power
+    
+    def _poll_current_power(self) -> Optional[float]:
         try:
             url = f"{self.base_url}/rpc/Shelly.GetStatus"
             response = requests.get(url, timeout=self.timeout)
@@ -49,6 +65,15 @@ class ShellyClient:
             current_power = power_a + power_b + power_c
             current_time = time.time()
             
+            # Zählerstände aus derselben Antwort (Pro 3EM: emdata:0, Wh) für die Energiebilanz
+            emdata = data.get('emdata:0', {})
+            if 'total_act' in emdata and 'total_act_ret' in emdata:
+                self.energy_counters = {
+                    'import_wh': float(emdata['total_act']),
+                    'export_wh': float(emdata['total_act_ret']),
+                    'timestamp': current_time
+                }
+            
             # Zur History hinzufügen
             self.power_history.append({
                 'power': current_power,
@@ -164,6 +189,28 @@ class ShellyClient:
     
     def get_status(self) -> Dict[str, Any]:
         """Gibt aktuellen Status des Shelly-Clients zurück"""
+        return self._build_status(online=self.is_online(), current_average=self.get_power())
+    
+    def get_cached_status(self) -> Dict[str, Any]:
+        """
+        Status ohne Netzwerkzugriff - abgeleitet aus den letzten Abrufen
+        Für Status-Snapshots, damit Web-Anfragen das Messgerät nicht zusätzlich belasten
+        """
+        online = self.failure_count == 0 and self.last_poll_time > 0
+        return self._build_status(online=online, current_average=self.get_cached_power())
+    
+    def get_energy_counters(self) -> Optional[Dict[str, float]]:
+        """Zählerstände aus dem letzten Abruf (ohne neuen Abruf)"""
+        return self.energy_counters
+    
+    def get_cached_power(self) -> Optional[float]:
+        """Durchschnitt der vorhandenen History ohne neuen Abruf (None ohne Daten)"""
+        if not self.power_history:
+            return None
+        return self.get_power()
+    
+    def _build_status(self, online: bool, current_average: Optional[float]) -> Dict[str, Any]:
+        """Erstellt Status-Dict aus History und Fehlerzählern"""
         current_time = time.time()
         history_info = {
             'count': len(self.power_history),
@@ -175,12 +222,12 @@ class ShellyClient:
         
         return {
             'ip': self.ip,
-            'online': self.is_online(),
+            'online': online,
             'failure_count': self.failure_count,
             'last_success': self.last_success,
             'seconds_since_success': int(current_time - self.last_success),
             'history': history_info,
-            'current_average': self.get_power()
+            'current_average': current_average
         }
     
     def reset_failure_count(self):
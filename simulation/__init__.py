@@ -0,0 +1,5 @@
+"""
+Simulation und Offline-Auswertung für Marstek PV-Akku Steuerung
+Betreibt den echten ZeroFeedController gegen aufgezeichnete Verläufe oder
+nachgebildete Anlagen - ohne Hardware und schneller als Echtzeit
+"""
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Emulator für Marstek/Duravolt-Akkus hinter einem Modbus-TCP/RS485-Gateway
+pymodbus-Server mit dem Registerabbild der Akkus (42000, 42010, 42020, 42021, 43000,
+32104, 35001/35002, 41100) für frei wählbare Unit-IDs. Alle Akkus teilen sich wie am
+echten Gateway einen seriellen Bus hinter einem TCP-Port: Telegramme werden
+nacheinander abgearbeitet, jedes kostet Buslaufzeit - auch bei mehreren parallelen
+Verbindungen. Der SoC folgt der kommandierten Leistung (Verzögerung, Rampe, Wirkungsgrad
+wie in simulation.plant).
+
+Fehlerinjektion je Telegramm: keine Antwort (Timeout), Modbus-Exception oder
+Verbindungsabbruch - wahlweise nur für einzelne Unit-IDs. Nicht vorhandene Unit-IDs
+antworten wie am echten Bus gar nicht.
+
+Aufruf: python -m simulation.battery_emulator --port 5020 --units 1,2 --latency-ms 40 --timeout-rate 0.02
+Dann in config.json: "battery": {"ip": "127.0.0.1", "port": 5020, ...}
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymodbus import pdu as modbus_pdu
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseSlaveContext
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.async_io import ModbusServerRequestHandler
+
+from battery_client import REG_MODBUS_ADDRESS
+from simulation.plant import PlantBattery
+
+logger = logging.getLogger(__name__)
+
+FAULT_TIMEOUT = 'timeout'      # Gerät antwortet nicht
+FAULT_EXCEPTION = 'exception'  # Modbus-Exception (Slave Device Failure)
+FAULT_DROP = 'drop'            # Gateway trennt die TCP-Verbindung
+
+
+class RS485Bus:
+    """Serieller Bus: ein Telegramm nach dem anderen, jedes mit Laufzeit und ggf. injiziertem Fehler"""
+
+    def __init__(self, latency_seconds: float = 0.04, jitter_seconds: float = 0.01, bus_timeout_seconds: float = 1.0,
+                 timeout_rate: float = 0.0, exception_rate: float = 0.0, drop_rate: float = 0.0,
+                 faulty_units: Optional[Sequence[int]] = None, seed: Optional[int] = None):
+        self.latency = latency_seconds
+        self.jitter = jitter_seconds
+        self.bus_timeout = bus_timeout_seconds
+        self.rates = [(FAULT_TIMEOUT, timeout_rate), (FAULT_EXCEPTION, exception_rate), (FAULT_DROP, drop_rate)]
+        self.faulty_units = set(faulty_units) if faulty_units else None  # None = alle Unit-IDs
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.faults = {FAULT_TIMEOUT: 0, FAULT_EXCEPTION: 0, FAULT_DROP: 0}
+        self.busy_seconds = 0.0
+
+    def _draw_fault(self, unit_id: int) -> Optional[str]:
+        if self.faulty_units is not None and unit_id not in self.faulty_units:
+            return None
+        draw = self.rng.random()
+        for fault, rate in self.rates:
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    def transact(self, unit_id: int) -> Optional[str]:
+        """
+        Belegt den Bus für ein Telegramm und liefert den injizierten Fehler (oder None)
+        Blockiert bewusst den Event-Loop des Servers: parallele Verbindungen warten wie am echten Gateway.
+        """
+        fault = self._draw_fault(unit_id)
+        duration = self.bus_timeout if fault == FAULT_TIMEOUT else self.latency + self.rng.uniform(0, self.jitter)
+        time.sleep(duration)
+        self.requests += 1
+        self.busy_seconds += duration
+        if fault:
+            self.faults[fault] += 1
+        return fault
+
+    def get_status(self) -> Dict[str, Any]:
+        return {'requests': self.requests, 'faults': dict(self.faults), 'busy_seconds': round(self.busy_seconds, 1)}
+
+
+class EmulatedUnit(ModbusBaseSlaveContext):
+    """Datenmodell eines Akkus für den pymodbus-Server (Holding-Register, Adressen 1:1)"""
+
+    def __init__(self, emulator: 'BatteryEmulator', battery: PlantBattery):
+        self.emulator = emulator
+        self.battery = battery
+
+    def reset(self):
+        pass
+
+    def validate(self, fx, address, count=1):
+        if self.decode(fx) != 'h':
+            return False
+        addresses = range(address, address + count)
+        if fx in (6, 16):  # Schreiben
+            return all(a in self.battery.registers for a in addresses)
+        with self.emulator.lock:
+            return all(self.battery.read_register(a) is not None for a in addresses)
+
+    def getValues(self, fx, address, count=1):
+        with self.emulator.lock:
+            return [self.battery.read_register(a) for a in range(address, address + count)]
+
+    def setValues(self, fx, address, values):
+        now = time.time()
+        with self.emulator.lock:
+            for offset, value in enumerate(values):
+                if address + offset == REG_MODBUS_ADDRESS:
+                    self.emulator.readdress(self, value)
+                else:
+                    self.battery.write_register(address + offset, value, now)
+
+
+class _GatewayRequestHandler(ModbusServerRequestHandler):
+    """Leitet jedes Telegramm über den gemeinsamen Bus und setzt dort gezogene Fehler um"""
+
+    def execute(self, request, *addr):
+        fault = self.server.bus.transact(request.slave_id)
+        if fault == FAULT_DROP:
+            # Wie ein Abbruch von außen (RST) - pymodbus räumt die Verbindung über connection_lost auf
+            self.transport.abort()
+            return
+        if fault == FAULT_TIMEOUT:
+            return  # Keine Antwort - der Client läuft in seinen Timeout
+        if fault == FAULT_EXCEPTION:
+            response = request.doException(modbus_pdu.ModbusExceptions.SlaveFailure)
+            response.transaction_id = request.transaction_id
+            response.slave_id = request.slave_id
+            self.send(response, *addr)
+            return
+        super().execute(request, *addr)
+
+
+class GatewayServer(ModbusTcpServer):
+    """Modbus-TCP-Server mit seriellem Bus dahinter"""
+
+    def __init__(self, context: ModbusServerContext, bus: RS485Bus, address):
+        super().__init__(context, address=address)
+        self.bus = bus
+
+    def callback_new_connection(self):
+        return _GatewayRequestHandler(self)
+
+
+class BatteryEmulator:
+    """Akkus, Bus und Server; der SoC wird in einem eigenen Thread in Echtzeit fortgeschrieben"""
+
+    def __init__(self, units: List[int], bus: RS485Bus, capacity_wh: float = 5120, initial_soc: float = 50,
+                 lag_seconds: float = 1.5, ramp_w_per_second: float = 600, max_power: float = 2500,
+                 step_seconds: float = 0.5):
+        self.bus = bus
+        self.step_seconds = step_seconds
+        self.lock = threading.Lock()
+        self.batteries: Dict[int, PlantBattery] = {
+            unit_id: PlantBattery(unit_id, capacity_wh=capacity_wh, soc=initial_soc, lag_seconds=lag_seconds,
+                                  ramp_w_per_second=ramp_w_per_second, max_power=max_power)
+            for unit_id in units
+        }
+        self.context = ModbusServerContext(
+            slaves={unit_id: EmulatedUnit(self, battery) for unit_id, battery in self.batteries.items()},
+            single=False
+        )
+        self._running = False
+
+    def readdress(self, unit: EmulatedUnit, new_id: int):
+        """Schreiben von 41100: der Akku antwortet ab sofort unter der neuen Unit-ID"""
+        old_id = unit.battery.unit_id
+        if not 1 <= new_id <= 247 or new_id == old_id:
+            return
+        del self.context[old_id]
+        self.context[new_id] = unit
+        del self.batteries[old_id]
+        self.batteries[new_id] = unit.battery
+        unit.battery.unit_id = new_id
+        unit.battery.registers[REG_MODBUS_ADDRESS] = new_id
+        logger.info(f"Akku {old_id}: Modbus-Adresse auf {new_id} geändert")
+
+    def _simulate(self, status_interval: float):
+        last = time.time()
+        last_status = last
+        while self._running:
+            time.sleep(self.step_seconds)
+            now = time.time()
+            with self.lock:
+                for battery in self.batteries.values():
+                    battery.step(now, now - last)
+            last = now
+            if status_interval and now - last_status >= status_interval:
+                last_status = now
+                self._log_status()
+
+    def _log_status(self):
+        with self.lock:
+            units = ', '.join(f"Akku {unit_id}: {battery.power:+.0f}W SoC {battery.soc:.1f}%"
+                              for unit_id, battery in sorted(self.batteries.items()))
+        bus = self.bus.get_status()
+        logger.info(f"{units} | Bus: {bus['requests']} Telegramme, Fehler {bus['faults']}")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            batteries = {unit_id: {'soc': round(battery.soc, 1), 'power': round(battery.power, 1),
+                                   'commanded': battery.commanded_power()}
+                         for unit_id, battery in self.batteries.items()}
+        return {'batteries': batteries, 'bus': self.bus.get_status()}
+
+    def run(self, host: str, port: int, status_interval: float = 10):
+        """Blockiert bis Strg+C"""
+        self._running = True
+        thread = threading.Thread(target=self._simulate, args=(status_interval,), name='battery-emulator', daemon=True)
+        thread.start()
+
+        async def serve():
+            server = GatewayServer(self.context, self.bus, (host, port))
+            await server.serve_forever()
+
+        logger.info(f"Akku-Emulator auf {host}:{port} - Unit-IDs {sorted(self.batteries)}")
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._running = False
+            thread.join(timeout=2)
+
+
+def _parse_units(text: str) -> List[int]:
+    return [int(part) for part in text.split(',') if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Marstek/Duravolt-Akkus hinter einem Modbus-TCP-Gateway emulieren")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5020)
+    parser.add_argument('--units', type=_parse_units, default=[1, 2], help="Unit-IDs, z.B. 1,2 (Standard)")
+    parser.add_argument('--capacity-wh', type=float, default=5120)
+    parser.add_argument('--soc', type=float, default=50, help="Anfangs-SoC aller Akkus (%%)")
+    parser.add_argument('--lag', type=float, default=1.5, help="Verzögerung bis ein Sollwert wirkt (s)")
+    parser.add_argument('--ramp', type=float, default=600, help="Rampenbegrenzung (W/s)")
+    parser.add_argument('--latency-ms', type=float, default=40, help="Buslaufzeit je Telegramm (ms)")
+    parser.add_argument('--jitter-ms', type=float, default=10, help="Zusätzliche zufällige Laufzeit bis (ms)")
+    parser.add_argument('--bus-timeout-ms', type=float, default=1000, help="Busbelegung bei ausbleibender Antwort (ms)")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="Anteil Telegramme ohne Antwort (0-1)")
+    parser.add_argument('--exception-rate', type=float, default=0.0, help="Anteil Telegramme mit Modbus-Exception (0-1)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Anteil Telegramme mit Verbindungsabbruch (0-1)")
+    parser.add_argument('--faulty-units', type=_parse_units, help="Fehler nur für diese Unit-IDs")
+    parser.add_argument('--seed', type=int, help="Seed für Laufzeiten und Fehler")
+    parser.add_argument('--status-interval', type=float, default=10, help="Statuszeile alle x Sekunden (0 = aus)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger('pymodbus').setLevel(logging.WARNING)
+
+    bus = RS485Bus(
+        latency_seconds=args.latency_ms / 1000,
+        jitter_seconds=args.jitter_ms / 1000,
+        bus_timeout_seconds=args.bus_timeout_ms / 1000,
+        timeout_rate=args.timeout_rate,
+        exception_rate=args.exception_rate,
+        drop_rate=args.drop_rate,
+        faulty_units=args.faulty_units,
+        seed=args.seed
+    )
+    emulator = BatteryEmulator(args.units, bus, capacity_wh=args.capacity_wh, initial_soc=args.soc,
+                               lag_seconds=args.lag, ramp_w_per_second=args.ramp)
+    emulator.run(args.host, args.port, args.status_interval)
+
+
+if __name__ == "__main__":
+    main()
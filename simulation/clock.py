@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Virtuelle Uhr für Simulationen
+Ersetzt das time-Modul in den Steuerungsmodulen, sodass Verweilzeiten, Pausen
+(time.sleep) und Zeitstempel der simulierten statt der echten Zeit folgen
+"""
+
+import time as _time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class VirtualClock:
+    """Ersatz für das time-Modul: time()/perf_counter()/monotonic() liefern die simulierte Zeit, sleep() spult vor"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self.slept = 0.0  # Summe aller sleep()-Aufrufe (z.B. Pausen zwischen Modbus-Schreibvorgängen)
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.now += seconds
+            self.slept += seconds
+
+    def advance_to(self, timestamp: float):
+        """Springt vorwärts (nie zurück - sleep() kann die Zeit bereits weitergedreht haben)"""
+        if timestamp > self.now:
+            self.now = timestamp
+
+    def __getattr__(self, name):
+        # Alles Übrige (strftime, localtime, ...) vom echten time-Modul
+        return getattr(_time, name)
+
+    @contextmanager
+    def installed(self, *modules) -> Iterator['VirtualClock']:
+        """Setzt die Uhr als 'time' in den angegebenen Modulen ein und stellt danach das Original wieder her"""
+        originals = [(module, module.time) for module in modules]
+        try:
+            for module, _ in originals:
+                module.time = self
+            yield self
+        finally:
+            for module, original in originals:
+                module.time = original
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Emulator für Shelly 3EM Pro und EcoTracker
+Kleiner HTTP-Server mit /rpc/Shelly.GetStatus, /rpc/Shelly.GetDeviceInfo, /rpc/EM.GetStatus,
+/rpc/EMData.GetStatus und dem EcoTracker-Endpunkt /v1/json. Die Netzleistung stammt aus einem
+Lastprofil - synthetisch wie in simulation.plant, aus einer Aufzeichnung (alle Quellen von
+simulation.replay) oder aus einem Skript mit festen Stufen - und wird in Echtzeit (oder
+beschleunigt) abgespielt. Zählerstände für Bezug/Einspeisung werden mitintegriert.
+
+Mit --battery-port läuft der Akku-Emulator im selben Prozess: die Netzleistung ist dann Last
+minus wirksame Akkuleistung, und main.py regelt gegen einen geschlossenen Kreis.
+
+Fehlerinjektion je Abruf: Antwortzeit mit Streuung, HTTP 500, keine Antwort (Client-Timeout),
+Verbindungsabbruch sowie feste Ausfallzeiträume.
+
+Aufruf: python -m simulation.meter_emulator --port 8081 --battery-port 5020 --error-rate 0.01
+Dann in config.json: "shelly": {"ip": "127.0.0.1:8081", ...} bzw. "ecotracker": {"ip": "127.0.0.1:8081", ...}
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation.plant import DEFAULT_SCENARIO, build_profiles, merge_scenario
+from simulation.replay import apply_overrides, load_trace, parse_override
+
+logger = logging.getLogger(__name__)
+
+FAULT_ERROR = 'error'      # HTTP 500
+FAULT_TIMEOUT = 'timeout'  # Keine Antwort, Verbindung bleibt hängen
+FAULT_DROP = 'drop'        # Verbindung ohne Antwort geschlossen
+
+VOLTAGE = 230.0
+POWER_AVG_SECONDS = 60     # Mittelungsfenster für powerAvg (EcoTracker)
+
+
+# ---------------------------------------------------------------------------
+# Lastprofile (Last hinter dem Zähler ohne Akku, 1 Wert je Sekunde)
+# ---------------------------------------------------------------------------
+
+def synthetic_profile(scenario: Dict[str, Any]) -> List[float]:
+    """Hauslast minus PV aus dem Anlagenmodell (gleicher Seed = gleiches Profil)"""
+    scenario = merge_scenario(DEFAULT_SCENARIO, scenario)
+    start = datetime.fromisoformat(scenario['start']).timestamp()
+    seconds = int(scenario['duration_hours'] * 3600)
+    load, pv = build_profiles(scenario, start, seconds, scenario['seed'])
+    return [l - p for l, p in zip(load, pv)]
+
+
+def recorded_profile(source: str) -> List[float]:
+    """Aufzeichnung auf ein Sekundenraster bringen (Haltewert bis zum nächsten Punkt)"""
+    trace = load_trace(source)
+    if not trace.times:
+        raise ValueError(f"Keine Messpunkte in {source}")
+    profile = []
+    index = 0
+    start = trace.times[0]
+    for second in range(int(trace.duration) + 1):
+        while index + 1 < len(trace) and trace.times[index + 1] <= start + second:
+            index += 1
+        profile.append(trace.net_load[index])
+    return profile
+
+
+def scripted_profile(path: str) -> List[float]:
+    """
+    JSON-Skript mit Stufen [[Sekunde, Watt], ...], z.B. [[0, 300], [60, 2300], [240, -800], [600, 300]]
+    Jede Stufe gilt bis zur nächsten, die letzte Stufe für 60 s (danach beginnt das Profil von vorn).
+    """
+    with open(path, encoding='utf-8') as f:
+        steps = json.load(f)
+    if isinstance(steps, dict):
+        steps = steps.get('steps', [])
+    steps = sorted((float(second), float(watts)) for second, watts in steps)
+    if not steps:
+        raise ValueError(f"Keine Stufen in {path}")
+    end = int(steps[-1][0]) + 60
+    profile = []
+    index = 0
+    for second in range(end):
+        while index + 1 < len(steps) and steps[index + 1][0] <= second:
+            index += 1
+        profile.append(steps[index][1])
+    return profile
+
+
+# ---------------------------------------------------------------------------
+# Zähler
+# ---------------------------------------------------------------------------
+
+class MeterEmulator:
+    """Spielt das Profil ab, integriert Zählerstände und entscheidet über Antwortzeit und Fehler"""
+
+    def __init__(self, profile: List[float], speed: float = 1.0, delay_seconds: float = 1.0, noise_w: float = 8.0,
+                 phase_split: Tuple[float, float, float] = (1 / 3, 1 / 3, 1 / 3),
+                 latency_seconds: float = 0.02, jitter_seconds: float = 0.02, hang_seconds: float = 10.0,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, drop_rate: float = 0.0,
+                 outages: Optional[List[Tuple[float, float]]] = None, battery=None, step_seconds: float = 0.25,
+                 seed: Optional[int] = None):
+        self.profile = profile
+        self.speed = speed
+        self.delay = delay_seconds
+        self.noise = noise_w
+        total = sum(phase_split)
+        self.phase_split = [share / total for share in phase_split]
+        self.latency = latency_seconds
+        self.jitter = jitter_seconds
+        self.hang = hang_seconds
+        self.rates = [(FAULT_ERROR, error_rate), (FAULT_TIMEOUT, timeout_rate), (FAULT_DROP, drop_rate)]
+        self.outages = outages or []  # (Beginn, Dauer) in Sekunden Laufzeit
+        self.battery = battery        # BatteryEmulator im selben Prozess oder None
+        self.step_seconds = step_seconds
+        self.rng = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.samples = deque()        # (Zeitpunkt, Netzleistung) für Messverzögerung und powerAvg
+        self.net_load = 0.0
+        self.grid = 0.0
+        self.import_wh = 0.0
+        self.export_wh = 0.0
+        self.requests = 0
+        self.faults = {FAULT_ERROR: 0, FAULT_TIMEOUT: 0, FAULT_DROP: 0, 'outage': 0}
+        self._running = False
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        return ((now if now is not None else time.time()) - self.started) * self.speed
+
+    def _battery_power(self) -> float:
+        if self.battery is None:
+            return 0.0
+        with self.battery.lock:
+            return sum(battery.power for battery in self.battery.batteries.values())
+
+    def step(self, now: float, seconds: float):
+        """Netzleistung fortschreiben und Zählerstände integrieren"""
+        net_load = self.profile[int(self.elapsed(now)) % len(self.profile)]
+        grid = net_load - self._battery_power()  # Entladen positiv senkt den Bezug
+        with self.lock:
+            hours = seconds * self.speed / 3600
+            if self.grid > 0:
+                self.import_wh += self.grid * hours
+            else:
+                self.export_wh -= self.grid * hours
+            self.net_load = net_load
+            self.grid = grid
+            self.samples.append((now, grid))
+            horizon = now - max(self.delay, POWER_AVG_SECONDS / self.speed) - 1
+            while self.samples and self.samples[0][0] < horizon:
+                self.samples.popleft()
+
+    def _simulate(self, status_interval: float):
+        last = time.time()
+        last_status = last
+        while self._running:
+            time.sleep(self.step_seconds)
+            now = time.time()
+            self.step(now, now - last)
+            last = now
+            if status_interval and now - last_status >= status_interval:
+                last_status = now
+                self._log_status()
+
+    def start(self, status_interval: float = 10):
+        self.started = time.time()
+        self._running = True
+        self.step(self.started, 0)
+        threading.Thread(target=self._simulate, args=(status_interval,), name='meter-emulator', daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    def _log_status(self):
+        status = self.get_status()
+        logger.info(f"Zähler: Netz {status['grid']:+.0f}W, Last {status['net_load']:+.0f}W, "
+                    f"Bezug {status['import_wh']:.0f}Wh, Einspeisung {status['export_wh']:.0f}Wh | "
+                    f"{status['requests']} Abrufe, Fehler {status['faults']}")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'elapsed': round(self.elapsed(), 1), 'net_load': round(self.net_load, 1),
+                    'grid': round(self.grid, 1), 'import_wh': round(self.import_wh, 1),
+                    'export_wh': round(self.export_wh, 1), 'requests': self.requests, 'faults': dict(self.faults)}
+
+    # -- Abruf ---------------------------------------------------------------
+
+    def draw_fault(self) -> Optional[str]:
+        """Fehler für einen Abruf ziehen (Ausfallzeiträume haben Vorrang)"""
+        elapsed = self.elapsed()
+        with self.lock:
+            self.requests += 1
+            if any(begin <= elapsed < begin + duration for begin, duration in self.outages):
+                self.faults['outage'] += 1
+                return FAULT_DROP
+            draw = self.rng.random()
+            for fault, rate in self.rates:
+                if draw < rate:
+                    self.faults[fault] += 1
+                    return fault
+                draw -= rate
+        return None
+
+    def response_delay(self) -> float:
+        with self.lock:
+            return self.latency + self.rng.uniform(0, self.jitter)
+
+    def reading(self) -> Dict[str, Any]:
+        """Messwert mit Verzögerung und Rauschen, Mittelwert und Zählerstände"""
+        now = time.time()
+        with self.lock:
+            measured = self.grid
+            for timestamp, value in self.samples:
+                if timestamp > now - self.delay:
+                    break
+                measured = value
+            measured += self.rng.gauss(0, self.noise) if self.noise else 0.0
+            window = [value for timestamp, value in self.samples if timestamp >= now - POWER_AVG_SECONDS / self.speed]
+            average = sum(window) / len(window) if window else measured
+            return {'power': measured, 'average': average, 'import_wh': self.import_wh, 'export_wh': self.export_wh,
+                    'phases': [measured * share for share in self.phase_split]}
+
+    # -- Antworten im Geräteformat ---------------------------------------------
+
+    def em_status(self, reading: Dict[str, Any]) -> Dict[str, Any]:
+        status: Dict[str, Any] = {'id': 0}
+        for phase, power in zip('abc', reading['phases']):
+            status[f'{phase}_current'] = round(abs(power) / VOLTAGE, 3)
+            status[f'{phase}_voltage'] = VOLTAGE
+            status[f'{phase}_act_power'] = round(power, 1)
+            status[f'{phase}_aprt_power'] = round(abs(power), 1)
+            status[f'{phase}_pf'] = 1.0
+        status['total_current'] = round(sum(abs(power) for power in reading['phases']) / VOLTAGE, 3)
+        status['total_act_power'] = round(reading['power'], 1)
+        status['total_aprt_power'] = round(sum(abs(power) for power in reading['phases']), 1)
+        return status
+
+    def emdata_status(self, reading: Dict[str, Any]) -> Dict[str, Any]:
+        status: Dict[str, Any] = {'id': 0}
+        for phase, share in zip('abc', self.phase_split):
+            status[f'{phase}_total_act_energy'] = round(reading['import_wh'] * share, 2)
+            status[f'{phase}_total_act_ret_energy'] = round(reading['export_wh'] * share, 2)
+        status['total_act'] = round(reading['import_wh'], 2)
+        status['total_act_ret'] = round(reading['export_wh'], 2)
+        return status
+
+    def shelly_status(self, reading: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'em:0': self.em_status(reading),
+            'emdata:0': self.emdata_status(reading),
+            'sys': {'mac': 'EMULATOR0001', 'unixtime': int(time.time()), 'uptime': int(time.time() - self.started)}
+        }
+
+    @staticmethod
+    def shelly_device_info() -> Dict[str, Any]:
+        return {'name': 'Emulator', 'id': 'shellypro3em-emulator0001', 'mac': 'EMULATOR0001',
+                'model': 'SPEM-003CEBEU', 'gen': 2, 'fw_id': 'emulator', 'ver': '1.0.0', 'app': 'Pro3EM',
+                'auth_en': False, 'profile': 'triphase'}
+
+    def ecotracker_status(self, reading: Dict[str, Any]) -> Dict[str, Any]:
+        phases = reading['phases']
+        return {
+            'power': round(reading['power'], 1),
+            'powerPhase1': round(phases[0], 1),
+            'powerPhase2': round(phases[1], 1),
+            'powerPhase3': round(phases[2], 1),
+            'powerAvg': round(reading['average'], 1),
+            'energyCounterIn': round(reading['import_wh'], 1),
+            'energyCounterInT1': round(reading['import_wh'], 1),
+            'energyCounterInT2': 0.0,
+            'energyCounterOut': round(reading['export_wh'], 1)
+        }
+
+
+# ---------------------------------------------------------------------------
+# HTTP-Server
+# ---------------------------------------------------------------------------
+
+class _MeterRequestHandler(BaseHTTPRequestHandler):
+    """Beantwortet Shelly- und EcoTracker-Abrufe; Fehler werden vor der Antwort gezogen"""
+
+    server: 'MeterServer'
+
+    def do_GET(self):
+        meter = self.server.meter
+        routes = {
+            '/rpc/Shelly.GetStatus': lambda: meter.shelly_status(meter.reading()),
+            '/rpc/EM.GetStatus': lambda: meter.em_status(meter.reading()),
+            '/rpc/EMData.GetStatus': lambda: meter.emdata_status(meter.reading()),
+            '/rpc/Shelly.GetDeviceInfo': meter.shelly_device_info,
+            '/v1/json': lambda: meter.ecotracker_status(meter.reading())
+        }
+        route = routes.get(urlsplit(self.path).path)
+        if route is None:
+            self.send_error(404)
+            return
+
+        fault = meter.draw_fault()
+        if fault == FAULT_TIMEOUT:
+            time.sleep(meter.hang)
+            fault = FAULT_DROP
+        if fault == FAULT_DROP:
+            self.close_connection = True
+            return
+        time.sleep(meter.response_delay())
+        if fault == FAULT_ERROR:
+            self.send_error(500)
+            return
+
+        body = json.dumps(route()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class MeterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, meter: MeterEmulator):
+        super().__init__(address, _MeterRequestHandler)
+        self.meter = meter
+
+
+def _parse_outage(text: str) -> Tuple[float, float]:
+    begin, _, duration = text.partition(':')
+    return float(begin), float(duration)
+
+
+def _parse_split(text: str) -> Tuple[float, float, float]:
+    shares = [float(part) for part in text.split(',')]
+    if len(shares) != 3 or sum(shares) <= 0:
+        raise argparse.ArgumentTypeError("Erwartet drei Anteile, z.B. 0.5,0.3,0.2")
+    return shares[0], shares[1], shares[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shelly 3EM Pro und EcoTracker mit Lastprofil emulieren")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--trace', help="Aufzeichnung abspielen (Segment-Verzeichnis, .db, .bin oder .csv)")
+    source.add_argument('--script', help="JSON-Skript mit Laststufen [[Sekunde, Watt], ...]")
+    parser.add_argument('--plant', help="Szenario als JSON-Datei für das synthetische Profil")
+    parser.add_argument('--plant-set', action='append', default=[], metavar='SCHLÜSSEL=WERT',
+                        help="Szenariowert überschreiben, z.B. pv.peak_w=6000")
+    parser.add_argument('--seed', type=int, help="Seed für Profil, Rauschen und Fehler")
+    parser.add_argument('--speed', type=float, default=1.0, help="Abspielgeschwindigkeit des Profils")
+    parser.add_argument('--delay', type=float, default=1.0, help="Alter des Messwerts beim Abruf (s)")
+    parser.add_argument('--noise-w', type=float, default=8, help="Messrauschen (Standardabweichung, W)")
+    parser.add_argument('--phase-split', type=_parse_split, default=(1 / 3, 1 / 3, 1 / 3),
+                        help="Aufteilung auf die Phasen, z.B. 0.5,0.3,0.2")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Antwortzeit je Abruf (ms)")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="Zusätzliche zufällige Antwortzeit bis (ms)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Anteil Abrufe mit HTTP 500 (0-1)")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="Anteil Abrufe ohne Antwort (0-1)")
+    parser.add_argument('--hang-seconds', type=float, default=10, help="Wartezeit bei ausbleibender Antwort (s)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Anteil Abrufe mit Verbindungsabbruch (0-1)")
+    parser.add_argument('--outage', type=_parse_outage, action='append', default=[], metavar='BEGINN:DAUER',
+                        help="Ausfall ab Sekunde BEGINN (Profilzeit) für DAUER Sekunden, mehrfach möglich")
+    parser.add_argument('--battery-port', type=int, help="Akku-Emulator im selben Prozess starten (geschlossener Kreis)")
+    parser.add_argument('--units', default='1,2', help="Unit-IDs des Akku-Emulators")
+    parser.add_argument('--soc', type=float, default=50, help="Anfangs-SoC des Akku-Emulators (%%)")
+    parser.add_argument('--status-interval', type=float, default=10, help="Statuszeile alle x Sekunden (0 = aus)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger('pymodbus').setLevel(logging.WARNING)
+
+    try:
+        if args.trace:
+            profile = recorded_profile(args.trace)
+        elif args.script:
+            profile = scripted_profile(args.script)
+        else:
+            scenario: Dict[str, Any] = {}
+            if args.plant:
+                with open(args.plant, encoding='utf-8') as f:
+                    scenario = json.load(f)
+            scenario = apply_overrides(scenario, dict(parse_override(item) for item in args.plant_set))
+            if args.seed is not None:
+                scenario['seed'] = args.seed
+            profile = synthetic_profile(scenario)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    battery = None
+    if args.battery_port:
+        from simulation.battery_emulator import BatteryEmulator, RS485Bus, _parse_units
+        battery = BatteryEmulator(_parse_units(args.units), RS485Bus(seed=args.seed), initial_soc=args.soc)
+        threading.Thread(target=battery.run, args=(args.host, args.battery_port, args.status_interval),
+                         name='battery-server', daemon=True).start()
+
+    meter = MeterEmulator(
+        profile,
+        speed=args.speed,
+        delay_seconds=args.delay,
+        noise_w=args.noise_w,
+        phase_split=args.phase_split,
+        latency_seconds=args.latency_ms / 1000,
+        jitter_seconds=args.jitter_ms / 1000,
+        hang_seconds=args.hang_seconds,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        drop_rate=args.drop_rate,
+        outages=args.outage,
+        battery=battery,
+        seed=args.seed
+    )
+    server = MeterServer((args.host, args.port), meter)
+    meter.start(args.status_interval)
+    logger.info(f"Zähler-Emulator auf {args.host}:{args.port} - Profil {len(profile)} s, "
+                f"{'geschlossener Kreis' if battery else 'ohne Akku'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        meter.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+"""
+Geschlossener Regelkreis mit nachgebildeter Anlage
+Hauslast (Grundlast, Tagesgang, Geräte), PV-Erzeugung mit Wolken, Akkus mit
+Reaktionsverzögerung, Rampenbegrenzung und SoC-Verlauf sowie ein Zähler mit
+Messverzögerung und Rauschen. Der echte ZeroFeedController und der echte
+BatteryManager (inkl. BatteryClient.set_power) laufen unverändert dagegen -
+Modbus-Verbindung und Zähler werden durch Ersatzobjekte bedient.
+
+Alle Zufallsgrößen hängen nur vom Seed ab: gleicher Seed und gleiche Konfiguration
+liefern identische Kennzahlen.
+
+Aufruf: python -m simulation.plant --seed 7 --hours 24 --set control.min_setpoint_dwell_seconds=10
+"""
+
+import argparse
+import contextlib
+import copy
+import functools
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battery_client
+import power_allocation
+import soc_estimator
+import timing
+import zero_feed_control
+from battery_client import (BatteryManager, REG_485_CONTROL, REG_CHARGE_MODE, REG_CHARGE_POWER,
+                            REG_DISCHARGE_POWER, REG_MANUAL_MODE, REG_MODBUS_ADDRESS, REG_SOC,
+                            REG_TEMPERATURE_1, REG_TEMPERATURE_2)
+from config_loader import ConfigLoader
+from simulation.clock import VirtualClock
+from simulation.replay import (EnergyTotals, SettlingTracker, apply_overrides, format_summary, load_config,
+                               parse_override, quiet, report_line)
+from telemetry_scheduler import SocPollScheduler
+from zero_feed_control import ZeroFeedController
+
+logger = logging.getLogger(__name__)
+
+RS485_ENABLE = 21930  # Wert in REG_485_CONTROL, mit dem externe Sollwerte gelten
+
+# Anlage und Umgebung - alles überschreibbar über --plant bzw. --plant-set
+DEFAULT_SCENARIO: Dict[str, Any] = {
+    'seed': 1,
+    'start': '2026-06-01T00:00:00',
+    'duration_hours': 24,
+    'step_seconds': 0.5,            # Integrationsschritt der Anlage
+    'load': {
+        'profile': 'household',     # 'household' (Morgen-/Abendspitze) oder 'flat'
+        'base_w': 250,              # Grundlast
+        'noise_w': 25,              # Zufällige Schwankung der Grundlast
+        'appliances': [
+            # period_minutes: taktet gleichmäßig (Kühlschrank), sonst per_day zufällige Starts im Zeitfenster hours
+            {'name': 'kuehlschrank', 'power_w': 110, 'minutes': 12, 'period_minutes': 45},
+            {'name': 'wasserkocher', 'power_w': 2000, 'minutes': 3, 'per_day': 4, 'hours': [6, 22]},
+            {'name': 'herd', 'power_w': 1800, 'minutes': 35, 'per_day': 1.5, 'hours': [11, 19]},
+            {'name': 'waschmaschine', 'power_w': 2100, 'minutes': 15, 'per_day': 0.8, 'hours': [8, 20]},
+            {'name': 'staubsauger', 'power_w': 900, 'minutes': 10, 'per_day': 0.5, 'hours': [9, 18]}
+        ]
+    },
+    'pv': {
+        'peak_w': 4000,             # Spitzenleistung bei klarem Himmel
+        'sunrise_hour': 5.5,
+        'sunset_hour': 21.5,
+        'cloudiness': 0.3,          # 0 = wolkenlos, 1 = ständig wechselnde Bewölkung
+        'cloud_minutes': 4,         # Mittlere Dauer einer Abschattung
+        'cloud_depth': 0.6          # Mittlerer Leistungseinbruch unter einer Wolke
+    },
+    'battery': {
+        'initial_soc': 50,          # Zahl oder {"Akku-ID": SoC}
+        'lag_seconds': 1.5,         # Verzögerung zwischen Registerwert und Leistungsänderung
+        'ramp_w_per_second': 600,   # Rampenbegrenzung des Wechselrichters
+        'temperature_c': 25
+    },
+    'meter': {
+        'delay_seconds': 1.0,       # Alter des Messwerts beim Abruf
+        'noise_w': 8,               # Messrauschen (Standardabweichung)
+        'latency_seconds': 0.05     # Dauer eines HTTP-Abrufs
+    },
+    'modbus': {
+        'latency_seconds': 0.03     # Dauer je Verbindungsaufbau/Registerzugriff
+    },
+    'kpi': {
+        'step_threshold_w': 200,    # Lastsprung für die Einschwingzeit
+        'band_tolerance_w': 50,
+        'settle_timeout_seconds': 120
+    }
+}
+
+
+def merge_scenario(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    """Überlagert verschachtelte Szenario-Werte (Kopie)"""
+    result = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge_scenario(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Last- und PV-Profile (sekundengenau vorausberechnet)
+# ---------------------------------------------------------------------------
+
+# Tagesgang der Grundlast je Stunde (Faktor), Haushalt mit Morgen- und Abendspitze
+HOUSEHOLD_SHAPE = [0.8, 0.75, 0.7, 0.7, 0.7, 0.8, 1.1, 1.4, 1.3, 1.1, 1.0, 1.1,
+                   1.3, 1.2, 1.0, 1.0, 1.1, 1.4, 1.7, 1.8, 1.6, 1.4, 1.1, 0.9]
+
+
+def _day_hour(timestamp: float) -> float:
+    moment = datetime.fromtimestamp(timestamp)
+    return moment.hour + moment.minute / 60 + moment.second / 3600
+
+
+def build_load_profile(config: Dict[str, Any], start: float, seconds: int, rng: random.Random) -> List[float]:
+    """Hauslast in W für jede Sekunde ab start"""
+    base = config['base_w']
+    noise = config['noise_w']
+    shaped = config['profile'] == 'household'
+    start_hour = _day_hour(start)
+
+    load = []
+    wander = 0.0
+    for second in range(seconds):
+        if second % 10 == 0:
+            # Langsame Zufallsbewegung, zur Grundlast zurückgezogen
+            wander = 0.9 * wander + rng.gauss(0, noise * 0.45)
+        factor = HOUSEHOLD_SHAPE[int(start_hour + second / 3600) % 24] if shaped else 1.0
+        load.append(max(0.0, base * factor + wander))
+
+    days = seconds / 86400
+    for appliance in config['appliances']:
+        power = appliance['power_w']
+        duration = int(appliance['minutes'] * 60)
+        if appliance.get('period_minutes'):
+            period = int(appliance['period_minutes'] * 60)
+            starts = range(rng.randrange(period), seconds, period)
+        else:
+            first_hour, last_hour = appliance.get('hours', [0, 24])
+            count = _poisson(rng, appliance.get('per_day', 1) * days)
+            starts = []
+            for _ in range(count):
+                day = rng.randrange(max(1, math.ceil(days)))
+                offset = (day * 24 + rng.uniform(first_hour, last_hour) - start_hour) * 3600
+                if 0 <= offset < seconds:
+                    starts.append(int(offset))
+        for begin in starts:
+            for second in range(begin, min(begin + duration, seconds)):
+                load[second] += power
+    return load
+
+
+def build_pv_profile(config: Dict[str, Any], start: float, seconds: int, rng: random.Random) -> List[float]:
+    """PV-Erzeugung in W für jede Sekunde ab start (Sinusbogen mit zufälligen Abschattungen)"""
+    peak = config['peak_w']
+    sunrise, sunset = config['sunrise_hour'], config['sunset_hour']
+    start_hour = _day_hour(start)
+
+    # Wolken als Folge von Ereignissen mit exponentialverteilten Abständen und Dauern
+    shading = [1.0] * seconds
+    cloudiness = config['cloudiness']
+    if cloudiness > 0:
+        mean_gap = config['cloud_minutes'] * 60 * (1 - cloudiness) / cloudiness + 30
+        second = int(rng.expovariate(1 / mean_gap))
+        while second < seconds:
+            duration = max(10, int(rng.expovariate(1 / (config['cloud_minutes'] * 60))))
+            depth = min(0.95, max(0.1, rng.gauss(config['cloud_depth'], 0.15)))
+            for index in range(second, min(second + duration, seconds)):
+                shading[index] = 1 - depth
+            second += duration + int(rng.expovariate(1 / mean_gap))
+
+    pv = []
+    for second in range(seconds):
+        hour = (start_hour + second / 3600) % 24
+        if sunrise < hour < sunset:
+            elevation = math.sin(math.pi * (hour - sunrise) / (sunset - sunrise))
+            pv.append(peak * elevation ** 1.3 * shading[second])
+        else:
+            pv.append(0.0)
+    return pv
+
+
+def build_profiles(scenario: Dict[str, Any], start: float, seconds: int, seed) -> Tuple[List[float], List[float]]:
+    """
+    Hauslast und PV für einen Seed - gleicher Seed ergibt denselben Tag in Anlage, Sweep und Zähler-Emulator
+    Getrennte Zufallsquellen, damit z.B. eine andere Geräteliste die Wolken nicht verschiebt
+    """
+    load = build_load_profile(scenario['load'], start, seconds, random.Random(f"{seed}:load"))
+    pv = build_pv_profile(scenario['pv'], start, seconds, random.Random(f"{seed}:pv"))
+    return load, pv
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    count, threshold, product = 0, math.exp(-mean), rng.random()
+    while product > threshold:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+# ---------------------------------------------------------------------------
+# Anlage
+# ---------------------------------------------------------------------------
+
+class PlantBattery:
+    """
+    Akku mit Registerabbild wie Marstek/Duravolt
+    Ein geschriebener Sollwert wirkt erst nach lag_seconds und wird mit ramp_w_per_second angefahren.
+    """
+
+    def __init__(self, unit_id: int, capacity_wh: float, soc: float, lag_seconds: float, ramp_w_per_second: float,
+                 max_power: float = 2500, charge_efficiency: float = 0.95, discharge_efficiency: float = 0.95,
+                 temperature_c: float = 25.0):
+        self.unit_id = unit_id
+        self.capacity_wh = capacity_wh
+        self.soc = float(soc)
+        self.lag_seconds = lag_seconds
+        self.ramp = ramp_w_per_second
+        self.max_power = max_power
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+        self.temperature_c = temperature_c
+        self.registers: Dict[int, int] = {
+            REG_485_CONTROL: 0, REG_CHARGE_MODE: 0, REG_CHARGE_POWER: 0, REG_DISCHARGE_POWER: 0,
+            REG_MANUAL_MODE: 0, REG_MODBUS_ADDRESS: unit_id
+        }
+        self.power = 0.0       # Wirksame Leistung (Entladen positiv)
+        self.target = 0.0      # Angefahrener Sollwert
+        self._pending: deque = deque()  # (wirksam ab, Sollwert)
+        self.charged_wh = 0.0
+        self.discharged_wh = 0.0
+
+    def commanded_power(self) -> float:
+        """Sollwert aus den Registern (Entladen positiv)"""
+        if self.registers[REG_485_CONTROL] != RS485_ENABLE:
+            return 0.0
+        mode = self.registers[REG_CHARGE_MODE]
+        if mode == 1:
+            return -min(self.registers[REG_CHARGE_POWER], self.max_power)
+        if mode == 2:
+            return min(self.registers[REG_DISCHARGE_POWER], self.max_power)
+        return 0.0
+
+    def read_register(self, address: int) -> Optional[int]:
+        if address == REG_SOC:
+            return int(round(self.soc))
+        if address in (REG_TEMPERATURE_1, REG_TEMPERATURE_2):
+            return int(round(self.temperature_c * 10))  # 0,1 °C
+        return self.registers.get(address)
+
+    def write_register(self, address: int, value: int, now: float) -> bool:
+        if address not in self.registers or address == REG_MODBUS_ADDRESS:
+            return False
+        self.registers[address] = value & 0xFFFF
+        self._pending.append((now + self.lag_seconds, self.commanded_power()))
+        return True
+
+    def step(self, now: float, seconds: float):
+        while self._pending and self._pending[0][0] <= now:
+            self.target = self._pending.popleft()[1]
+
+        # BMS: volle bzw. leere Zellen nehmen nichts mehr auf bzw. geben nichts mehr ab
+        target = self.target
+        if (target < 0 and self.soc >= 100) or (target > 0 and self.soc <= 0):
+            target = 0.0
+        max_change = self.ramp * seconds
+        self.power += max(-max_change, min(max_change, target - self.power))
+
+        if self.power > 0:
+            energy = self.power / self.discharge_efficiency * seconds / 3600
+            self.discharged_wh += self.power * seconds / 3600
+        else:
+            energy = self.power * self.charge_efficiency * seconds / 3600
+            self.charged_wh -= self.power * seconds / 3600
+        if self.capacity_wh > 0:
+            self.soc = min(100.0, max(0.0, self.soc - energy / self.capacity_wh * 100))
+
+
+class Plant:
+    """Haus, PV und Akkus hinter dem Zähler - wird bei jedem Zugriff bis zur aktuellen (virtuellen) Zeit nachgeführt"""
+
+    def __init__(self, scenario: Dict[str, Any], battery_config: Dict[str, Any], clock: VirtualClock,
+                 net_load: Optional[List[float]] = None):
+        self.scenario = scenario
+        self.clock = clock
+        self.start = clock.now
+        self.step_seconds = scenario['step_seconds']
+        seconds = int(scenario['duration_hours'] * 3600) + 1
+        seed = scenario['seed']
+
+        if net_load is not None:
+            # Aufgezeichnete Last hinter dem Zähler statt Haus- und PV-Modell
+            self.load = [float(value) for value in net_load]
+            self.pv = [0.0] * len(self.load)
+        else:
+            self.load, self.pv = build_profiles(scenario, self.start, seconds, seed)
+        self._meter_rng = random.Random(f"{seed}:meter")
+
+        allocator = power_allocation.PowerAllocator.from_config(battery_config)
+        battery_scenario = scenario['battery']
+        initial_soc = battery_scenario['initial_soc']
+        self.batteries: Dict[int, PlantBattery] = {}
+        for akku_id in battery_config['akku_ids']:
+            soc = initial_soc.get(str(akku_id), 50) if isinstance(initial_soc, dict) else initial_soc
+            self.batteries[akku_id] = PlantBattery(
+                akku_id,
+                capacity_wh=allocator.get_capacity(akku_id),
+                soc=soc,
+                lag_seconds=battery_scenario['lag_seconds'],
+                ramp_w_per_second=battery_scenario['ramp_w_per_second'],
+                max_power=battery_config['max_power_per_battery'],
+                charge_efficiency=battery_config.get('charge_efficiency', 0.95),
+                discharge_efficiency=battery_config.get('discharge_efficiency', 0.95),
+                temperature_c=battery_scenario['temperature_c']
+            )
+
+        meter = scenario['meter']
+        self.meter_delay = meter['delay_seconds']
+        self.meter_noise = meter['noise_w']
+        self.modbus_latency = scenario['modbus']['latency_seconds']
+        self._samples: deque = deque()  # (Zeit, Netzleistung) für den verzögerten Zähler
+
+        self.t = self.start
+        self.grid = self.net_load(self.start)
+        self.totals = EnergyTotals()
+        self.settling: Optional[SettlingTracker] = None
+        self.load_wh = self.pv_wh = 0.0
+        self.soc_min = self.soc_max = None
+        self.modbus_requests = 0
+        self.modbus_writes = 0
+        self.setpoint_writes = 0  # set_power-Aufrufe (beginnen immer mit der RS485-Kontrolle)
+
+    def net_load(self, timestamp: float) -> float:
+        """Last minus PV (ohne Akkus)"""
+        index = min(int(timestamp - self.start), len(self.load) - 1)
+        return self.load[index] - self.pv[index]
+
+    def advance(self, now: float):
+        """Anlage in festen Schritten bis now integrieren"""
+        step = self.step_seconds
+        while self.t + step <= now:
+            t = self.t
+            index = min(int(t - self.start), len(self.load) - 1)
+            load, pv = self.load[index], self.pv[index]
+            battery_power = 0.0
+            for battery in self.batteries.values():
+                battery.step(t, step)
+                battery_power += battery.power
+            net = load - pv
+            self.grid = net - battery_power
+            self.totals.add(self.grid, step)
+            self.load_wh += load * step / 3600
+            self.pv_wh += pv * step / 3600
+            if self.settling is not None:
+                self.settling.update(t, net, self.grid)
+            self._samples.append((t, self.grid))
+            while len(self._samples) > 1 and self._samples[1][0] <= t - self.meter_delay:
+                self._samples.popleft()
+            self.t = t + step
+
+        socs = [battery.soc for battery in self.batteries.values()]
+        self.soc_min = min(socs) if self.soc_min is None else min(self.soc_min, *socs)
+        self.soc_max = max(socs) if self.soc_max is None else max(self.soc_max, *socs)
+
+    def measured_grid(self) -> float:
+        """Zählerwert: Netzleistung vor delay_seconds plus Messrauschen"""
+        self.advance(self.clock.now)
+        cutoff = self.clock.now - self.meter_delay
+        value = self._samples[0][1] if self._samples else self.grid
+        for timestamp, grid in self._samples:
+            if timestamp > cutoff:
+                break
+            value = grid
+        return round(value + self._meter_rng.gauss(0, self.meter_noise), 1)
+
+    def modbus_request(self):
+        """Ein Telegramm auf dem Bus: Zeit vergeht, danach gilt der Anlagenzustand dieses Moments"""
+        self.clock.sleep(self.modbus_latency)
+        self.modbus_requests += 1
+        self.advance(self.clock.now)
+
+
+# ---------------------------------------------------------------------------
+# Ersatzobjekte für Zähler und Modbus
+# ---------------------------------------------------------------------------
+
+class PlantMeter:
+    """Zähler mit der Schnittstelle von ShellyClient/EcoTrackerClient (Mittel der letzten 3 Abrufe)"""
+
+    def __init__(self, plant: Plant, latency_seconds: float):
+        self.plant = plant
+        self.latency = latency_seconds
+        self.power_history: deque = deque(maxlen=3)
+        self.failure_count = 0
+        self.polls = 0
+
+    def poll_current_power(self) -> Optional[float]:
+        self.plant.clock.sleep(self.latency)
+        power = self.plant.measured_grid()
+        self.power_history.append({'power': power, 'timestamp': self.plant.clock.now})
+        self.polls += 1
+        return power
+
+    def get_current_power_direct(self) -> Optional[float]:
+        return self.poll_current_power()
+
+    def get_power(self) -> Optional[float]:
+        if not self.power_history:
+            return None
+        return sum(entry['power'] for entry in self.power_history) / len(self.power_history)
+
+    def get_cached_power(self) -> Optional[float]:
+        return self.power_history[-1]['power'] if self.power_history else None
+
+
+class PlantResponse:
+    """Antwort im Stil der pymodbus-Responses (isError(), registers)"""
+
+    def __init__(self, registers: Optional[List[int]] = None, error: Optional[str] = None):
+        self.registers = registers or []
+        self.error = error
+
+    def isError(self) -> bool:
+        return self.error is not None
+
+    def __str__(self) -> str:
+        return f"PlantResponse({self.error or self.registers})"
+
+
+class PlantModbusClient:
+    """Ersatz für ModbusTcpClient: Unit-ID = Akku-ID, jeder Zugriff kostet Buslaufzeit"""
+
+    def __init__(self, plant: Plant, host: str = '', port: int = 502, timeout: float = 3, **kwargs):
+        self.plant = plant
+        self.connected = False
+
+    def connect(self) -> bool:
+        self.plant.modbus_request()
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def read_holding_registers(self, address: int, count: int = 1, slave: int = 1) -> PlantResponse:
+        self.plant.modbus_request()
+        battery = self.plant.batteries.get(slave)
+        if battery is None:
+            return PlantResponse(error=f"Keine Antwort von Unit {slave}")
+        values = [battery.read_register(address + offset) for offset in range(count)]
+        if any(value is None for value in values):
+            return PlantResponse(error=f"Illegal data address {address}")
+        return PlantResponse(values)
+
+    def write_register(self, address: int, value: int, slave: int = 1) -> PlantResponse:
+        self.plant.modbus_request()
+        battery = self.plant.batteries.get(slave)
+        if battery is None:
+            return PlantResponse(error=f"Keine Antwort von Unit {slave}")
+        if not battery.write_register(address, value, self.plant.clock.now):
+            return PlantResponse(error=f"Illegal data address {address}")
+        self.plant.modbus_writes += 1
+        if address == REG_485_CONTROL:
+            self.plant.setpoint_writes += 1
+        return PlantResponse([value])
+
+
+@contextlib.contextmanager
+def _patched(module, name: str, value) -> Iterator[None]:
+    original = getattr(module, name)
+    setattr(module, name, value)
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+def simulate(scenario: Dict[str, Any], config: ConfigLoader, net_load: Optional[List[float]] = None) -> Dict[str, Any]:
+    """
+    Betreibt Regler und BatteryManager wie run_main_loop (Zähler jede Sekunde,
+    Regelzyklus alle poll_interval_seconds, adaptive SoC-Lesungen) gegen die Anlage
+    net_load: sekundengenaue Last hinter dem Zähler (ab scenario['start']) statt Haus- und PV-Modell
+    """
+    scenario = merge_scenario(DEFAULT_SCENARIO, scenario)
+    start = datetime.fromisoformat(scenario['start']).timestamp()
+    end = start + scenario['duration_hours'] * 3600
+
+    battery_config = config.get_battery_config()
+    control_config = config.get_control_config()
+    control_interval = control_config.get('poll_interval_seconds', 2)
+    adaptive = control_config.get('adaptive_soc_polling', True)
+    soc_interval = control_config.get('soc_update_interval_seconds', 30)
+
+    clock = VirtualClock(start)
+    plant = Plant(scenario, battery_config, clock, net_load)
+    meter = PlantMeter(plant, scenario['meter']['latency_seconds'])
+
+    cycles = failed_cycles = 0
+    wall_start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(clock.installed(zero_feed_control, battery_client, power_allocation, soc_estimator, timing))
+        stack.enter_context(_patched(battery_client, 'ModbusTcpClient', functools.partial(PlantModbusClient, plant)))
+        stack.enter_context(quiet({zero_feed_control.__name__: logging.WARNING,
+                                   battery_client.__name__: logging.ERROR,
+                                   power_allocation.__name__: logging.WARNING}))
+
+        batteries = BatteryManager(
+            ip=battery_config['ip'],
+            port=battery_config['port'],
+            akku_ids=battery_config['akku_ids'],
+            timeout=battery_config.get('timeout_seconds', 3),
+            allocation_config=battery_config
+        )
+        controller = ZeroFeedController(meter, batteries, config)
+        scheduler = SocPollScheduler(
+            akku_ids=battery_config['akku_ids'],
+            min_interval=control_config.get('soc_poll_min_seconds', 10) if adaptive else soc_interval,
+            max_interval=control_config.get('soc_poll_max_seconds', 120) if adaptive else soc_interval,
+            max_power=battery_config['max_power_per_battery'],
+            min_soc=battery_config['min_soc_for_discharge'],
+            max_soc=battery_config['max_soc_for_charge'],
+            near_limit_margin=control_config.get('soc_poll_near_limit_percent', 5),
+            min_spacing=control_config.get('soc_poll_spacing_seconds', 3)
+        )
+        kpi = scenario['kpi']
+        band = (controller.target_grid_power_charge - kpi['band_tolerance_w'],
+                controller.target_grid_power_discharge + kpi['band_tolerance_w'])
+        plant.settling = SettlingTracker(band, kpi['step_threshold_w'], kpi['settle_timeout_seconds'])
+
+        last_meter_poll = last_control = 0.0
+        while clock.now < end:
+            current_time = clock.now
+            if current_time - last_meter_poll >= 1:
+                meter.poll_current_power()
+                last_meter_poll = current_time
+
+            if current_time - last_control >= control_interval:
+                success, _ = controller.execute_control_cycle()
+                cycles += 1
+                failed_cycles += 0 if success else 1
+                last_control = current_time
+
+            for akku_id, battery in batteries.batteries.items():
+                scheduler.update_load(akku_id, current_time, battery.get_soc(), battery.current_power)
+            due_akku_id = scheduler.get_due(current_time)
+            if due_akku_id is not None:
+                batteries.update_soc(due_akku_id)
+                battery = batteries.batteries[due_akku_id]
+                scheduler.mark_read(due_akku_id, current_time, battery.get_soc(), battery.current_power)
+
+            clock.sleep(1)
+        plant.advance(end)
+
+    wall_seconds = time.perf_counter() - wall_start
+    duration = end - start
+    totals = plant.totals.to_dict(duration)
+    return {
+        'seed': scenario['seed'],
+        'start': scenario['start'],
+        'simulated_hours': scenario['duration_hours'],
+        'cycles': cycles,
+        'failed_cycles': failed_cycles,
+        'load_kwh': round(plant.load_wh / 1000, 3),
+        'pv_kwh': round(plant.pv_wh / 1000, 3),
+        **totals,
+        'self_consumption_percent': round(100 * (1 - totals['grid_export_kwh'] * 1000 / plant.pv_wh), 1) if plant.pv_wh > 0 else None,
+        'autarky_percent': round(100 * (1 - totals['grid_import_kwh'] * 1000 / plant.load_wh), 1) if plant.load_wh > 0 else None,
+        'battery_charged_kwh': round(sum(b.charged_wh for b in plant.batteries.values()) / 1000, 3),
+        'battery_discharged_kwh': round(sum(b.discharged_wh for b in plant.batteries.values()) / 1000, 3),
+        'mode_switches': controller.mode_change_count,
+        'setpoint_writes': plant.setpoint_writes,
+        'modbus_writes': plant.modbus_writes,
+        'modbus_requests': plant.modbus_requests,
+        'writes_avoided': dict(controller.writes_avoided_by_reason),
+        'settling': plant.settling.summary(),
+        'target_band_w': list(band),
+        'soc_range': [round(plant.soc_min, 1), round(plant.soc_max, 1)],
+        'final_soc': {akku_id: round(battery.soc, 1) for akku_id, battery in plant.batteries.items()},
+        'wall_seconds': round(wall_seconds, 2),
+        'speedup': round(duration / wall_seconds) if wall_seconds > 0 else None
+    }
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    return format_summary(
+        result,
+        report_line("Szenario", f"Seed {result['seed']}, ab {result['start']}, {result['simulated_hours']} h"),
+        [
+            report_line("Last / PV", f"{result['load_kwh']} kWh / {result['pv_kwh']} kWh"),
+            report_line("Netzbezug", f"{result['grid_import_kwh']} kWh (Autarkie {result['autarky_percent']}%)"),
+            report_line("Einspeisung", f"{result['grid_export_kwh']} kWh (Eigenverbrauch {result['self_consumption_percent']}%)"),
+            report_line("Mittl. |Netz|", f"{result['mean_abs_grid_w']} W"),
+            report_line("Akku", f"{result['battery_charged_kwh']} kWh geladen, {result['battery_discharged_kwh']} kWh entladen, "
+                                f"SoC {result['soc_range'][0]}-{result['soc_range'][1]}%")
+        ],
+        f"{result['modbus_writes']} Modbus-Schreibvorgänge, {result['modbus_requests']} Telegramme"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regler gegen eine nachgebildete Anlage laufen lassen")
+    parser.add_argument('--config', help="Konfiguration (Standard: config.json bzw. config.example.json)")
+    parser.add_argument('--plant', help="Szenario als JSON-Datei (überlagert die Standardanlage)")
+    parser.add_argument('--seed', type=int, help="Zufalls-Seed (gleicher Seed = gleiche Kennzahlen)")
+    parser.add_argument('--hours', type=float, help="Simulierte Dauer in Stunden")
+    parser.add_argument('--set', action='append', default=[], metavar='SCHLÜSSEL=WERT',
+                        help="Konfigurationswert überschreiben, z.B. control.poll_interval_seconds=3")
+    parser.add_argument('--plant-set', action='append', default=[], metavar='SCHLÜSSEL=WERT',
+                        help="Szenariowert überschreiben, z.B. pv.peak_w=6000")
+    parser.add_argument('--json', action='store_true', help="Kennzahlen als JSON ausgeben")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        config = load_config(args.config, dict(parse_override(item) for item in args.set))
+        scenario: Dict[str, Any] = {}
+        if args.plant:
+            with open(args.plant, encoding='utf-8') as f:
+                scenario = json.load(f)
+        scenario = apply_overrides(scenario, dict(parse_override(item) for item in args.plant_set))
+        if args.seed is not None:
+            scenario['seed'] = args.seed
+        if args.hours is not None:
+            scenario['duration_hours'] = args.hours
+        result = simulate(scenario, config)
+    except (OSError, ValueError, RuntimeError, KeyError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False) if args.json else format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+Offline-Replay für den ZeroFeedController
+Spielt aufgezeichnete Zähler- und SoC-Verläufe durch den echten Regelzyklus
+(_calculate_optimal_control, _apply_rate_limiting, Schreibunterdrückung) - mit
+nachgebildetem Zähler und Akkus und virtueller Uhr, tausendfach schneller als Echtzeit.
+
+Aus den Aufzeichnungen wird die Last hinter dem Zähler rekonstruiert
+(Netzleistung + damals wirksame Akkuleistung). Das Replay rechnet damit die
+Netzleistung aus, die mit dem Regler in der aktuellen Konfiguration entstanden wäre.
+
+Aufruf: python -m simulation.replay history/ --from 2026-06-01 --to 2026-06-02 --set control.poll_interval_seconds=3
+"""
+
+import argparse
+import contextlib
+import copy
+import csv
+import glob
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battery_client
+import power_allocation
+import timing
+import zero_feed_control
+from battery_client import BatteryManager
+from config_loader import ConfigLoader
+from flight_recorder import read_records as read_flight_records
+from history_store import SEGMENT_SUFFIX, HistoryStore, decode_record, read_timestamp
+from power_allocation import PowerAllocator
+from simulation.clock import VirtualClock
+from zero_feed_control import ZeroFeedController
+
+logger = logging.getLogger(__name__)
+
+# Längere Lücken in der Aufzeichnung (Ausfall, Neustart) werden nicht integriert
+MAX_GAP_SECONDS = 30
+
+# Modbus-Schreibvorgänge und Pausen je Sollwert wie in BatteryClient.set_power
+WRITES_SAME_MODE = 2       # RS485-Kontrolle + Leistung
+WRITES_MODE_CHANGE = 4     # RS485-Kontrolle + Gegenleistung 0 + Modus + Leistung
+WRITES_STOP = 4            # RS485-Kontrolle + Laden 0 + Entladen 0 + Modus 0
+SLEEP_SAME_MODE = 0.1
+SLEEP_MODE_CHANGE = 0.8
+SLEEP_STOP = 0.3
+
+DEFAULT_CONFIG_FILES = ('config.json', 'config.example.json')
+
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+def parse_override(text: str) -> Tuple[str, Any]:
+    """'control.poll_interval_seconds=3' -> ('control.poll_interval_seconds', 3)"""
+    key, _, raw = text.partition('=')
+    if not key or not _:
+        raise ValueError(f"Erwartet Schlüssel=Wert: {text}")
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    return key.strip(), value
+
+
+def apply_overrides(data: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Setzt Werte über Punkt-Notation (Kopie, das Original bleibt unverändert)"""
+    result = copy.deepcopy(data)
+    for path, value in overrides.items():
+        target = result
+        parts = path.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return result
+
+
+def load_config(path: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None) -> ConfigLoader:
+    """Lädt config.json (bzw. config.example.json) und wendet Overrides an"""
+    if path is None:
+        path = next((candidate for candidate in DEFAULT_CONFIG_FILES if os.path.exists(candidate)),
+                    DEFAULT_CONFIG_FILES[0])
+    loader = ConfigLoader(path)
+    loader.load()
+    if overrides:
+        loader.config = apply_overrides(loader.config, overrides)
+    return loader
+
+
+# ---------------------------------------------------------------------------
+# Aufzeichnungen
+# ---------------------------------------------------------------------------
+
+class Trace:
+    """Last hinter dem Zähler über der Zeit (Haltewert bis zum nächsten Punkt)"""
+
+    def __init__(self, times: List[float], net_load: List[float], recorded_grid: List[Optional[float]],
+                 initial_soc: Dict[int, float], source: str):
+        self.times = times
+        self.net_load = net_load
+        self.recorded_grid = recorded_grid  # Tatsächlich gemessene Netzleistung (Vergleichswert)
+        self.initial_soc = initial_soc
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1] - self.times[0] if self.times else 0.0
+
+    @property
+    def resolution(self) -> float:
+        """Typischer Abstand der Punkte (Median)"""
+        gaps = sorted(b - a for a, b in zip(self.times, self.times[1:]) if b > a)
+        return gaps[len(gaps) // 2] if gaps else 1.0
+
+    def window(self, start: Optional[float], end: Optional[float]) -> 'Trace':
+        indices = [i for i, t in enumerate(self.times)
+                   if (start is None or t >= start) and (end is None or t <= end)]
+        return Trace([self.times[i] for i in indices], [self.net_load[i] for i in indices],
+                     [self.recorded_grid[i] for i in indices], self.initial_soc, self.source)
+
+
+def _signed_battery_power(batteries: Dict[Any, Dict[str, Any]]) -> float:
+    """Summe der Akku-Sollwerte mit Vorzeichen (Entladen positiv)"""
+    sign = {1: -1, 2: 1}
+    return sum(sign.get(battery['mode'], 0) * battery['power'] for battery in batteries.values())
+
+
+def trace_from_cycles(records: List[Dict[str, Any]], meter_samples: Optional[List[Tuple[float, Optional[float]]]] = None,
+                      source: str = 'history') -> Trace:
+    """
+    Rekonstruiert die Last aus Regelzyklen (Verlauf/Flugschreiber)
+    Der Zählerwert eines Zyklus zeigt noch die Akkuleistung des vorherigen Zyklus.
+    Mit 1-s-Zählerwerten (SQLite) wird die Last sekundengenau rekonstruiert.
+    """
+    records = [r for r in records if r.get('grid_power') is not None or meter_samples]
+    initial_soc = {}
+    for record in records:
+        for akku_id, battery in record['batteries'].items():
+            if battery.get('soc') is not None and int(akku_id) not in initial_soc:
+                initial_soc[int(akku_id)] = battery['soc']
+
+    times, loads, grids = [], [], []
+    if meter_samples:
+        index = -1
+        for timestamp, power in meter_samples:
+            if power is None:
+                continue
+            while index + 1 < len(records) and records[index + 1]['timestamp'] < timestamp:
+                index += 1
+            battery = _signed_battery_power(records[index]['batteries']) if index >= 0 else 0.0
+            times.append(timestamp)
+            loads.append(power + battery)
+            grids.append(power)
+    else:
+        previous_battery = None
+        for record in records:
+            battery_after = _signed_battery_power(record['batteries'])
+            if previous_battery is not None and record['grid_power'] is not None:
+                times.append(record['timestamp'])
+                loads.append(record['grid_power'] + previous_battery)
+                grids.append(record['grid_power'])
+            previous_battery = battery_after
+    return Trace(times, loads, grids, initial_soc, source)
+
+
+def load_history_segments(directory: str, start: Optional[float] = None, end: Optional[float] = None) -> Trace:
+    """Liest Segmentdateien direkt (nur lesend - kein Reparieren oder Aufräumen wie im HistoryStore)"""
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, f"*{SEGMENT_SUFFIX}")),
+                       key=lambda p: int(os.path.basename(p)[:-len(SEGMENT_SUFFIX)])):
+        with open(path, 'rb') as f:
+            data = f.read()
+        for body, _ in HistoryStore._scan(data):
+            timestamp = read_timestamp(body)
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                records.append(decode_record(body))
+    return trace_from_cycles(records, source=directory)
+
+
+def load_sqlite(path: str, start: Optional[float] = None, end: Optional[float] = None) -> Trace:
+    """Liest Zyklen und 1-s-Zählerwerte aus der SQLite-Datenbank (nur lesend)"""
+    start_ms = int((start or 0) * 1000)
+    end_ms = int((end or 1e11) * 1000)
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        batteries: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        for ts_ms, akku_id, mode, power, soc in connection.execute(
+                "SELECT ts_ms, akku_id, mode, power, soc FROM battery_samples WHERE ts_ms BETWEEN ? AND ?",
+                (start_ms, end_ms)):
+            batteries.setdefault(ts_ms, {})[akku_id] = {'mode': mode, 'power': power, 'soc': soc}
+        records = [{'timestamp': ts_ms / 1000, 'grid_power': grid, 'batteries': batteries.get(ts_ms, {})}
+                   for ts_ms, grid in connection.execute(
+                       "SELECT ts_ms, grid FROM cycles WHERE ts_ms BETWEEN ? AND ? ORDER BY ts_ms", (start_ms, end_ms))]
+        samples = [(ts_ms / 1000, power) for ts_ms, power in connection.execute(
+            "SELECT ts_ms, power FROM meter_samples WHERE ts_ms BETWEEN ? AND ? ORDER BY ts_ms", (start_ms, end_ms))]
+    finally:
+        connection.close()
+    return trace_from_cycles(records, samples or None, source=path)
+
+
+def load_flight_recorder(path: str) -> Trace:
+    records = [{
+        'timestamp': record['timestamp'],
+        'grid_power': record['grid_raw'],
+        'batteries': {battery['id']: {'mode': battery['mode'], 'power': abs(battery['power']), 'soc': battery['soc']}
+                      for battery in record['batteries']}
+    } for record in read_flight_records(path) if not record['meter_outage']]
+    return trace_from_cycles(records, source=path)
+
+
+def _parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def load_csv(path: str) -> Trace:
+    """
+    CSV-Export des Flugschreibers oder eigene Messreihe mit den Spalten
+    time/timestamp, grid (W) und optional battery (wirksame Akkuleistung, Entladen positiv), soc
+    bzw. direkt net_load (Last hinter dem Zähler)
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        return Trace([], [], [], {}, path)
+
+    if 'grid_raw_w' in rows[0]:
+        # Flugschreiber-Export
+        akku_ids = sorted(int(key[4:]) for key in rows[0] if key.startswith('soc_'))
+        records = []
+        for row in rows:
+            if row['meter_outage'] == '1' or not row['grid_raw_w']:
+                continue
+            records.append({
+                'timestamp': _parse_time(row['time']),
+                'grid_power': float(row['grid_raw_w']),
+                'batteries': {akku_id: {'mode': int(row[f'mode_{akku_id}']),
+                                        'power': abs(float(row[f'power_{akku_id}'])),
+                                        'soc': float(row[f'soc_{akku_id}']) if row[f'soc_{akku_id}'] else None}
+                              for akku_id in akku_ids}
+            })
+        return trace_from_cycles(records, source=path)
+
+    time_key = 'timestamp' if 'timestamp' in rows[0] else 'time'
+    times, loads, grids = [], [], []
+    for row in rows:
+        grid = float(row['grid']) if row.get('grid') not in (None, '') else None
+        if row.get('net_load') not in (None, ''):
+            load = float(row['net_load'])
+        elif grid is not None:
+            load = grid + float(row.get('battery') or 0)
+        else:
+            continue
+        times.append(_parse_time(row[time_key]))
+        loads.append(load)
+        grids.append(grid)
+    initial_soc = {}
+    if rows[0].get('soc'):
+        initial_soc = {0: float(rows[0]['soc'])}  # Gilt für alle Akkus
+    return Trace(times, loads, grids, initial_soc, path)
+
+
+def load_trace(source: str, start: Optional[float] = None, end: Optional[float] = None) -> Trace:
+    """Erkennt die Quelle: Segment-Verzeichnis, SQLite-Datei (.db), Flugschreiber (.bin) oder CSV"""
+    if os.path.isdir(source):
+        return load_history_segments(source, start, end)
+    if source.endswith('.db'):
+        return load_sqlite(source, start, end)
+    if source.endswith('.bin'):
+        return load_flight_recorder(source).window(start, end)
+    if source.endswith('.csv'):
+        return load_csv(source).window(start, end)
+    raise ValueError(f"Unbekannte Quelle: {source}")
+
+
+# ---------------------------------------------------------------------------
+# Nachgebildete Geräte
+# ---------------------------------------------------------------------------
+
+class ReplayMeter:
+    """Zähler, der den von der Simulation berechneten Netzwert liefert"""
+
+    def __init__(self):
+        self.value: Optional[float] = 0.0
+        self.failure_count = 0
+        self.polls = 0
+
+    def poll_current_power(self) -> Optional[float]:
+        self.polls += 1
+        return self.value
+
+    def get_current_power_direct(self) -> Optional[float]:
+        return self.poll_current_power()
+
+    def get_cached_power(self) -> Optional[float]:
+        return self.value
+
+
+class ReplayBattery:
+    """Akku mit sofort wirksamem Sollwert und SoC aus der Energiebilanz, zählt statt zu schreiben"""
+
+    def __init__(self, slave_id: int, clock: VirtualClock, capacity_wh: float, soc: float, max_power: float,
+                 min_power: float, charge_efficiency: float = 0.95, discharge_efficiency: float = 0.95):
+        self.slave_id = slave_id
+        self.clock = clock
+        self.capacity_wh = capacity_wh
+        self.soc = soc
+        self.max_power = max_power
+        self.min_power = min_power
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+        self.current_mode = 0
+        self.current_power = 0.0
+        self.stop_confirmed = False
+        self.last_soc = soc
+        self.last_soc_update = 0.0
+        self.last_write_time = 0.0
+        self.setpoint_writes = 0  # set_power-Aufrufe
+        self.modbus_writes = 0    # Einzelne Register-Schreibvorgänge
+        self.bus_seconds = 0.0    # Pausen zwischen den Schreibvorgängen
+
+    def get_soc(self) -> Optional[float]:
+        return self.soc
+
+    @property
+    def signed_power(self) -> float:
+        return -self.current_power if self.current_mode == 1 else self.current_power if self.current_mode == 2 else 0.0
+
+    def set_power(self, power: float, mode: int) -> bool:
+        """Schreibvorgänge und Pausen wie BatteryClient.set_power zählen, Sollwert sofort übernehmen"""
+        if mode == 0:
+            writes, pause = WRITES_STOP, SLEEP_STOP
+        elif mode != self.current_mode:
+            writes, pause = WRITES_MODE_CHANGE, SLEEP_MODE_CHANGE
+        else:
+            writes, pause = WRITES_SAME_MODE, SLEEP_SAME_MODE
+        self.setpoint_writes += 1
+        self.modbus_writes += writes
+        self.bus_seconds += pause
+        self.last_write_time = self.clock.time()
+        self.apply(power, mode)
+        return True
+
+    def stop(self) -> bool:
+        return self.set_power(0, 0)
+
+    def apply(self, power: float, mode: int):
+        # Begrenzung wie in BatteryClient.set_power
+        power = round(max(self.min_power, min(power, self.max_power))) if power > 0 else 0
+        self.current_mode = mode
+        self.current_power = power if mode > 0 else 0
+        self.stop_confirmed = (mode == 0)
+
+    def integrate(self, seconds: float):
+        """SoC über seconds mit aktueller Leistung fortschreiben"""
+        power = self.signed_power
+        if power == 0 or self.capacity_wh <= 0:
+            return
+        if power > 0:
+            energy = power / self.discharge_efficiency
+        else:
+            energy = power * self.charge_efficiency
+        self.soc = min(100.0, max(0.0, self.soc - energy * seconds / 3600 / self.capacity_wh * 100))
+
+
+class ReplayBatteryManager(BatteryManager):
+    """
+    BatteryManager mit ReplayBattery statt Modbus-Clients
+    Die Leistungsverteilung (distribute_power) ist die des BatteryManager selbst,
+    damit das Replay nicht von der Produktivlogik abweicht.
+    """
+
+    def __init__(self, battery_config: Dict[str, Any], initial_soc: Dict[int, float], clock: VirtualClock):
+        # BatteryManager.__init__ würde Modbus-Clients anlegen - Attribute hier selbst setzen
+        self.clock = clock
+        self.allocator = PowerAllocator.from_config(battery_config)
+        self.setpoint_refresh_seconds = battery_config.get('setpoint_refresh_seconds', 300)
+        default_soc = initial_soc.get(0, 50.0)
+        if initial_soc and 0 not in initial_soc:
+            default_soc = sum(initial_soc.values()) / len(initial_soc)
+        self.batteries: Dict[int, ReplayBattery] = {}
+        for akku_id in battery_config['akku_ids']:
+            self.batteries[akku_id] = ReplayBattery(
+                akku_id,
+                clock,
+                capacity_wh=self.allocator.get_capacity(akku_id),
+                soc=initial_soc.get(akku_id, default_soc),
+                max_power=battery_config['max_power_per_battery'],
+                min_power=battery_config['min_power_per_battery'],
+                charge_efficiency=battery_config.get('charge_efficiency', 0.95),
+                discharge_efficiency=battery_config.get('discharge_efficiency', 0.95)
+            )
+
+    @property
+    def setpoint_writes(self) -> int:
+        return sum(battery.setpoint_writes for battery in self.batteries.values())
+
+    @property
+    def modbus_writes(self) -> int:
+        return sum(battery.modbus_writes for battery in self.batteries.values())
+
+    @property
+    def bus_seconds(self) -> float:
+        return sum(battery.bus_seconds for battery in self.batteries.values())
+
+    def stop_all(self) -> bool:
+        # Ohne die Stack-Ausgabe des BatteryManager - der Stopp gehört im Replay zum normalen Ablauf
+        self.allocator.reset()
+        for battery in self.batteries.values():
+            battery.stop()
+        return True
+
+    def get_average_soc(self) -> Optional[float]:
+        total_capacity = sum(b.capacity_wh for b in self.batteries.values())
+        return sum(b.soc * b.capacity_wh for b in self.batteries.values()) / total_capacity
+
+    def get_signed_powers(self) -> Dict[int, float]:
+        return {akku_id: battery.signed_power for akku_id, battery in self.batteries.items()}
+
+    def get_total_power(self) -> float:
+        return sum(battery.signed_power for battery in self.batteries.values())
+
+    def integrate(self, seconds: float):
+        for battery in self.batteries.values():
+            battery.integrate(seconds)
+
+
+@contextlib.contextmanager
+def quiet(levels: Dict[str, int]) -> Iterator[None]:
+    """Regler und Akku-Clients protokollieren jeden Zyklus - während der Simulation stumm schalten"""
+    loggers = {name: logging.getLogger(name) for name in levels}
+    previous = {name: log.level for name, log in loggers.items()}
+    try:
+        for name, log in loggers.items():
+            log.setLevel(levels[name])
+        yield
+    finally:
+        for name, log in loggers.items():
+            log.setLevel(previous[name])
+
+
+# ---------------------------------------------------------------------------
+# Kennzahlen
+# ---------------------------------------------------------------------------
+
+class SettlingTracker:
+    """Einschwingzeit nach Lastsprüngen: Zeit, bis das Netz wieder im Zielband liegt"""
+
+    def __init__(self, band: Tuple[float, float], step_threshold: float, timeout: float):
+        self.band = band
+        self.step_threshold = step_threshold
+        self.timeout = timeout
+        self.previous_load: Optional[float] = None
+        self.step_start: Optional[float] = None
+        self.settled: List[float] = []
+        self.unsettled = 0
+
+    def update(self, timestamp: float, load: float, grid: float):
+        if self.previous_load is not None and abs(load - self.previous_load) >= self.step_threshold:
+            if self.step_start is not None:
+                self.unsettled += 1  # Neuer Sprung vor dem Einschwingen
+            self.step_start = timestamp
+        self.previous_load = load
+
+        if self.step_start is None:
+            return
+        if self.band[0] <= grid <= self.band[1]:
+            self.settled.append(timestamp - self.step_start)
+            self.step_start = None
+        elif timestamp - self.step_start > self.timeout:
+            self.unsettled += 1
+            self.step_start = None
+
+    def summary(self) -> Dict[str, Any]:
+        values = sorted(self.settled)
+        return {
+            'load_steps': len(values) + self.unsettled,
+            'settled': len(values),
+            'unsettled': self.unsettled,
+            'mean_s': round(sum(values) / len(values), 1) if values else None,
+            'p95_s': round(values[int(0.95 * (len(values) - 1))], 1) if values else None,
+            'max_s': round(values[-1], 1) if values else None
+        }
+
+
+class EnergyTotals:
+    def __init__(self):
+        self.import_wh = 0.0
+        self.export_wh = 0.0
+        self.abs_deviation_wh = 0.0
+
+    def add(self, grid: float, seconds: float):
+        wh = grid * seconds / 3600
+        if wh >= 0:
+            self.import_wh += wh
+        else:
+            self.export_wh -= wh
+        self.abs_deviation_wh += abs(wh)
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        return {
+            'grid_import_kwh': round(self.import_wh / 1000, 3),
+            'grid_export_kwh': round(self.export_wh / 1000, 3),
+            'mean_abs_grid_w': round(self.abs_deviation_wh * 3600 / duration, 1) if duration > 0 else None
+        }
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+def replay(trace: Trace, config: ConfigLoader, step_threshold: float = 200, band_tolerance: float = 50,
+           settle_timeout: float = 120) -> Dict[str, Any]:
+    """
+    Spielt die Aufzeichnung durch den Regler und liefert Kennzahlen
+    Zwischen zwei Regelzyklen gilt der zuletzt geschriebene Sollwert (sofort wirksam).
+    """
+    if len(trace) < 2:
+        raise ValueError("Aufzeichnung enthält zu wenige Punkte")
+
+    control_config = config.get_control_config()
+    poll_interval = control_config.get('poll_interval_seconds', 2)
+    step = min(poll_interval, trace.resolution)
+
+    clock = VirtualClock(trace.times[0])
+    meter = ReplayMeter()
+    batteries = ReplayBatteryManager(config.get_battery_config(), trace.initial_soc, clock)
+
+    simulated, recorded = EnergyTotals(), EnergyTotals()
+    band = (0, 0)
+    cycles = failed_cycles = 0
+    wall_start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(clock.installed(zero_feed_control, battery_client, power_allocation, timing))
+        stack.enter_context(quiet({zero_feed_control.__name__: logging.WARNING,
+                                   battery_client.__name__: logging.ERROR,
+                                   power_allocation.__name__: logging.WARNING}))
+        controller = ZeroFeedController(meter, batteries, config)
+        band = (controller.target_grid_power_charge - band_tolerance,
+                controller.target_grid_power_discharge + band_tolerance)
+        settling = SettlingTracker(band, step_threshold, settle_timeout)
+
+        max_gap = max(MAX_GAP_SECONDS, 3 * trace.resolution)
+        index = 0
+        next_cycle = trace.times[0]
+        t = trace.times[0]
+        end = trace.times[-1]
+        while t < end:
+            while index + 1 < len(trace) and trace.times[index + 1] <= t:
+                index += 1
+            load = trace.net_load[index]
+            # Lücke in der Aufzeichnung: Zeit überspringen statt integrieren
+            if index + 1 < len(trace) and trace.times[index + 1] - trace.times[index] > max_gap:
+                t = trace.times[index + 1]
+                next_cycle = t
+                continue
+
+            clock.advance_to(t)
+            if t >= next_cycle:
+                meter.value = load - batteries.get_total_power()
+                success, _ = controller.execute_control_cycle()
+                cycles += 1
+                failed_cycles += 0 if success else 1
+                next_cycle += poll_interval
+
+            grid = load - batteries.get_total_power()
+            settling.update(t, load, grid)
+            simulated.add(grid, step)
+            if trace.recorded_grid[index] is not None:
+                recorded.add(trace.recorded_grid[index], step)
+            batteries.integrate(step)
+            t += step
+
+    wall_seconds = time.perf_counter() - wall_start
+    return {
+        'source': trace.source,
+        'start': datetime.fromtimestamp(trace.times[0]).isoformat(timespec='seconds'),
+        'end': datetime.fromtimestamp(trace.times[-1]).isoformat(timespec='seconds'),
+        'simulated_hours': round(trace.duration / 3600, 2),
+        'cycles': cycles,
+        'failed_cycles': failed_cycles,
+        'simulated': simulated.to_dict(trace.duration),
+        'recorded': recorded.to_dict(trace.duration) if any(g is not None for g in trace.recorded_grid) else None,
+        'mode_switches': controller.mode_change_count,
+        'setpoint_writes': batteries.setpoint_writes,
+        'modbus_writes': batteries.modbus_writes,
+        'writes_avoided': dict(controller.writes_avoided_by_reason),
+        'settling': settling.summary(),
+        'target_band_w': list(band),
+        'final_soc': {akku_id: round(battery.soc, 1) for akku_id, battery in batteries.batteries.items()},
+        'wall_seconds': round(wall_seconds, 2),
+        'speedup': round(trace.duration / wall_seconds) if wall_seconds > 0 else None
+    }
+
+
+def report_line(label: str, text: str) -> str:
+    return f"{label + ':':<19}{text}"
+
+
+def format_summary(result: Dict[str, Any], header: str, energy_lines: List[str], setpoint_detail: str) -> str:
+    """Gemeinsamer Kennzahlenbericht von Replay und Anlagensimulation"""
+    settling = result['settling']
+    lines = [
+        header,
+        report_line("Regelzyklen", f"{result['cycles']} ({result['failed_cycles']} fehlgeschlagen)"),
+        *energy_lines,
+        report_line("Moduswechsel", result['mode_switches']),
+        report_line("Sollwerte", f"{result['setpoint_writes']} ({setpoint_detail})"),
+        report_line("Unterdrückt", ', '.join(f"{k} {v}" for k, v in result['writes_avoided'].items())),
+        report_line("Einschwingen", f"{settling['settled']}/{settling['load_steps']} Lastsprünge, "
+                                    f"Mittel {settling['mean_s']} s, p95 {settling['p95_s']} s, max {settling['max_s']} s"),
+        report_line("End-SoC", ', '.join(f"Akku {k}: {v}%" for k, v in result['final_soc'].items())),
+        report_line("Laufzeit", f"{result['wall_seconds']} s ({result['speedup']}x Echtzeit)")
+    ]
+    return '\n'.join(lines)
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    simulated = result['simulated']
+    recorded = result['recorded'] or {}
+
+    def compare(key: str, unit: str) -> str:
+        return f" (aufgezeichnet {recorded[key]} {unit})" if recorded else ''
+
+    return format_summary(
+        result,
+        report_line("Quelle", f"{result['source']} ({result['start']} - {result['end']}, {result['simulated_hours']} h)"),
+        [
+            report_line("Netzbezug", f"{simulated['grid_import_kwh']} kWh{compare('grid_import_kwh', 'kWh')}"),
+            report_line("Einspeisung", f"{simulated['grid_export_kwh']} kWh{compare('grid_export_kwh', 'kWh')}"),
+            report_line("Mittl. |Netz|", f"{simulated['mean_abs_grid_w']} W{compare('mean_abs_grid_w', 'W')}")
+        ],
+        f"{result['modbus_writes']} Modbus-Schreibvorgänge"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aufgezeichnete Verläufe durch den Regler spielen")
+    parser.add_argument('source', help="Segment-Verzeichnis, SQLite-Datei (.db), Flugschreiber (.bin) oder CSV")
+    parser.add_argument('--config', help="Konfiguration (Standard: config.json bzw. config.example.json)")
+    parser.add_argument('--from', dest='start', help="Beginn (ISO-Datum/-Zeit)")
+    parser.add_argument('--to', dest='end', help="Ende (ISO-Datum/-Zeit)")
+    parser.add_argument('--set', action='append', default=[], metavar='SCHLÜSSEL=WERT',
+                        help="Konfigurationswert überschreiben, z.B. control.min_setpoint_dwell_seconds=10")
+    parser.add_argument('--json', action='store_true', help="Kennzahlen als JSON ausgeben")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        config = load_config(args.config, dict(parse_override(item) for item in args.set))
+        start = _parse_time(args.start) if args.start else None
+        end = _parse_time(args.end) if args.end else None
+        result = replay(load_trace(args.source, start, end), config)
+    except (OSError, ValueError, RuntimeError, sqlite3.Error) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False) if args.json else format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Parameter-Sweep für den ZeroFeedController
+Rechnet tausende Kombinationen von Zielwerten, Änderungsrate, Startschwelle und
+Niedrig-SoC-Schutz gleichzeitig durch: Die Regelgesetze aus _calculate_optimal_control,
+_apply_rate_limiting und _evaluate_write sind mit NumPy über alle Kombinationen
+vektorisiert, Tage werden über einen Prozesspool auf die Kerne verteilt.
+
+Ergebnis ist die Pareto-Front aus Einspeisung, Moduswechseln und Modbus-Schreibvorgängen
+und ein empfohlener control-Block. Mit --verify laufen Ausgangs- und empfohlene
+Konfiguration zur Kontrolle durch den echten Regler (simulation.plant, auch für aufgezeichnete Tage).
+
+Benötigt NumPy (pip install numpy).
+
+Aufruf: python -m simulation.sweep --days 3 --grid target_grid_power_charge=-60:0:10
+        python -m simulation.sweep history/ --from 2026-06-01 --to 2026-06-08 --workers 4 --verify
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+except ImportError:  # Nur für den Sweep nötig - Steuerung, Replay und Anlage laufen ohne
+    np = None
+
+from config_loader import ConfigLoader
+from power_allocation import PowerAllocator
+from simulation import plant, replay
+from simulation.replay import WRITES_MODE_CHANGE, WRITES_SAME_MODE, WRITES_STOP, apply_overrides, parse_override
+
+logger = logging.getLogger(__name__)
+
+# Durchsuchbare Reglerparameter (Schlüssel in control) und Standardraster
+DEFAULT_GRID: Dict[str, List[float]] = {
+    'target_grid_power_charge': [-60, -40, -20, -10, 0],
+    'target_grid_power_discharge': [0, 10, 20, 40, 60],
+    'max_power_change_watts': [250, 500, 750, 1000, 1500],
+    'start_threshold_watts': [25, 50, 100],
+    'low_soc_threshold_percent': [10, 13, 16],
+    'low_soc_min_surplus_watts': [-50, -100, -200]
+}
+
+# Werte wie im ZeroFeedController, falls die Konfiguration sie nicht enthält
+PARAMETER_DEFAULTS: Dict[str, float] = {
+    'target_grid_power_charge': -20,
+    'target_grid_power_discharge': 20,
+    'max_power_change_watts': 750,
+    'start_threshold_watts': 50,
+    'low_soc_threshold_percent': 13,
+    'low_soc_min_surplus_watts': -100,
+    'power_deadband_watts': 40,
+    'power_hysteresis_watts': 20,
+    'min_setpoint_dwell_seconds': 6,
+    'min_mode_dwell_seconds': 15,
+    'dwell_bypass_watts': 300
+}
+
+OBJECTIVES = ('export_kwh', 'mode_switches', 'modbus_writes')
+
+
+# ---------------------------------------------------------------------------
+# Parameterraster
+# ---------------------------------------------------------------------------
+
+def parse_grid_value(text: str) -> Tuple[str, List[float]]:
+    """'key=-60:0:10' (Bereich inkl. Ende) oder 'key=250,500,750'"""
+    key, _, raw = text.partition('=')
+    key = key.strip()
+    if key.startswith('control.'):
+        key = key[len('control.'):]
+    if not raw or key not in PARAMETER_DEFAULTS:
+        raise ValueError(f"Unbekannter Parameter oder Wert fehlt: {text}")
+    if ':' in raw:
+        start, stop, step = (float(part) for part in raw.split(':'))
+        if step <= 0:
+            raise ValueError(f"Schrittweite muss positiv sein: {text}")
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        values = [start + i * step for i in range(count)]
+    else:
+        values = [float(part) for part in raw.split(',')]
+    return key, [int(v) if float(v).is_integer() else v for v in values]
+
+
+def build_combinations(grid: Dict[str, List[float]], control_config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Kartesisches Produkt des Rasters; nicht durchsuchte Parameter aus der Konfiguration
+    Die letzte Zeile ist die aktuelle Konfiguration (Vergleichswert).
+    """
+    baseline = {key: control_config.get(key, default) for key, default in PARAMETER_DEFAULTS.items()}
+    swept = list(grid)
+    rows = [dict(baseline, **dict(zip(swept, values))) for values in itertools.product(*(grid[k] for k in swept))]
+    rows.append(baseline)
+    return {key: np.array([row[key] for row in rows], dtype=np.float64) for key in PARAMETER_DEFAULTS}
+
+
+# ---------------------------------------------------------------------------
+# Tage (Netzlast hinter dem Zähler, sekundengenau)
+# ---------------------------------------------------------------------------
+
+def synthetic_days(scenario: Dict[str, Any], days: int, seed: int) -> List[Dict[str, Any]]:
+    """Tage aus der nachgebildeten Anlage (simulation.plant), Seed seed, seed+1, ..."""
+    scenario = plant.merge_scenario(plant.DEFAULT_SCENARIO, scenario)
+    start = datetime.fromisoformat(scenario['start']).timestamp()
+    seconds = int(scenario['duration_hours'] * 3600)
+    initial_soc = scenario['battery']['initial_soc']
+    if isinstance(initial_soc, dict):
+        initial_soc = sum(initial_soc.values()) / len(initial_soc)
+    result = []
+    for day_seed in range(seed, seed + days):
+        load, pv = plant.build_profiles(scenario, start, seconds, day_seed)
+        result.append({'name': f"seed {day_seed}", 'seed': day_seed, 'net_load': np.subtract(load, pv),
+                       'initial_soc': float(initial_soc)})
+    return result
+
+
+def recorded_days(trace: replay.Trace) -> List[Dict[str, Any]]:
+    """Aufzeichnung je Kalendertag auf ein 1-s-Raster bringen (Haltewert zwischen den Punkten)"""
+    if len(trace) < 2:
+        raise ValueError("Aufzeichnung enthält zu wenige Punkte")
+    times = np.asarray(trace.times, dtype=np.float64)
+    loads = np.asarray(trace.net_load, dtype=np.float64)
+    soc = trace.initial_soc.get(0) if 0 in trace.initial_soc else (
+        sum(trace.initial_soc.values()) / len(trace.initial_soc) if trace.initial_soc else 50.0)
+
+    result = []
+    day_start = datetime.fromtimestamp(times[0]).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    while day_start <= times[-1]:
+        day_end = min(day_start + 86400, times[-1])
+        begin = max(day_start, times[0])
+        if day_end - begin >= 3600:  # Angebrochene Tage unter einer Stunde auslassen
+            grid = np.arange(begin, day_end, 1.0)
+            index = np.searchsorted(times, grid, side='right') - 1
+            result.append({'name': datetime.fromtimestamp(begin).date().isoformat(), 'seed': None,
+                           'start': begin, 'end': day_end, 'net_load': loads[index], 'initial_soc': float(soc)})
+        day_start += 86400
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Vektorisierte Simulation
+# ---------------------------------------------------------------------------
+
+def simulate_batch(net_load, initial_soc: float, params: Dict[str, Any], fixed: Dict[str, Any],
+                   noise_seed: int) -> Dict[str, Any]:
+    """
+    Ein Tag für alle Parameterkombinationen gleichzeitig (Arrays der Länge N)
+    Akkus werden zusammengefasst (Summe der Kapazitäten, alle Akkus verfügbar, solange der
+    mittlere SoC es erlaubt). Sollwerte wirken nach lag_seconds, rampenbegrenzt wie in der Anlage.
+    """
+    count = len(params['target_grid_power_charge'])
+    tc, td = params['target_grid_power_charge'], params['target_grid_power_discharge']
+    abs_tc = np.abs(tc)
+    rate, threshold = params['max_power_change_watts'], params['start_threshold_watts']
+    low_threshold, low_surplus = params['low_soc_threshold_percent'], params['low_soc_min_surplus_watts']
+    deadband, hysteresis = params['power_deadband_watts'], params['power_hysteresis_watts']
+    setpoint_dwell, mode_dwell = params['min_setpoint_dwell_seconds'], params['min_mode_dwell_seconds']
+    bypass = params['dwell_bypass_watts']
+
+    min_power, max_per_battery = fixed['min_power'], fixed['max_power_per_battery']
+    batteries = fixed['battery_count']
+    min_soc, max_soc = fixed['min_soc'], fixed['max_soc']
+    interval, lag, ramp = fixed['poll_interval'], fixed['lag_seconds'], fixed['ramp_w_per_second']
+    soc_per_ws = 100 / 3600 / fixed['capacity_wh']
+    delay = max(0, int(round(fixed['meter_delay_seconds'])))
+
+    # Gleiches Messrauschen für alle Kombinationen - fairer Vergleich
+    noise = np.random.default_rng(noise_seed).normal(0, fixed['meter_noise_w'], len(net_load))
+
+    mode = np.zeros(count, dtype=np.int8)
+    current = np.zeros(count)
+    actual = np.zeros(count)
+    target = np.zeros(count)
+    pending = np.zeros(count)
+    pending_at = np.full(count, np.inf)
+    soc = np.full(count, initial_soc)
+    last_setpoint = np.full(count, -np.inf)
+    last_mode_change = np.full(count, -np.inf)
+    last_direction = np.zeros(count)
+
+    import_ws, export_ws, abs_ws = np.zeros(count), np.zeros(count), np.zeros(count)
+    switches = np.zeros(count, dtype=np.int64)
+    setpoints = np.zeros(count, dtype=np.int64)
+    writes = np.zeros(count, dtype=np.int64)
+    history = [np.zeros(count)] * (delay + 1)
+
+    for t in range(len(net_load)):
+        # Anlage: verzögerter Sollwert, Rampe, BMS-Grenzen, SoC
+        arrived = pending_at <= t
+        if arrived.any():
+            target = np.where(arrived, pending, target)
+            pending_at = np.where(arrived, np.inf, pending_at)
+        effective = np.where(((target < 0) & (soc >= 100)) | ((target > 0) & (soc <= 0)), 0.0, target)
+        actual = actual + np.clip(effective - actual, -ramp, ramp)
+        grid = net_load[t] - actual
+        history = history[1:] + [grid]
+        import_ws += np.maximum(grid, 0)
+        export_ws += np.maximum(-grid, 0)
+        abs_ws += np.abs(grid)
+        energy = np.where(actual > 0, actual / fixed['discharge_efficiency'], actual * fixed['charge_efficiency'])
+        soc = np.clip(soc - energy * soc_per_ws, 0, 100)
+
+        if t % interval:
+            continue
+
+        # Regler: Messwert mit Verzögerung und Rauschen
+        g = history[0] + noise[t]
+        max_charge = np.where(soc < max_soc, batteries * max_per_battery, 0.0)
+        max_discharge = np.where(soc > min_soc, batteries * max_per_battery, 0.0)
+
+        # _calculate_optimal_control - Entladen
+        consumption = g + current
+        discharge_target = np.where(consumption >= min_power + td, consumption - td, consumption)
+        keep_discharging = (soc > min_soc) & (discharge_target >= min_power)
+        # Laden (Netzbezug: flexibles Ziel, Export: immer Ziel)
+        pv = current - g
+        charge_target = np.where((g >= 0) & (pv < min_power + abs_tc), pv, pv - abs_tc)
+        keep_charging = (soc < max_soc) & (charge_target >= min_power)
+        # Stopp
+        charge_wanted = g < tc - threshold
+        low_soc_blocked = (soc < low_threshold) & (g > low_surplus)
+        start_charge = charge_wanted & (soc < max_soc) & ~low_soc_blocked & (-g - abs_tc >= min_power)
+        start_discharge = ~charge_wanted & (g > td + threshold) & (soc > min_soc) & (g - td >= min_power)
+
+        new_mode = np.select(
+            [mode == 2, mode == 1],
+            [np.where(keep_discharging, 2, 0), np.where(keep_charging, 1, 0)],
+            np.where(start_charge, 1, np.where(start_discharge, 2, 0))
+        ).astype(np.int8)
+        new_power = np.select(
+            [new_mode == 0, mode == 2, mode == 1, start_charge],
+            [0.0, np.minimum(discharge_target, max_discharge), np.minimum(charge_target, max_charge),
+             np.minimum(-g - abs_tc, max_charge)],
+            np.minimum(g - td, max_discharge)
+        )
+
+        # _apply_rate_limiting
+        same_mode = (new_mode == mode) & (mode != 0)
+        limited = np.where(same_mode, current + np.clip(new_power - current, -rate, rate), np.minimum(new_power, rate))
+        limited = np.where(new_mode == 0, 0.0, np.maximum(limited, 0.0))
+
+        # _evaluate_write
+        changed = new_mode != mode
+        change = limited - current
+        magnitude = np.abs(change)
+        direction = np.sign(change)
+        write = np.where(
+            changed,
+            (new_mode == 0) | (t - last_mode_change >= mode_dwell),
+            (new_mode != 0) & (magnitude >= 1) & (magnitude > deadband)
+            & ~((last_direction != 0) & (direction != last_direction) & (magnitude <= deadband + hysteresis))
+            & ~((t - last_setpoint < setpoint_dwell) & (magnitude < bypass))
+        )
+        if not write.any():
+            continue
+
+        # Schreiben: Modbus-Aufwand wie BatteryClient.set_power, je beteiligtem Akku
+        mode_switch = write & changed
+        switches += mode_switch
+        last_mode_change = np.where(mode_switch, t, last_mode_change)
+        last_direction = np.where(mode_switch, 0, np.where(write & (magnitude > 0), direction, last_direction))
+        last_setpoint = np.where(write, t, last_setpoint)
+        active = np.where(new_mode == 0, batteries, np.clip(np.ceil(limited / max_per_battery), 1, batteries))
+        per_battery = np.where(new_mode == 0, WRITES_STOP, np.where(changed, WRITES_MODE_CHANGE, WRITES_SAME_MODE))
+        setpoints += np.where(write, active, 0).astype(np.int64)
+        writes += np.where(write, active * per_battery, 0).astype(np.int64)
+
+        mode = np.where(write, new_mode, mode).astype(np.int8)
+        current = np.where(write, limited, current)
+        signed = np.where(mode == 1, -current, np.where(mode == 2, current, 0.0))
+        pending = np.where(write, signed, pending)
+        pending_at = np.where(write, t + lag, pending_at)
+
+    return {
+        'import_kwh': import_ws / 3.6e6,
+        'export_kwh': export_ws / 3.6e6,
+        'mean_abs_grid_w': abs_ws / max(1, len(net_load)),
+        'mode_switches': switches,
+        'setpoint_writes': setpoints,
+        'modbus_writes': writes,
+        'final_soc': soc
+    }
+
+
+def _evaluate(task: Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], int, int]) -> Tuple[int, Dict[str, Any]]:
+    """Prozesspool-Aufgabe: ein Tag für einen Block von Kombinationen"""
+    day, params, fixed, noise_seed, offset = task
+    return offset, simulate_batch(day['net_load'], day['initial_soc'], params, fixed, noise_seed)
+
+
+def fixed_settings(config: ConfigLoader, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """Nicht durchsuchte Größen aus Konfiguration (Akkus, Regelintervall) und Anlagenszenario"""
+    battery_config = config.get_battery_config()
+    allocator = PowerAllocator.from_config(battery_config)
+    scenario = plant.merge_scenario(plant.DEFAULT_SCENARIO, scenario)
+    return {
+        'min_power': battery_config['min_power_per_battery'],
+        'max_power_per_battery': battery_config['max_power_per_battery'],
+        'battery_count': len(battery_config['akku_ids']),
+        'capacity_wh': sum(allocator.get_capacity(akku_id) for akku_id in battery_config['akku_ids']),
+        'min_soc': battery_config['min_soc_for_discharge'],
+        'max_soc': battery_config['max_soc_for_charge'],
+        'charge_efficiency': battery_config.get('charge_efficiency', 0.95),
+        'discharge_efficiency': battery_config.get('discharge_efficiency', 0.95),
+        'poll_interval': max(1, int(round(config.get_control_config().get('poll_interval_seconds', 2)))),
+        'lag_seconds': scenario['battery']['lag_seconds'],
+        'ramp_w_per_second': scenario['battery']['ramp_w_per_second'],
+        'meter_delay_seconds': scenario['meter']['delay_seconds'],
+        'meter_noise_w': scenario['meter']['noise_w']
+    }
+
+
+def run_sweep(days: List[Dict[str, Any]], params: Dict[str, Any], fixed: Dict[str, Any],
+              workers: int, seed: int) -> Dict[str, Any]:
+    """Alle Tage x alle Kombinationen, Ergebnis als Mittelwert je Tag"""
+    count = len(params['target_grid_power_charge'])
+    chunk = math.ceil(count / workers)
+    tasks = []
+    for day_index, day in enumerate(days):
+        for offset in range(0, count, chunk):
+            block = {key: values[offset:offset + chunk] for key, values in params.items()}
+            tasks.append((day, block, fixed, seed * 1000 + day_index, offset))
+
+    totals: Dict[str, Any] = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_evaluate, tasks))
+    else:
+        results = [_evaluate(task) for task in tasks]
+    for offset, result in results:
+        for key, values in result.items():
+            if key not in totals:
+                totals[key] = np.zeros(count)
+            totals[key][offset:offset + len(values)] += values
+    return {key: values / len(days) for key, values in totals.items()}
+
+
+# ---------------------------------------------------------------------------
+# Auswertung
+# ---------------------------------------------------------------------------
+
+def pareto_front(objectives) -> Any:
+    """
+    Indizes der nicht dominierten Zeilen (alle Ziele minimieren)
+    Kombinationen mit identischen Kennzahlen (z.B. Niedrig-SoC-Werte an Tagen ohne niedrigen SoC)
+    erscheinen nur einmal - mit den ersten Rasterwerten.
+    """
+    _, unique = np.unique(objectives, axis=0, return_index=True)
+    unique = np.sort(unique)
+    front = _non_dominated(objectives[unique])
+    return unique[front]
+
+
+def _non_dominated(objectives) -> Any:
+    count = len(objectives)
+    dominated = np.zeros(count, dtype=bool)
+    for start in range(0, count, 256):
+        block = objectives[start:start + 256, None, :]
+        # Zeile i ist dominiert, wenn eine Zeile j überall <= und irgendwo < ist
+        dominates = np.all(objectives[None, :, :] <= block, axis=2) & np.any(objectives[None, :, :] < block, axis=2)
+        dominated[start:start + 256] = dominates.any(axis=1)
+    return np.flatnonzero(~dominated)
+
+
+def recommend(objectives, front, weights: Tuple[float, float, float]) -> int:
+    """Ausgewogener Punkt der Front: kleinste gewichtete Summe der auf [0, 1] normierten Ziele"""
+    values = objectives[front]
+    low, high = values.min(axis=0), values.max(axis=0)
+    normalized = (values - low) / np.where(high > low, high - low, 1.0)
+    return int(front[np.argmin(normalized @ np.asarray(weights, dtype=np.float64))])
+
+
+def _row(params: Dict[str, Any], results: Dict[str, Any], index: int, swept: List[str]) -> Dict[str, Any]:
+    def plain(value):
+        value = float(value)
+        return int(value) if value.is_integer() else round(value, 2)
+    return {
+        'parameters': {key: plain(params[key][index]) for key in swept},
+        'export_kwh': round(float(results['export_kwh'][index]), 3),
+        'import_kwh': round(float(results['import_kwh'][index]), 3),
+        'mean_abs_grid_w': round(float(results['mean_abs_grid_w'][index]), 1),
+        'mode_switches': round(float(results['mode_switches'][index]), 1),
+        'setpoint_writes': round(float(results['setpoint_writes'][index]), 1),
+        'modbus_writes': round(float(results['modbus_writes'][index]), 1)
+    }
+
+
+def verify(config: ConfigLoader, days: List[Dict[str, Any]], scenario: Dict[str, Any],
+           control: Dict[str, Any]) -> Dict[str, Any]:
+    """Kontrolllauf mit dem echten Regler (je Tag gemittelt)"""
+    candidate = ConfigLoader(str(config.config_file))
+    candidate.config = apply_overrides(config.config, {f"control.{key}": value for key, value in control.items()})
+    results = []
+    for day in days:
+        if day['seed'] is None:
+            # Aufgezeichneter Tag: gleiche Anlagendynamik wie im Sweep (nicht das Replay mit sofort wirksamen Sollwerten)
+            day_scenario = plant.merge_scenario(scenario, {
+                'start': datetime.fromtimestamp(day['start']).isoformat(),
+                'duration_hours': len(day['net_load']) / 3600,
+                'battery': {'initial_soc': day['initial_soc']}
+            })
+            results.append(plant.simulate(day_scenario, candidate, day['net_load'].tolist()))
+        else:
+            results.append(plant.simulate(dict(scenario, seed=day['seed']), candidate))
+    return {
+        'export_kwh': round(sum(r['grid_export_kwh'] for r in results) / len(days), 3),
+        'import_kwh': round(sum(r['grid_import_kwh'] for r in results) / len(days), 3),
+        'mode_switches': round(sum(r['mode_switches'] for r in results) / len(days), 1),
+        'modbus_writes': round(sum(r['modbus_writes'] for r in results) / len(days), 1)
+    }
+
+
+def sweep(config: ConfigLoader, grid: Dict[str, List[float]], days: List[Dict[str, Any]],
+          scenario: Dict[str, Any], workers: int, seed: int, weights: Tuple[float, float, float],
+          top: int = 15) -> Dict[str, Any]:
+    params = build_combinations(grid, config.get_control_config())
+    fixed = fixed_settings(config, scenario)
+    wall_start = time.perf_counter()
+    results = run_sweep(days, params, fixed, workers, seed)
+    wall_seconds = time.perf_counter() - wall_start
+
+    objectives = np.column_stack([results[key] for key in OBJECTIVES])
+    front = pareto_front(objectives[:-1])  # Ohne Vergleichszeile
+    best = recommend(objectives, front, weights)
+    swept = list(grid)
+    ordered = front[np.argsort(objectives[front, 0], kind='stable')]
+    recommended = _row(params, results, best, swept)
+    return {
+        'days': [day['name'] for day in days],
+        'combinations': len(params['target_grid_power_charge']) - 1,
+        'swept': swept,
+        'baseline': _row(params, results, -1, swept),
+        'pareto_front': [_row(params, results, int(index), swept) for index in ordered[:top]],
+        'pareto_size': int(len(front)),
+        'recommended': recommended,
+        'config_block': {'control': recommended['parameters']},
+        'wall_seconds': round(wall_seconds, 2),
+        'workers': workers
+    }
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    def describe(row: Dict[str, Any]) -> str:
+        return (f"Einspeisung {row['export_kwh']:>7.3f} kWh | Bezug {row['import_kwh']:>7.3f} kWh | "
+                f"Wechsel {row['mode_switches']:>6.1f} | Modbus {row['modbus_writes']:>7.1f}")
+
+    lines = [
+        f"Tage:              {', '.join(result['days'])}",
+        f"Kombinationen:     {result['combinations']} ({', '.join(result['swept'])})",
+        f"Laufzeit:          {result['wall_seconds']} s mit {result['workers']} Prozess(en)",
+        "",
+        f"Pareto-Front ({result['pareto_size']} Punkte, Werte je Tag, nach Einspeisung sortiert):"
+    ]
+    for row in result['pareto_front']:
+        parameters = ' '.join(f"{key}={value}" for key, value in row['parameters'].items())
+        lines.append(f"  {describe(row)} | {parameters}")
+    lines += [
+        "",
+        f"Aktuell:           {describe(result['baseline'])}",
+        f"Empfohlen:         {describe(result['recommended'])}"
+    ]
+    if result.get('verification'):
+        for name, values in result['verification'].items():
+            lines.append(f"Echter Regler ({name}): Einspeisung {values['export_kwh']} kWh | Bezug {values['import_kwh']} kWh | "
+                         f"Wechsel {values['mode_switches']} | Modbus {values['modbus_writes']}")
+    lines += ["", "Empfohlener Konfigurationsblock:", json.dumps(result['config_block'], indent=2)]
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reglerparameter über aufgezeichnete oder synthetische Tage durchsuchen")
+    parser.add_argument('source', nargs='?', help="Aufzeichnung wie bei simulation.replay (ohne: synthetische Tage)")
+    parser.add_argument('--config', help="Konfiguration (Standard: config.json bzw. config.example.json)")
+    parser.add_argument('--from', dest='start', help="Beginn (ISO-Datum/-Zeit)")
+    parser.add_argument('--to', dest='end', help="Ende (ISO-Datum/-Zeit)")
+    parser.add_argument('--days', type=int, default=3, help="Anzahl synthetischer Tage (Standard: 3)")
+    parser.add_argument('--seed', type=int, default=1, help="Seed des ersten synthetischen Tages und des Messrauschens")
+    parser.add_argument('--grid', action='append', default=[], metavar='PARAMETER=WERTE',
+                        help="Raster ersetzen, z.B. target_grid_power_charge=-60:0:10 oder max_power_change_watts=500,750")
+    parser.add_argument('--set', action='append', default=[], metavar='SCHLÜSSEL=WERT',
+                        help="Konfigurationswert überschreiben, z.B. control.poll_interval_seconds=3")
+    parser.add_argument('--plant-set', action='append', default=[], metavar='SCHLÜSSEL=WERT',
+                        help="Anlagenszenario überschreiben, z.B. battery.lag_seconds=3")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Prozesse (Standard: alle Kerne)")
+    parser.add_argument('--weights', default='1,1,1', help="Gewichte Einspeisung,Wechsel,Modbus für die Empfehlung")
+    parser.add_argument('--top', type=int, default=15, help="Angezeigte Punkte der Pareto-Front")
+    parser.add_argument('--verify', action='store_true', help="Aktuelle und empfohlene Werte mit dem echten Regler nachrechnen")
+    parser.add_argument('--json', action='store_true', help="Ergebnis als JSON ausgeben")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if np is None:
+        print("Fehler: NumPy nicht installiert (pip install numpy)", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        config = replay.load_config(args.config, dict(parse_override(item) for item in args.set))
+        scenario = apply_overrides({}, dict(parse_override(item) for item in args.plant_set))
+        grid = dict(DEFAULT_GRID)
+        grid.update(parse_grid_value(item) for item in args.grid)
+        weights = tuple(float(w) for w in args.weights.split(','))
+        if len(weights) != len(OBJECTIVES):
+            raise ValueError("--weights erwartet drei Werte")
+
+        if args.source:
+            start = replay._parse_time(args.start) if args.start else None
+            end = replay._parse_time(args.end) if args.end else None
+            days = recorded_days(replay.load_trace(args.source, start, end))
+        else:
+            days = synthetic_days(scenario, args.days, args.seed)
+        if not days:
+            raise ValueError("Keine auswertbaren Tage")
+
+        result = sweep(config, grid, days, scenario, max(1, args.workers), args.seed, weights, args.top)
+        if args.verify:
+            baseline = {key: config.get_control_config().get(key, PARAMETER_DEFAULTS[key]) for key in result['swept']}
+            result['verification'] = {
+                'aktuell': verify(config, days, scenario, baseline),
+                'empfohlen': verify(config, days, scenario, result['config_block']['control'])
+            }
+    except (OSError, ValueError, RuntimeError, KeyError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False) if args.json else format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+SoC-Schätzer (Coulomb-Counting) für Marstek PV-Akku Steuerung
+Integriert die Akku-Leistung zwischen zwei Modbus-Lesungen und wird bei
+jeder echten REG_SOC-Lesung korrigiert
+"""
+
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class SocEstimator:
+    """Schätzt den SoC eines Akkus zwischen den Registerlesungen"""
+
+    def __init__(self, capacity_wh: float, charge_efficiency: float = 0.95,
+                 discharge_efficiency: float = 0.95):
+        if capacity_wh <= 0:
+            raise ValueError(f"Ungültige Akku-Kapazität: {capacity_wh}Wh")
+
+        self.capacity_wh = capacity_wh
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+
+        # KEIN Default-SoC - erst nach der ersten echten Lesung gültig
+        self.soc: Optional[float] = None
+        self.power = 0.0  # Aktuelle Leistung: positiv = Entladen, negativ = Laden
+        self.last_update: Optional[float] = None
+        self.last_measurement: Optional[float] = None
+        self.last_correction = 0.0  # Abweichung Schätzung - Messung bei letzter Korrektur
+
+        # get_soc schreibt fort und wird aus Regel-, Web- und Metrik-Thread aufgerufen
+        self._lock = threading.Lock()
+
+    def _integrate(self, now: float):
+        """Schreibt den SoC mit der bisherigen Leistung bis 'now' fort (nur unter self._lock)"""
+        if self.soc is None or self.last_update is None:
+            self.last_update = now
+            return
+
+        hours = max(0.0, now - self.last_update) / 3600
+        if self.power > 0:  # Entladen: Zellen liefern mehr als am Ausgang ankommt
+            energy_wh = -self.power * hours / self.discharge_efficiency
+        else:  # Laden: nur ein Teil der Eingangsleistung wird gespeichert
+            energy_wh = -self.power * hours * self.charge_efficiency
+
+        self.soc = min(100.0, max(0.0, self.soc + energy_wh / self.capacity_wh * 100))
+        self.last_update = now
+
+    def set_power(self, power: float, now: Optional[float] = None):
+        """Neue Leistung ab jetzt (positiv = Entladen, negativ = Laden)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._integrate(now)
+            self.power = power
+
+    def correct(self, measured_soc: float, now: Optional[float] = None):
+        """
+        Korrigiert die Schätzung mit einer echten Registerlesung
+
+        Das Register liefert ganze Prozent - liegt die Schätzung innerhalb der
+        Rundungsgrenzen, bleibt ihre Nachkommastelle erhalten
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._integrate(now)
+
+            if self.soc is None:
+                self.soc = measured_soc
+            else:
+                self.last_correction = self.soc - measured_soc
+                self.soc = min(max(self.soc, measured_soc - 0.5), measured_soc + 0.5)
+                if abs(self.last_correction) > 2:
+                    logger.debug(f"SoC-Schätzung um {self.last_correction:+.1f}% korrigiert")
+
+            self.soc = min(100.0, max(0.0, self.soc))
+            self.last_update = now
+            self.last_measurement = now
+
+    def get_soc(self, now: Optional[float] = None) -> Optional[float]:
+        """Aktueller SoC-Schätzwert oder None, wenn noch nie gemessen"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._integrate(now)
+            return self.soc
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Zustand des Schätzers zurück"""
+        with self._lock:
+            soc, last_measurement, last_correction = self.soc, self.last_measurement, self.last_correction
+        return {
+            'soc_estimate': round(soc, 1) if soc is not None else None,
+            'seconds_since_measurement': int(time.time() - last_measurement) if last_measurement is not None else None,
+            'last_correction': round(last_correction, 2),
+            'capacity_wh': self.capacity_wh
+        }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+SQLite-Verlaufsspeicher für Marstek PV-Akku Steuerung
+WAL-Modus, gesammelte Schreibvorgänge in einem Hintergrund-Thread (die Regelschleife
+wartet nie auf fsync), Zeitbereichsabfragen über den Primärschlüssel und
+Bereinigung nach Aufbewahrungsdauer
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from history_rollup import RollupStore, series_values
+from history_store import HistoryQueries
+
+logger = logging.getLogger(__name__)
+
+# Zeitstempel als ganze Millisekunden im Primärschlüssel (rowid) - Bereichsabfragen
+# laufen direkt über den B-Baum der Tabelle, ohne zusätzlichen Index
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cycles (
+    ts_ms INTEGER PRIMARY KEY,
+    grid REAL,
+    mode INTEGER NOT NULL,
+    power REAL NOT NULL,
+    reasoning TEXT
+);
+CREATE TABLE IF NOT EXISTS battery_samples (
+    ts_ms INTEGER NOT NULL,
+    akku_id INTEGER NOT NULL,
+    mode INTEGER NOT NULL,
+    power REAL NOT NULL,
+    soc REAL,
+    PRIMARY KEY (ts_ms, akku_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meter_samples (
+    ts_ms INTEGER PRIMARY KEY,
+    power REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts_ms INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts_ms);
+"""
+
+INSERTS = {
+    'cycles': "INSERT OR REPLACE INTO cycles (ts_ms, grid, mode, power, reasoning) VALUES (?, ?, ?, ?, ?)",
+    'battery_samples': "INSERT OR REPLACE INTO battery_samples (ts_ms, akku_id, mode, power, soc) VALUES (?, ?, ?, ?, ?)",
+    'meter_samples': "INSERT OR REPLACE INTO meter_samples (ts_ms, power) VALUES (?, ?)",
+    'events': "INSERT INTO events (ts_ms, level, message) VALUES (?, ?, ?)"
+}
+
+
+def _ms(timestamp: float) -> int:
+    return int(round(timestamp * 1000))
+
+
+class SqliteHistoryStore(HistoryQueries):
+    """Verlauf, Zählerwerte und Ereignisse in einer SQLite-Datenbank"""
+
+    PRUNE_INTERVAL = 3600  # Sekunden zwischen zwei Bereinigungen
+    PRUNE_BATCH = 50000    # Zeilen pro DELETE - hält Schreibsperren kurz
+
+    def __init__(self, path: str = 'history/marstek.db', flush_interval_seconds: float = 10,
+                 retention_days: float = 365, events_retention_days: float = 365,
+                 max_reasoning_chars: int = 200, max_queue: int = 20000,
+                 rollups: Optional[RollupStore] = None):
+        self.path = path
+        self.flush_interval = flush_interval_seconds
+        self.retention_seconds = retention_days * 86400
+        self.events_retention_seconds = events_retention_days * 86400
+        self.max_reasoning_chars = max_reasoning_chars
+        self.rollups = rollups
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Condition()
+        self._flush_generation = 0
+        self._running = True
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.last_flush_ms = 0.0
+        self.last_prune = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Schema im Aufrufer-Thread anlegen - Fehler fallen sofort beim Start auf
+        connection = self._connect()
+        connection.close()
+
+        self._writer = threading.Thread(target=self._writer_loop, name='history-writer', daemon=True)
+        self._writer.start()
+        logger.info(f"SQLite-Verlauf: {path} (WAL, Schreiben alle {flush_interval_seconds}s, "
+                    f"Aufbewahrung {retention_days} Tage)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        # auto_vacuum muss vor dem Anlegen der Tabellen gesetzt sein (wirkt nur auf neue Datenbanken)
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Im WAL-Modus synchronisiert NORMAL nur beim Checkpoint - kein fsync pro Transaktion
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _enqueue(self, table: str, row: Tuple):
+        """Übergibt eine Zeile an den Schreib-Thread - blockiert nie"""
+        try:
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logger.warning(f"SQLite-Verlauf: Warteschlange voll - {self.rows_dropped} Zeilen verworfen")
+
+    def append(self, timestamp: float, grid_power: Optional[float], mode: int, total_power: float,
+               batteries: List[Tuple[int, int, float, Optional[float]]], reasoning: str = ''):
+        """Regelzyklus mit Akku-Werten speichern"""
+        ts_ms = _ms(timestamp)
+        self._enqueue('cycles', (ts_ms, grid_power, mode, total_power, reasoning[:self.max_reasoning_chars]))
+        for akku_id, akku_mode, power, soc in batteries:
+            self._enqueue('battery_samples', (ts_ms, akku_id, akku_mode, power, soc))
+
+        if self.rollups:
+            self.rollups.add_sample(timestamp, series_values(grid_power, mode, total_power, batteries))
+
+    def append_meter_sample(self, timestamp: float, power: Optional[float]):
+        """Zählerwert je Abruf (1 s)"""
+        self._enqueue('meter_samples', (_ms(timestamp), power))
+
+    def append_event(self, timestamp: float, level: str, message: str):
+        """Log-Ereignis aus dem Web-Interface"""
+        self._enqueue('events', (_ms(timestamp), level, message))
+
+    def _writer_loop(self):
+        """Sammelt Zeilen und schreibt sie je Intervall in einer Transaktion"""
+        connection = self._connect()
+        pending: Dict[str, List[Tuple]] = defaultdict(list)
+        next_flush = time.time() + self.flush_interval
+
+        while self._running or not self._queue.empty():
+            timeout = max(0.0, next_flush - time.time())
+            try:
+                table, row = self._queue.get(timeout=min(timeout, 1.0))
+                pending[table].append(row)
+                # Alles, was bereits wartet, ohne weiteres Blockieren übernehmen
+                while True:
+                    table, row = self._queue.get_nowait()
+                    pending[table].append(row)
+            except queue.Empty:
+                pass
+
+            now = time.time()
+            if now >= next_flush or self._flush_requested.is_set() or not self._running:
+                self._write_batch(connection, pending)
+                pending = defaultdict(list)
+                next_flush = now + self.flush_interval
+
+                if now - self.last_prune >= self.PRUNE_INTERVAL:
+                    self._prune(connection, now)
+
+                self._flush_requested.clear()
+                with self._flushed:
+                    self._flush_generation += 1
+                    self._flushed.notify_all()
+
+        # Beenden: Restzeilen und Rollups schreiben, falls close() nach der letzten Prüfung kam
+        self._write_batch(connection, pending)
+        connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, pending: Dict[str, List[Tuple]]):
+        if pending:
+            start = time.perf_counter()
+            try:
+                with connection:
+                    for table, rows in pending.items():
+                        connection.executemany(INSERTS[table], rows)
+                self.rows_written += sum(len(rows) for rows in pending.values())
+            except sqlite3.Error as e:
+                logger.error(f"SQLite-Verlauf: Schreiben fehlgeschlagen ({sum(len(r) for r in pending.values())} Zeilen): {e}")
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+        # Auch ohne neue Zeilen: abgeschlossene Rollup-Buckets schreiben (wie HistoryStore.flush)
+        if self.rollups:
+            self.rollups.flush()
+
+    def _prune(self, connection: sqlite3.Connection, now: float):
+        """Löscht Daten außerhalb der Aufbewahrungsdauer in Teilschritten"""
+        self.last_prune = now
+        cutoff = _ms(now - self.retention_seconds)
+        events_cutoff = _ms(now - self.events_retention_seconds)
+        deleted = 0
+        try:
+            # Je Tabelle der Schlüssel, über den die Teilschritte löschen
+            for table, key, limit in (('cycles', 'ts_ms', cutoff),
+                                      ('meter_samples', 'ts_ms', cutoff),
+                                      ('battery_samples', 'ts_ms, akku_id', cutoff),
+                                      ('events', 'id', events_cutoff)):
+                while True:
+                    with connection:
+                        cursor = connection.execute(
+                            f"DELETE FROM {table} WHERE ({key}) IN "
+                            f"(SELECT {key} FROM {table} WHERE ts_ms < ? ORDER BY ts_ms LIMIT ?)",
+                            (limit, self.PRUNE_BATCH))
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < self.PRUNE_BATCH:
+                        break
+            if deleted:
+                # Freigewordene Seiten an das Dateisystem zurückgeben - execute() liefe nur einen
+                # Schritt (eine Seite), executescript führt das Pragma vollständig aus
+                free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+                connection.executescript("PRAGMA incremental_vacuum;")
+                freed = free_pages - connection.execute("PRAGMA freelist_count").fetchone()[0]
+                logger.info(f"SQLite-Verlauf: {deleted} alte Zeilen gelöscht, {freed} Seiten freigegeben")
+        except sqlite3.Error as e:
+            logger.error(f"SQLite-Verlauf: Bereinigung fehlgeschlagen: {e}")
+
+    def flush(self, timeout: float = 5):
+        """Schreibt gepufferte Zeilen sofort und wartet auf den Schreib-Thread"""
+        if not self._writer.is_alive():
+            return
+        with self._flushed:
+            generation = self._flush_generation
+            self._flush_requested.set()
+            self._flushed.wait_for(lambda: self._flush_generation > generation, timeout)
+
+    def _read(self, sql: str, params: Tuple) -> List[Tuple]:
+        """Lesezugriff über eigene Verbindung - WAL erlaubt Lesen parallel zum Schreiben"""
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def read_range(self, start: float, end: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Regelzyklen im Zeitbereich inkl. Akku-Werten (nur bereits geschriebene Zeilen - bis zu flush_interval verzögert)"""
+        params = (_ms(start), _ms(end))
+        cycles = self._read(
+            "SELECT ts_ms, grid, mode, power, reasoning FROM cycles WHERE ts_ms BETWEEN ? AND ? ORDER BY ts_ms"
+            + (f" LIMIT {int(limit)}" if limit else ""), params)
+
+        batteries: Dict[int, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        for ts_ms, akku_id, mode, power, soc in self._read(
+                "SELECT ts_ms, akku_id, mode, power, soc FROM battery_samples WHERE ts_ms BETWEEN ? AND ?", params):
+            batteries[ts_ms][akku_id] = {'mode': mode, 'power': power, 'soc': soc}
+
+        return [{
+            'timestamp': ts_ms / 1000,
+            'grid_power': grid,
+            'mode': mode,
+            'power': power,
+            'batteries': batteries.get(ts_ms, {}),
+            'reasoning': reasoning or ''
+        } for ts_ms, grid, mode, power, reasoning in cycles]
+
+    def read_meter_samples(self, start: float, end: float) -> List[Tuple[float, Optional[float]]]:
+        """Zählerwerte im Zeitbereich als (Zeit, Leistung)"""
+        rows = self._read("SELECT ts_ms, power FROM meter_samples WHERE ts_ms BETWEEN ? AND ? ORDER BY ts_ms",
+                          (_ms(start), _ms(end)))
+        return [(ts_ms / 1000, power) for ts_ms, power in rows]
+
+    def read_events(self, start: float, end: float, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Ereignisse im Zeitbereich (neueste zuletzt)"""
+        rows = self._read("SELECT ts_ms, level, message FROM events WHERE ts_ms BETWEEN ? AND ? "
+                          "ORDER BY ts_ms DESC LIMIT ?", (_ms(start), _ms(end), limit))
+        return [{'timestamp': ts_ms / 1000, 'level': level, 'message': message}
+                for ts_ms, level, message in reversed(rows)]
+
+    def close(self):
+        """Schreibt verbleibende Zeilen und beendet den Schreib-Thread"""
+        self._running = False
+        self._writer.join(timeout=10)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Größe, Warteschlange und Schreibstatistik zurück"""
+        try:
+            size = os.path.getsize(self.path) + (os.path.getsize(self.path + '-wal') if os.path.exists(self.path + '-wal') else 0)
+        except OSError:
+            size = 0
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'disk_mb': round(size / 1024 / 1024, 2),
+            'queue': self._queue.qsize(),
+            'rows_written': self.rows_written,
+            'rows_dropped': self.rows_dropped,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+            'rollups': self.rollups.get_status() if self.rollups else None
+        }
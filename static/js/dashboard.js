@@ -1,94 +1,163 @@
-let updateInterval;
+let updateInterval = null;
+let eventSource = null;
+let logEntries = [];
+let lastLogSeq = null;
+const MAX_LOG_ENTRIES = 100;
 
-function updateStatus() {
-    fetch('/api/status')
-        .then(response => response.json())
-        .then(data => {
-            // System Status
-            const systemStatus = document.getElementById('systemStatus');
-            const status = data.system_status;
-            systemStatus.innerHTML = `
-                <div class="status-indicator">
-                    <div class="status-dot status-${status.status}"></div>
-                    <span>${status.message}</span>
-                </div>
-            `;
-            
-            // Grid Power
-            const gridPower = document.getElementById('gridPower');
-            const grid = data.grid_power || 0;
-            gridPower.innerHTML = `${grid.toFixed(0)}<span class="unit">W</span>`;
-            
-            // Battery Power
-            const batteryPower = document.getElementById('batteryPower');
-            const battery = data.battery_power || 0;
-            batteryPower.innerHTML = `${battery.toFixed(0)}<span class="unit">W</span>`;
-            
-            // Batteries
-            const batteryGrid = document.getElementById('batteryGrid');
-            batteryGrid.innerHTML = '';
-            
-            Object.entries(data.batteries || {}).forEach(([id, battery]) => {
-                const batteryCard = document.createElement('div');
-                batteryCard.className = 'battery-card';
-                
-                const statusClass = battery.error_count > 0 ? 'error' : 'ok';
-                
-                batteryCard.innerHTML = `
-                    <div class="battery-header">
-                        <div class="battery-name">Akku ${id}</div>
-                        <div class="battery-soc">${battery.soc || 0}%</div>
-                    </div>
-                    <div class="battery-power">${(battery.power || 0).toFixed(0)}W</div>
-                    <div style="font-size: 0.75rem; color: var(--text-secondary); display: flex; align-items: center; gap: 0.25rem;">
-                        <div class="status-dot status-${statusClass}"></div>
-                        ${battery.error_count > 0 ? `Fehler: ${battery.error_count}` : 'Online'}
-                    </div>
-                `;
-                
-                batteryGrid.appendChild(batteryCard);
-            });
-        })
-        .catch(error => console.error('Status update error:', error));
+function renderStatus(data) {
+    // System Status
+    const systemStatus = document.getElementById('systemStatus');
+    const status = data.system_status;
+    systemStatus.innerHTML = `
+        <div class="status-indicator">
+            <div class="status-dot status-${status.status}"></div>
+            <span>${status.message}</span>
+        </div>
+    `;
+
+    // Grid Power
+    const gridPower = document.getElementById('gridPower');
+    const grid = data.grid_power || 0;
+    gridPower.innerHTML = `${grid.toFixed(0)}<span class="unit">W</span>`;
+
+    // Battery Power
+    const batteryPower = document.getElementById('batteryPower');
+    const battery = data.battery_power || 0;
+    batteryPower.innerHTML = `${battery.toFixed(0)}<span class="unit">W</span>`;
+
+    // Batteries
+    const batteryGrid = document.getElementById('batteryGrid');
+    batteryGrid.innerHTML = '';
+
+    Object.entries(data.batteries || {}).forEach(([id, battery]) => {
+        const batteryCard = document.createElement('div');
+        batteryCard.className = 'battery-card';
+
+        const statusClass = battery.error_count > 0 ? 'error' : 'ok';
+        // Geschätzter SoC (zwischen den Modbus-Abfragen fortgeschrieben) wie in /api/dashboard
+        const soc = battery.soc_estimate != null ? battery.soc_estimate : battery.soc;
+        // Vor der ersten Lesung ist der SoC unbekannt (null) - kein Ersatzwert anzeigen
+        const socText = soc != null ? `${Math.round(soc * 10) / 10}%` : '--';
+
+        batteryCard.innerHTML = `
+            <div class="battery-header">
+                <div class="battery-name">Akku ${id}</div>
+                <div class="battery-soc">${socText}</div>
+            </div>
+            <div class="battery-power">${(battery.current_power || 0).toFixed(0)}W</div>
+            <div style="font-size: 0.75rem; color: var(--text-secondary); display: flex; align-items: center; gap: 0.25rem;">
+                <div class="status-dot status-${statusClass}"></div>
+                ${battery.error_count > 0 ? `Fehler: ${battery.error_count}` : 'Online'}
+            </div>
+        `;
+
+        batteryGrid.appendChild(batteryCard);
+    });
+}
+
+function renderLogs() {
+    const container = document.getElementById('logContainer');
+    const logCount = document.getElementById('logCount');
+
+    container.innerHTML = '';
+    logCount.textContent = logEntries.length;
+
+    logEntries.slice(-20).forEach(log => { // Nur die letzten 20 Logs anzeigen
+        const div = document.createElement('div');
+        div.className = 'log-entry';
+        div.innerHTML = `
+            <span class="log-time">${log.timestamp}</span>
+            <span class="log-level log-${log.level.toLowerCase()}">${log.level}</span>
+            <span class="log-message">${log.message}</span>
+        `;
+        container.appendChild(div);
+    });
+
+    container.scrollTop = container.scrollHeight;
+}
+
+// Kurzform von /api/dashboard in die Struktur von /api/status übersetzen
+function expandStatus(s) {
+    const batteries = {};
+    Object.entries(s.a).forEach(([id, [soc, power, mode, errors]]) => {
+        batteries[id] = {soc: soc, current_power: power, current_mode: mode, error_count: errors};
+    });
+    return {
+        system_status: {status: s.st[0], message: s.st[1]},
+        grid_power: s.g,
+        battery_power: s.b,
+        batteries: batteries
+    };
+}
+
+function addLogEntries(entries, replace) {
+    if (replace) logEntries = [];
+    // Einträge, die bereits per Stream oder Polling angekommen sind, überspringen
+    entries.filter(entry => replace || entry.seq > lastLogSeq).forEach(entry => logEntries.push(entry));
+    if (logEntries.length > MAX_LOG_ENTRIES) logEntries = logEntries.slice(-MAX_LOG_ENTRIES);
+    if (logEntries.length > 0) lastLogSeq = logEntries[logEntries.length - 1].seq;
+    renderLogs();
 }
 
-function updateLogs() {
-    fetch('/api/logs')
+function updateDashboard() {
+    // Status und neue Log-Einträge in einer Anfrage
+    const url = lastLogSeq === null ? '/api/dashboard' : `/api/dashboard?log_since=${lastLogSeq}`;
+    fetch(url)
         .then(response => response.json())
         .then(data => {
-            const container = document.getElementById('logContainer');
-            const logCount = document.getElementById('logCount');
-            
-            container.innerHTML = '';
-            logCount.textContent = data.logs.length;
-            
-            data.logs.slice(-20).forEach(log => { // Nur die letzten 20 Logs anzeigen
-                const div = document.createElement('div');
-                div.className = 'log-entry';
-                div.innerHTML = `
-                    <span class="log-time">${log.timestamp}</span>
-                    <span class="log-level log-${log.level.toLowerCase()}">${log.level}</span>
-                    <span class="log-message">${log.message}</span>
-                `;
-                container.appendChild(div);
-            });
-            
-            container.scrollTop = container.scrollHeight;
+            if (data.s) renderStatus(expandStatus(data.s));
+            if (data.l.length > 0 || data.t) {
+                const entries = data.l.map(([seq, timestamp, level, message]) => ({seq, timestamp, level, message}));
+                addLogEntries(entries, data.t === 1);
+            }
+            lastLogSeq = data.ls;
         })
-        .catch(error => console.error('Log update error:', error));
+        .catch(error => console.error('Dashboard update error:', error));
+}
+
+// Polling als Fallback, wenn kein Live-Stream verfügbar ist
+function startPolling() {
+    if (updateInterval) return;
+    updateDashboard();
+    updateInterval = setInterval(updateDashboard, 2000);
+}
+
+function stopPolling() {
+    if (updateInterval) clearInterval(updateInterval);
+    updateInterval = null;
+}
+
+// Live-Updates per Server-Sent Events
+function startStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    eventSource = new EventSource('/api/stream');
+
+    eventSource.addEventListener('status', event => renderStatus(JSON.parse(event.data)));
+
+    eventSource.addEventListener('logs', event => {
+        const data = JSON.parse(event.data);
+        addLogEntries(data.logs, true);
+        lastLogSeq = data.last_seq;
+    });
+
+    eventSource.addEventListener('log', event => addLogEntries([JSON.parse(event.data)], false));
+
+    eventSource.onopen = () => stopPolling();
+    // EventSource verbindet sich selbst neu - bis dahin per Polling aktualisieren
+    eventSource.onerror = () => startPolling();
 }
 
 // Initialisierung
 window.addEventListener('load', () => {
-    updateStatus();
-    updateLogs();
-    updateInterval = setInterval(() => {
-        updateStatus();
-        updateLogs();
-    }, 2000);
+    startStream();
 });
 
 // Cleanup on page exit
 window.addEventListener('beforeunload', () => {
-    if (updateInterval) clearInterval(updateInterval);
+    stopPolling();
+    if (eventSource) eventSource.close();
 });
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Status-Snapshots für Marstek PV-Akku Steuerung
+Die Regelschleife veröffentlicht nach jedem Zyklus einen unveränderlichen
+Snapshot, den der Web-Server ohne Geräte-I/O ausliefert
+"""
+
+import json
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping
+
+from http_cache import content_etag
+
+# Felder, die sich bei jeder Veröffentlichung ändern, ohne dass sich der Zustand ändert -
+# sie fließen nicht in den ETag ein (schwacher ETag: inhaltlich gleichwertig)
+VOLATILE_KEYS = frozenset({'timestamp', 'seconds_since_success', 'seconds_since_poll', 'soc_age_seconds'})
+
+
+def _strip_volatile(value):
+    """Entfernt flüchtige Felder rekursiv"""
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+class StatusSnapshot:
+    """Unveränderlicher Systemstatus inkl. fertig serialisierter JSON-Antwort"""
+
+    __slots__ = ('_seq', '_created', '_data', '_payload', '_etag')
+
+    def __init__(self, seq: int, data: Dict[str, Any]):
+        payload = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        object.__setattr__(self, '_seq', seq)
+        object.__setattr__(self, '_created', time.time())
+        # Eigene Kopie aus dem serialisierten Stand - spätere Änderungen am Quell-Dict wirken nicht
+        copy = json.loads(payload)
+        object.__setattr__(self, '_data', MappingProxyType(copy))
+        object.__setattr__(self, '_payload', payload)
+        # ETag einmalig beim Veröffentlichen berechnen, nicht pro Anfrage
+        stable = json.dumps(_strip_volatile(copy), sort_keys=True).encode('utf-8')
+        object.__setattr__(self, '_etag', content_etag(stable))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StatusSnapshot ist unveränderlich")
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def created(self) -> float:
+        return self._created
+
+    @property
+    def data(self) -> Mapping[str, Any]:
+        return self._data
+
+    @property
+    def payload(self) -> bytes:
+        return self._payload
+    
+    @property
+    def etag(self) -> str:
+        return self._etag
+
+
+class SnapshotStore:
+    """Hält den jeweils neuesten Snapshot - Lesen ist ein einfacher Referenzzugriff"""
+
+    def __init__(self):
+        self._latest: Optional[StatusSnapshot] = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, data: Dict[str, Any]) -> StatusSnapshot:
+        """Veröffentlicht einen neuen Snapshot (Aufruf aus der Regelschleife)"""
+        with self._lock:
+            self._seq += 1
+            snapshot = StatusSnapshot(self._seq, data)
+            self._latest = snapshot
+        return snapshot
+
+    def latest(self) -> Optional[StatusSnapshot]:
+        """Gibt den neuesten Snapshot zurück oder None vor der ersten Veröffentlichung"""
+        return self._latest
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Adaptiver SoC-Abfrageplaner für Marstek PV-Akku Steuerung
+Akkus unter hoher Last oder nahe den SoC-Grenzen werden häufiger gelesen,
+ruhende Akkus im mittleren SoC-Bereich selten. Lesungen werden gestaffelt,
+damit sie sich nie auf dem RS485-Bus häufen.
+"""
+
+import logging
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+
+class SocPollScheduler:
+    """Plant die SoC-Registerlesungen je Akku"""
+
+    def __init__(self, akku_ids: List[int], min_interval: float, max_interval: float,
+                 max_power: float, min_soc: float, max_soc: float,
+                 near_limit_margin: float = 5, min_spacing: float = 3):
+        if min_interval > max_interval:
+            raise ValueError("soc_poll_min_seconds darf nicht größer als soc_poll_max_seconds sein")
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_power = max_power
+        self.min_soc = min_soc
+        self.max_soc = max_soc
+        self.near_limit_margin = near_limit_margin
+        self.min_spacing = min_spacing
+
+        # Alle Akkus sofort fällig - die Staffelung verteilt die ersten Lesungen
+        self.next_due: Dict[int, float] = {akku_id: 0.0 for akku_id in akku_ids}
+        self.intervals: Dict[int, float] = {akku_id: min_interval for akku_id in akku_ids}
+        self.last_read_time: Dict[int, float] = {}
+        self.last_bus_read = 0.0
+        self.read_count = 0
+
+        logger.info(f"SoC-Abfrage adaptiv: {min_interval}-{max_interval}s, "
+                    f"Grenznähe ±{near_limit_margin}%, Mindestabstand {min_spacing}s")
+
+    def compute_interval(self, soc: Optional[float], power: float) -> float:
+        """Abfrageintervall aus Leistung und Abstand zu den SoC-Grenzen"""
+        if soc is None:
+            return self.min_interval
+
+        # Linear von max_interval (Leerlauf) bis min_interval (Volllast)
+        load = min(1.0, abs(power) / self.max_power) if self.max_power > 0 else 0.0
+        interval = self.max_interval - (self.max_interval - self.min_interval) * load
+
+        # Nahe an einer Grenze: bis auf min_interval verkürzen
+        distance = min(soc - self.min_soc, self.max_soc - soc)
+        if distance <= self.near_limit_margin:
+            interval = self.min_interval
+        elif distance <= 2 * self.near_limit_margin:
+            interval = min(interval, (self.min_interval + self.max_interval) / 2)
+
+        return interval
+
+    def get_due(self, now: float) -> Optional[int]:
+        """Gibt den am längsten überfälligen Akku zurück - höchstens eine Lesung je Mindestabstand"""
+        if now - self.last_bus_read < self.min_spacing:
+            return None
+
+        overdue = [akku_id for akku_id, due in self.next_due.items() if due <= now]
+        if not overdue:
+            return None
+        return min(overdue, key=lambda akku_id: self.next_due[akku_id])
+
+    def mark_read(self, akku_id: int, now: float, soc: Optional[float], power: float):
+        """Vermerkt eine Lesung und plant die nächste"""
+        interval = self.compute_interval(soc, power)
+        self.intervals[akku_id] = interval
+        self.last_read_time[akku_id] = now
+        self.last_bus_read = now
+        self.read_count += 1
+
+        next_due = now + interval
+        # Staffelung: nicht im selben Zeitfenster wie andere geplante Lesungen
+        for _ in range(len(self.next_due)):
+            clash = any(other != akku_id and abs(due - next_due) < self.min_spacing
+                        for other, due in self.next_due.items())
+            if not clash:
+                break
+            next_due += self.min_spacing
+        self.next_due[akku_id] = next_due
+
+    def update_load(self, akku_id: int, now: float, soc: Optional[float], power: float):
+        """Zieht die nächste Lesung vor, wenn sich Last oder SoC-Lage verschärft haben"""
+        if akku_id not in self.last_read_time:
+            return
+        interval = self.compute_interval(soc, power)
+        if interval < self.intervals[akku_id]:
+            self.intervals[akku_id] = interval
+            self.next_due[akku_id] = min(self.next_due[akku_id], self.last_read_time[akku_id] + interval)
+
+    def get_status(self, now: float) -> Dict[str, Any]:
+        """Gibt Planungszustand je Akku zurück"""
+        return {
+            'read_count': self.read_count,
+            'batteries': {
+                akku_id: {
+                    'interval_seconds': round(self.intervals[akku_id], 1),
+                    'next_read_in_seconds': round(max(0.0, due - now), 1)
+                }
+                for akku_id, due in self.next_due.items()
+            }
+        }
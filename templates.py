@@ -463,6 +463,8 @@ SETUP_HTML = '''
     <script>
         let currentLanguage = 'de';
         let updateInterval = null;
+        let lastLogSeq = null;
+        const MAX_LOG_ENTRIES = 50;
         
         // Übersetzungen
         const translations = {
@@ -723,16 +725,15 @@ SETUP_HTML = '''
                 .catch(error => console.error('Config load error:', error));
         }
         
-        function updateStatus() {
-            // Diese Funktion bleibt für andere Status-Updates
-        }
-        
         function updateLogs() {
-            fetch('/api/logs')
+            // Nur neue Einträge seit der letzten Sequenznummer abrufen
+            const url = lastLogSeq === null ? '/api/logs' : `/api/logs?since=${lastLogSeq}`;
+            fetch(url)
                 .then(response => response.json())
                 .then(data => {
                     const container = document.getElementById('logContainer');
-                    container.innerHTML = '';
+                    if (data.truncated) container.innerHTML = '';
+                    lastLogSeq = data.last_seq;
                     
                     data.logs.forEach(log => {
                         const div = document.createElement('div');
@@ -745,6 +746,11 @@ SETUP_HTML = '''
                         container.appendChild(div);
                     });
                     
+                    // Anzeige begrenzen - älteste Einträge entfernen
+                    while (container.children.length > MAX_LOG_ENTRIES) {
+                        container.removeChild(container.firstElementChild);
+                    }
+                    
                     container.scrollTop = container.scrollHeight;
                 })
                 .catch(error => console.error('Log update error:', error));
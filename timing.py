@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Zeitmessung für Marstek PV-Akku Steuerung
+Leichtgewichtige Spans je Phase (Zähler lesen, Berechnung, Modbus, Pausen) mit
+Histogrammen je Phase und den langsamsten Regelzyklen samt vollständiger Aufschlüsselung
+"""
+
+import bisect
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Any, List
+
+# Bucket-Grenzen in Sekunden (für Perzentil-Schätzung)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Anzahl aufbewahrter langsamster Zyklen
+SLOWEST_CYCLES_KEPT = 10
+
+# Spans je Zyklus begrenzen (Schutz bei Schleifen über viele Akkus)
+MAX_SPANS_PER_CYCLE = 200
+
+
+class StageStats:
+    """Anzahl, Summe, Maximum und Bucket-Verteilung einer Phase"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(STAGE_BUCKETS) + 1)
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        self.buckets[bisect.bisect_left(STAGE_BUCKETS, duration)] += 1
+
+    def _percentile(self, fraction: float) -> float:
+        """Obere Bucket-Grenze, unter der der Anteil fraction der Messungen liegt"""
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(STAGE_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 2) if self.count else None,
+            'p50_ms': round(self._percentile(0.5) * 1000, 2) if self.count else None,
+            'p95_ms': round(self._percentile(0.95) * 1000, 2) if self.count else None,
+            'max_ms': round(self.max * 1000, 2),
+            'total_s': round(self.total, 3)
+        }
+
+
+class _Cycle:
+    """Spans eines laufenden Regelzyklus"""
+
+    __slots__ = ('start', 'spans', 'depth')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.spans: List[tuple] = []  # (Phase, Start-Offset, Dauer, Tiefe)
+        self.depth = 0
+
+
+class Span:
+    """Misst eine Phase; als Kontextmanager verwenden, Dauer danach in duration"""
+
+    __slots__ = ('recorder', 'stage', 'start', 'duration', 'cycle', 'depth')
+
+    def __init__(self, recorder: 'TimingRecorder', stage: str):
+        self.recorder = recorder
+        self.stage = stage
+        self.duration = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.cycle = getattr(self.recorder._local, 'cycle', None)
+        if self.cycle is not None:
+            self.depth = self.cycle.depth
+            self.cycle.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if self.cycle is not None:
+            self.cycle.depth -= 1
+            if len(self.cycle.spans) < MAX_SPANS_PER_CYCLE:
+                self.cycle.spans.append((self.stage, self.start - self.cycle.start, self.duration, self.depth))
+        self.recorder._record(self.stage, self.duration)
+        return False
+
+
+class CycleSpan(Span):
+    """Span für einen ganzen Regelzyklus - sammelt alle inneren Spans desselben Threads"""
+
+    __slots__ = ('info',)
+
+    def __enter__(self) -> 'CycleSpan':
+        self.info: Dict[str, Any] = {}
+        self.start = time.perf_counter()
+        self.cycle = _Cycle(self.start)
+        self.recorder._local.cycle = self.cycle
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.recorder._local.cycle = None
+        self.recorder._record(self.stage, self.duration)
+        self.recorder._finish_cycle(self)
+        return False
+
+
+class TimingRecorder:
+    """Sammelt Phasen-Statistiken und die langsamsten Regelzyklen"""
+
+    def __init__(self, slowest_kept: int = SLOWEST_CYCLES_KEPT):
+        self.slowest_kept = slowest_kept
+        self._stages: Dict[str, StageStats] = {}
+        self._slowest: List[tuple] = []  # Min-Heap (Dauer, Nr., Eintrag)
+        self._sequence = itertools.count()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.since = time.time()
+
+    def span(self, stage: str) -> Span:
+        return Span(self, stage)
+
+    def cycle(self) -> CycleSpan:
+        return CycleSpan(self, 'cycle')
+
+    def sleep(self, seconds: float):
+        """time.sleep mit eigener Phase 'sleep'"""
+        with Span(self, 'sleep'):
+            time.sleep(seconds)
+
+    def _record(self, stage: str, duration: float):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.add(duration)
+
+    def _finish_cycle(self, cycle_span: CycleSpan):
+        with self._lock:
+            if len(self._slowest) >= self.slowest_kept and cycle_span.duration <= self._slowest[0][0]:
+                return
+            entry = {
+                'timestamp': time.time(),
+                'duration_ms': round(cycle_span.duration * 1000, 2),
+                'info': cycle_span.info,
+                'spans': [
+                    {'stage': stage, 'offset_ms': round(offset * 1000, 2),
+                     'duration_ms': round(duration * 1000, 2), 'depth': depth}
+                    for stage, offset, duration, depth in sorted(cycle_span.cycle.spans, key=lambda s: s[1])
+                ]
+            }
+            item = (cycle_span.duration, next(self._sequence), entry)
+            if len(self._slowest) < self.slowest_kept:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heapreplace(self._slowest, item)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Phasen-Histogramme und langsamste Zyklen für /api/debug/timings"""
+        with self._lock:
+            stages = {stage: stats.to_dict() for stage, stats in sorted(self._stages.items())}
+            histograms = {
+                stage: dict(zip([f"le_{b * 1000:g}ms" for b in STAGE_BUCKETS] + ['inf'], stats.buckets))
+                for stage, stats in sorted(self._stages.items())
+            }
+            slowest = [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+        return {
+            'since': self.since,
+            'stages': stages,
+            'histograms': histograms,
+            'slowest_cycles': slowest
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._slowest.clear()
+            self.since = time.time()
+
+
+# Globale Instanz - Spans werden direkt an den Messstellen erzeugt
+TIMINGS = TimingRecorder()
+
+
+def span(stage: str) -> Span:
+    """Misst eine Phase: with timing.span('modbus_write'): ..."""
+    return TIMINGS.span(stage)
+
+
+def sleep(seconds: float):
+    """Pause, die als Phase 'sleep' gezählt wird"""
+    TIMINGS.sleep(seconds)
@@ -683,7 +683,9 @@ CONFIG_HTML_TEMPLATE = '''
             const akkuIdsText = document.getElementById('akkuIds').value;
             const akkuIds = akkuIdsText.split(',').map(id => parseInt(id.trim())).filter(id => !isNaN(id));
             
-            return {
+            // Formularwerte über die geladene Konfiguration legen, damit
+            // Einstellungen ohne Formularfeld beim Speichern erhalten bleiben
+            return mergeConfig(originalConfig, {
                 energy_meter: {
                     type: document.getElementById('meterType').value,
                     comment: "Verfügbare Typen: 'shelly' oder 'ecotracker'"
@@ -723,7 +725,19 @@ CONFIG_HTML_TEMPLATE = '''
                     max_size_mb: parseInt(document.getElementById('logMaxSize').value),
                     backup_count: 3
                 }
-            };
+            });
+        }
+        
+        function mergeConfig(base, updates) {
+            const result = JSON.parse(JSON.stringify(base || {}));
+            Object.entries(updates).forEach(([key, value]) => {
+                if (value && typeof value === 'object' && !Array.isArray(value)) {
+                    result[key] = mergeConfig(result[key], value);
+                } else {
+                    result[key] = value;
+                }
+            });
+            return result;
         }
         
         function saveConfig() {
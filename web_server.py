@@ -6,10 +6,22 @@ Minimaler Flask-Server mit Live-Daten und Log-Anzeige
 
 import logging
 import json
+import math
 import os
+import time
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_from_directory, Response, stream_with_context
 from typing import Dict, Any
+from status_snapshot import SnapshotStore
+from event_stream import EventHub
+from log_buffer import LogRingBuffer
+from config_loader import ConfigFileCache
+from http_cache import content_etag, conditional_response
+from asset_pipeline import AssetPipeline
+from wsgi_server import RequestMetrics, create_server
+import metrics
+import timing
+from profiler import SamplingProfiler
 from templates import SETUP_HTML  # Import des Setup Templates
 from web_config import CONFIG_HTML_TEMPLATE as CONFIG_HTML  # Import des Config Templates
 
@@ -18,76 +30,249 @@ logger = logging.getLogger(__name__)
 class SimpleWebServer:
     """Einfacher Webserver für Status-Anzeige"""
     
+    STREAM_INITIAL_LOGS = 100  # Log-Einträge beim Aufbau einer Live-Verbindung
+    MAX_HISTORY_POINTS = 2000  # Obergrenze für /api/history?points=
+    
     def __init__(self, shelly_client, battery_manager, controller, config):
         self.energy_meter = shelly_client  # Kann Shelly oder EcoTracker sein
         self.batteries = battery_manager
         self.controller = controller
         self.config = config
+        self.history = None  # Verlaufsspeicher, wird von main.py gesetzt
+        self.energy = None   # Energiebilanz, wird von main.py gesetzt
+        self.soc_scheduler = None  # SoC-Abfrageplaner, wird von main.py gesetzt
         
+        # Eigene /static-Route über die Asset-Pipeline statt Flasks Standard-Route
         self.app = Flask(__name__, 
                         template_folder='templates',
-                        static_folder='static')
+                        static_folder=None)
         self.app.logger.setLevel(logging.WARNING)  # Flask-Logs reduzieren
         
-        # Log-Puffer für Web-Anzeige
-        self.log_buffer = []
-        self.max_log_entries = 50
+        web_config = config.get_web_config()
+        
+        # Log-Puffer für Web-Anzeige (Ringpuffer mit Sequenznummern)
+        self.log_buffer = LogRingBuffer(web_config.get('log_buffer_size', 500))
+        
+        # Status-Snapshot der Regelschleife (API liefert ohne Geräte-I/O aus)
+        self.snapshots = SnapshotStore()
+        
+        # Kurzform des letzten Snapshots für /api/dashboard
+        self.compact_status = b'null'
+        
+        # config.json für /api/get_config (nur nach Änderung neu einlesen)
+        self.config_file_cache = ConfigFileCache('config.json')
+        
+        # Live-Verbindungen belegen je einen Worker-Thread dauerhaft -
+        # mindestens zwei Worker bleiben für normale Anfragen frei
+        self.web_config = web_config
+        max_stream_clients = web_config.get('max_stream_clients', 4)
+        if web_config.get('server', 'waitress') == 'waitress':
+            stream_limit = max(1, web_config.get('threads', 6) - 2)
+            if max_stream_clients > stream_limit:
+                logger.warning(f"max_stream_clients auf {stream_limit} begrenzt (web.threads={web_config.get('threads', 6)})")
+                max_stream_clients = stream_limit
+        
+        # Live-Updates per Server-Sent Events
+        self.events = EventHub(
+            max_clients=max_stream_clients,
+            heartbeat_seconds=web_config.get('stream_heartbeat_seconds', 15)
+        )
+        
+        # Sampling-Profiler für /api/debug/profile (belegt während des Laufs einen Worker)
+        self.profiler = SamplingProfiler(
+            max_seconds=web_config.get('profile_max_seconds', 60),
+            interval_seconds=web_config.get('profile_interval_ms', 10) / 1000
+        )
+        
+        # Request-Metriken für alle Anfragen (WSGI-Middleware)
+        self.request_metrics = RequestMetrics(self.app.wsgi_app)
+        self.app.wsgi_app = self.request_metrics
+        self.server = None
+        
+        # Statische Dateien und Seiten einmalig hashen und komprimieren
+        self.assets = AssetPipeline(os.path.join(self.app.root_path, 'static'))
+        self.assets.build()
+        self.app.jinja_env.globals['asset_url'] = self.assets.url
+        self._build_pages()
         
         self._setup_routes()
         logger.info("Web-Server initialisiert")
     
+    def _build_pages(self):
+        """Rendert die Seiten vorab - sie enthalten keine Laufzeitdaten"""
+        with self.app.app_context():
+            self.assets.add_page('dashboard', render_template('dashboard.html'))
+        self.assets.add_page('setup', SETUP_HTML)
+        self.assets.add_page('config', CONFIG_HTML)
+    
     def _setup_routes(self):
         """Erstellt Flask-Routen"""
         
         @self.app.route('/')
         def dashboard():
             """Haupt-Dashboard"""
-            return render_template('dashboard.html')
+            return self.assets.page_response('dashboard')
         
         @self.app.route('/static/<path:filename>')
         def serve_static(filename):
-            """Statische Dateien servieren"""
-            return send_from_directory('static', filename)
+            """Statische Dateien servieren (vorkomprimiert, gehashte URLs unbegrenzt cachebar)"""
+            response = self.assets.static_response(filename)
+            if response is None:
+                return send_from_directory('static', filename)
+            return response
+        
+        @self.app.route('/api/debug/timings')
+        def get_timings():
+            """Laufzeit je Phase und die langsamsten Regelzyklen (?reset=1 setzt zurück)"""
+            status = timing.TIMINGS.get_status()
+            if request.args.get('reset') == '1':
+                timing.TIMINGS.reset()
+            return jsonify(status)
+        
+        @self.app.route('/api/debug/profile')
+        def get_profile():
+            """
+            Sampling-Profil aller Threads: ?seconds=30&interval_ms=10
+            Antwort im Collapsed-Stack-Format (flamegraph.pl, speedscope.app)
+            """
+            try:
+                seconds = float(request.args.get('seconds', 10))
+                interval_ms = float(request.args.get('interval_ms', 0)) or None
+            except ValueError:
+                return jsonify({'error': 'seconds/interval_ms müssen Zahlen sein'}), 400
+            if not math.isfinite(seconds) or (interval_ms is not None and not math.isfinite(interval_ms)):
+                return jsonify({'error': 'seconds/interval_ms müssen endliche Zahlen sein'}), 400
+            if interval_ms is not None and interval_ms < 1:
+                return jsonify({'error': 'interval_ms muss mindestens 1 sein'}), 400
+            
+            result = self.profiler.profile(seconds, interval_ms / 1000 if interval_ms else None)
+            if result is None:
+                return jsonify({'error': 'Profiling läuft bereits'}), 409
+            
+            response = Response(SamplingProfiler.collapsed(result), mimetype='text/plain')
+            response.headers['Content-Disposition'] = \
+                f"attachment; filename=marstek-profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+            response.headers['X-Profile-Samples'] = str(result['samples'])
+            return response
+        
+        @self.app.route('/api/debug/server')
+        def get_server_status():
+            """Auslastung des Web-Servers (Worker, Warteschlange, Latenz)"""
+            status = {
+                'server': 'waitress' if self.server else 'flask',
+                'requests': self.request_metrics.get_status(),
+                'stream': self.events.get_status(),
+                'profiler': self.profiler.get_status()
+            }
+            if self.server:
+                status['pool'] = self.server.get_status()
+            return jsonify(status)
         
         @self.app.route('/api/status')
         def api_status():
-            """API-Endpunkt für Live-Status"""
-            try:
-                # Energy Meter Status
-                meter_status = self.energy_meter.get_status()
-                current_power = self.energy_meter.get_power()
-                
-                # Battery-Status
-                battery_status = self.batteries.get_all_status()
-                total_battery_power = self.batteries.get_total_power()
-                
-                # Controller-Status
-                controller_status = self.controller.get_status()
-                controller_status['enabled'] = self.controller.enabled
-                
-                # Zusammenfassung
-                status = {
-                    'timestamp': datetime.now().isoformat(),
-                    'grid_power': current_power,
-                    'battery_power': total_battery_power,
-                    'resulting_power': (current_power or 0) - total_battery_power,
-                    'energy_meter': meter_status,
-                    'meter_type': self.config.get_energy_meter_type(),
-                    'batteries': battery_status,
-                    'controller': controller_status,
-                    'system_status': self._get_system_status(meter_status, battery_status)
-                }
-                
-                return jsonify(status)
-                
-            except Exception as e:
-                logger.error(f"API-Status-Fehler: {e}")
-                return jsonify({'error': str(e)}), 500
+            """API-Endpunkt für Live-Status - liefert den letzten Snapshot der Regelschleife"""
+            snapshot = self.snapshots.latest()
+            if snapshot is None:
+                return jsonify({'error': 'Noch kein Status verfügbar'}), 503
+            return conditional_response(snapshot.payload, snapshot.etag)
+        
+        @self.app.route('/api/stream')
+        def api_stream():
+            """Server-Sent Events: Status-Snapshots und neue Log-Einträge"""
+            if not self.events.try_register():
+                return jsonify({'error': 'Zu viele Live-Verbindungen'}), 503
+            
+            # Cursor vor den Startdaten lesen, damit dazwischen veröffentlichte Ereignisse nachgeliefert werden
+            since = self.events.cursor()
+            initial_blocks = []
+            snapshot = self.snapshots.latest()
+            if snapshot is not None:
+                initial_blocks.append(EventHub.format_event('status', snapshot.payload))
+            logs, last_seq = self.log_buffer.tail_with_cursor(self.STREAM_INITIAL_LOGS)
+            logs_payload = json.dumps({'logs': logs, 'last_seq': last_seq}, ensure_ascii=False).encode('utf-8')
+            initial_blocks.append(EventHub.format_event('logs', logs_payload))
+            
+            return Response(
+                stream_with_context(self.events.stream(initial_blocks, since)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
         @self.app.route('/api/logs')
         def api_logs():
-            """API-Endpunkt für Log-Anzeige"""
-            return jsonify({'logs': self.log_buffer})
+            """API-Endpunkt für Log-Anzeige - mit ?since=<seq> nur neue Einträge"""
+            since = request.args.get('since', type=int)
+            if since is None:
+                logs, truncated = self.log_buffer.snapshot(), False
+            else:
+                logs, truncated = self.log_buffer.since(since)
+            payload = json.dumps({'logs': logs, 'last_seq': self.log_buffer.last_seq, 'truncated': truncated},
+                                 ensure_ascii=False).encode('utf-8')
+            return conditional_response(payload, content_etag(payload))
+        
+        @self.app.route('/api/dashboard')
+        def api_dashboard():
+            """
+            Status und neue Log-Einträge in einer kompakten Antwort (ein Request pro Aktualisierung)
+            s: Status (siehe _compact_status), l: [[seq, Zeit, Level, Text], ...], ls: letzte Log-Sequenz, t: 1 = Logs gekürzt
+            """
+            since = request.args.get('log_since', type=int)
+            if since is None:
+                logs, truncated = self.log_buffer.tail(self.STREAM_INITIAL_LOGS), True
+            else:
+                logs, truncated = self.log_buffer.since(since)
+            log_rows = [[e['seq'], e['timestamp'], e['level'], e['message']] for e in logs]
+            payload = (b'{"s":' + self.compact_status +
+                       b',"l":' + self._compact_json(log_rows) +
+                       f',"ls":{self.log_buffer.last_seq},"t":{int(truncated)}}}'.encode('utf-8'))
+            return conditional_response(payload, content_etag(payload))
+        
+        @self.app.route('/api/history')
+        def api_history():
+            """
+            Verlauf für Diagramme: ?series=grid,battery&from=<unix>&to=<unix>&points=500
+            Die Auflösung (Rohdaten, 1 min, 15 min, 1 h) wird passend zum Zeitraum gewählt
+            """
+            if self.history is None:
+                return jsonify({'error': 'Verlauf deaktiviert'}), 503
+            
+            now = time.time()
+            end = request.args.get('to', now, type=float)
+            start = request.args.get('from', end - 86400, type=float)
+            points = max(10, min(request.args.get('points', 500, type=int), self.MAX_HISTORY_POINTS))
+            series = [s for s in request.args.get('series', 'grid,battery').split(',') if s]
+            
+            available = self.history.rollups.series if self.history.rollups else None
+            unknown = [s for s in series if available is not None and s not in available]
+            if unknown:
+                problem = ', '.join(unknown)
+            elif not (math.isfinite(start) and math.isfinite(end)):
+                problem = 'from/to nicht endlich'
+            elif start >= end:
+                problem = 'from >= to'
+            else:
+                problem = None
+            if problem:
+                return jsonify({'error': f"Ungültige Abfrage: {problem}", 'available': available}), 400
+            
+            data = self.history.query(series, start, end, points)
+            payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            return conditional_response(payload, content_etag(payload))
+        
+        @self.app.route('/api/energy')
+        def api_energy():
+            """Energiebilanz: Bezug/Einspeisung, Laden/Entladen je Akku (aus Sollwerten), Eigenverbrauch"""
+            if self.energy is None:
+                return jsonify({'error': 'Energiebilanz deaktiviert'}), 503
+            payload = json.dumps(self.energy.get_summary(), ensure_ascii=False).encode('utf-8')
+            return conditional_response(payload, content_etag(payload))
+        
+        @self.app.route('/metrics')
+        def metrics_endpoint():
+            """Prometheus/OpenMetrics-Export - nur Zählerstände, kein Geräte-I/O"""
+            openmetrics = 'application/openmetrics-text' in request.headers.get('Accept', '')
+            content_type = metrics.OPENMETRICS_CONTENT_TYPE if openmetrics else metrics.TEXT_CONTENT_TYPE
+            return Response(metrics.REGISTRY.render(openmetrics), content_type=content_type)
         
         @self.app.route('/setup')
         def setup_page():
@@ -97,7 +282,7 @@ class SimpleWebServer:
             self.controller.enabled = False
             self.batteries.stop_all()
             self.add_log_entry('WARNING', 'Setup-Modus aktiviert - Akku-Steuerung gestoppt')
-            return SETUP_HTML
+            return self.assets.page_response('setup')
         
         @self.app.route('/api/scan_modbus_ids', methods=['POST'])
         def scan_modbus_ids():
@@ -212,7 +397,7 @@ class SimpleWebServer:
         def config_page():
             """Konfigurations-Seite"""
             logger.info("Config-Seite aufgerufen")
-            return CONFIG_HTML
+            return self.assets.page_response('config')
         
         @self.app.route('/api/get_battery_config')
         def get_battery_config():
@@ -232,10 +417,9 @@ class SimpleWebServer:
         def get_config():
             """Gibt aktuelle Konfiguration zurück"""
             try:
-                import json
-                with open('config.json', 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
-                return jsonify({'success': True, 'config': config_data})
+                config_data, raw = self.config_file_cache.get()
+                payload = json.dumps({'success': True, 'config': config_data}, ensure_ascii=False).encode('utf-8')
+                return conditional_response(payload, content_etag(raw))
             except Exception as e:
                 logger.error(f"Fehler beim Laden der Konfiguration: {e}")
                 return jsonify({'success': False, 'error': str(e)}), 500
@@ -257,6 +441,7 @@ class SimpleWebServer:
                 # Neue Konfiguration speichern
                 with open('config.json', 'w', encoding='utf-8') as f:
                     json.dump(new_config, f, indent=2, ensure_ascii=False)
+                self.config_file_cache.invalidate()
                 
                 self.add_log_entry('INFO', 'Konfiguration gespeichert')
                 return jsonify({'success': True, 'message': 'Konfiguration gespeichert'})
@@ -281,6 +466,20 @@ class SimpleWebServer:
                 self.controller.target_grid_power_discharge = control_config.get('target_grid_power_discharge', 20)
                 self.controller.min_soc_discharge = battery_config['min_soc_for_discharge']
                 self.controller.max_soc_charge = battery_config['max_soc_for_charge']
+                self.controller.power_deadband = control_config.get('power_deadband_watts', 40)
+                self.controller.power_hysteresis = control_config.get('power_hysteresis_watts', 20)
+                self.controller.min_setpoint_dwell = control_config.get('min_setpoint_dwell_seconds', 6)
+                self.controller.min_mode_dwell = control_config.get('min_mode_dwell_seconds', 15)
+                self.controller.dwell_bypass_power = control_config.get('dwell_bypass_watts', 300)
+                self.controller.max_power_change_rate = control_config.get('max_power_change_watts', 750)
+                self.controller.start_threshold = control_config.get('start_threshold_watts', 50)
+                self.controller.low_soc_threshold = control_config.get('low_soc_threshold_percent', 13)
+                self.controller.low_soc_min_surplus = control_config.get('low_soc_min_surplus_watts', -100)
+                
+                # SoC-Grenzen auch für die Grenznähe der adaptiven SoC-Abfrage
+                if self.soc_scheduler:
+                    self.soc_scheduler.min_soc = battery_config['min_soc_for_discharge']
+                    self.soc_scheduler.max_soc = battery_config['max_soc_for_charge']
                 
                 # Hinweis: Einige Parameter (wie IP-Adressen, Akku-IDs) können nicht ohne Neustart geändert werden
                 
@@ -288,13 +487,87 @@ class SimpleWebServer:
                 return jsonify({
                     'success': True, 
                     'message': 'Einige Einstellungen wurden übernommen. Für vollständige Änderungen ist ein Neustart erforderlich.',
-                    'reloadable': ['target_grid_power_charge', 'target_grid_power_discharge', 'min_soc_for_discharge', 'max_soc_for_charge']
+                    'reloadable': ['target_grid_power_charge', 'target_grid_power_discharge', 'min_soc_for_discharge', 'max_soc_for_charge',
+                                   'power_deadband_watts', 'power_hysteresis_watts', 'min_setpoint_dwell_seconds',
+                                   'min_mode_dwell_seconds', 'dwell_bypass_watts', 'max_power_change_watts',
+                                   'start_threshold_watts', 'low_soc_threshold_percent', 'low_soc_min_surplus_watts']
                 })
                 
             except Exception as e:
                 logger.error(f"Fehler beim Neuladen der Konfiguration: {e}")
                 return jsonify({'success': False, 'error': str(e)}), 500
     
+    def publish_status(self):
+        """
+        Erstellt einen Status-Snapshot aus zwischengespeicherten Daten (kein Geräte-I/O)
+        Wird von der Regelschleife nach jedem Zyklus aufgerufen
+        """
+        try:
+            # Energy Meter Status aus den letzten Abrufen
+            meter_status = self.energy_meter.get_cached_status()
+            current_power = meter_status['current_average']
+            
+            # Battery-Status
+            battery_status = self.batteries.get_all_status()
+            total_battery_power = self.batteries.get_total_power()
+            
+            # Controller-Status
+            controller_status = self.controller.get_status()
+            controller_status['enabled'] = self.controller.enabled
+            
+            # Zusammenfassung
+            status = {
+                'timestamp': datetime.now().isoformat(),
+                'grid_power': current_power,
+                'battery_power': total_battery_power,
+                'resulting_power': (current_power or 0) - total_battery_power,
+                'energy_meter': meter_status,
+                'meter_type': self.config.get_energy_meter_type(),
+                'batteries': battery_status,
+                'controller': controller_status,
+                'system_status': self._get_system_status(meter_status, battery_status)
+            }
+            
+            snapshot = self.snapshots.publish(status)
+            # Kompakte Dashboard-Fassung einmal pro Snapshot serialisieren (eine Zuweisung - threadsicher)
+            self.compact_status = self._compact_json(self._compact_status(snapshot.data))
+            self.events.publish('status', snapshot.payload)
+            return snapshot
+            
+        except Exception as e:
+            logger.error(f"Status-Snapshot-Fehler: {e}")
+            return None
+    
+    @staticmethod
+    def _compact_json(data: Any) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    @staticmethod
+    def _compact_status(status) -> Dict[str, Any]:
+        """
+        Kurzform des Status für /api/dashboard - nur was das Dashboard anzeigt, Leistungen in ganzen Watt
+        g: Netz W, b: Akkus W, st: [Status, Meldung], a: {id: [SoC %, Leistung W, Modus, Fehler]}
+        """
+        grid = status.get('grid_power')
+        batteries = {}
+        for akku_id, battery in status.get('batteries', {}).items():
+            soc = battery.get('soc_estimate')
+            if soc is None:
+                soc = battery.get('soc')
+            batteries[akku_id] = [
+                round(soc, 1) if soc is not None else None,
+                round(battery.get('current_power') or 0),
+                battery.get('current_mode', 0),
+                battery.get('error_count', 0)
+            ]
+        system_status = status.get('system_status', {})
+        return {
+            'g': round(grid) if grid is not None else None,
+            'b': round(status.get('battery_power') or 0),
+            'st': [system_status.get('status'), system_status.get('message')],
+            'a': batteries
+        }
+    
     def _get_system_status(self, meter_status: Dict, battery_status: Dict) -> Dict[str, Any]:
         """Bestimmt Gesamt-Systemstatus"""
         meter_type = self.config.get_energy_meter_type()
@@ -319,19 +592,25 @@ class SimpleWebServer:
     
     def add_log_entry(self, level: str, message: str):
         """Fügt Log-Eintrag zum Web-Puffer hinzu"""
-        entry = {
-            'timestamp': datetime.now().strftime('%H:%M:%S'),
-            'level': level,
-            'message': message
-        }
-        
-        self.log_buffer.append(entry)
-        
-        # Puffer-Größe begrenzen
-        if len(self.log_buffer) > self.max_log_entries:
-            self.log_buffer.pop(0)
+        entry = self.log_buffer.append(level, message)
+        self.events.publish_json('log', entry)
+        if self.history:
+            self.history.append_event(time.time(), level, message)
     
     def run(self, host: str = '0.0.0.0', port: int = 8080, debug: bool = False):
         """Startet den Webserver"""
         logger.info(f"Starte Web-Server auf {host}:{port}")
-        self.app.run(host=host, port=port, debug=debug, use_reloader=False)
+        
+        if not debug:
+            self.server = create_server(self.app, host, port, self.web_config)
+        
+        if self.server:
+            self.server.run()
+        else:
+            self.app.run(host=host, port=port, debug=debug, use_reloader=False, threaded=True)
+    
+    def shutdown(self):
+        """Beendet den Webserver (nur Waitress - der Flask-Server endet mit dem Prozess)"""
+        if self.server:
+            self.server.close()
+            logger.info("Web-Server beendet")
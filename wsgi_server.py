@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+WSGI-Serving für das Web-Interface der Marstek PV-Akku Steuerung
+Waitress mit begrenztem Worker-Pool und Keep-Alive statt Flask-Entwicklungsserver,
+dazu Request-Metriken (laufende Anfragen, Warteschlange, Latenz)
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+    """WSGI-Middleware: zählt Anfragen und misst die Bearbeitungszeit"""
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        status_holder = {}
+
+        def tracking_start_response(status, headers, exc_info=None):
+            status_holder['code'] = status[:3]
+            return start_response(status, headers, exc_info)
+
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return self.app(environ, tracking_start_response)
+        finally:
+            # Bei Streams (SSE) ist das die Zeit bis zum Start der Antwort
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.in_flight -= 1
+                self.requests_total += 1
+                self.latency_total += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+                if status_holder.get('code', '500').startswith('5'):
+                    self.errors_total += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Gibt Request-Metriken zurück"""
+        with self._lock:
+            avg = self.latency_total / self.requests_total if self.requests_total else 0.0
+            return {
+                'in_flight': self.in_flight,
+                'requests_total': self.requests_total,
+                'errors_total': self.errors_total,
+                'avg_latency_ms': round(avg * 1000, 2),
+                'max_latency_ms': round(self.latency_max * 1000, 2)
+            }
+
+
+class WaitressServer:
+    """Eingebetteter Waitress-Server mit festem Thread-Pool"""
+
+    def __init__(self, app, host: str, port: int, threads: int = 6, connection_limit: int = 32,
+                 channel_timeout: int = 60, backlog: int = 64):
+        # Import erst hier - waitress ist optional, ohne wird der Flask-Server genutzt
+        from waitress.server import create_server
+
+        self.threads = threads
+        self.server = create_server(
+            app,
+            host=host,
+            port=port,
+            threads=threads,
+            connection_limit=connection_limit,
+            channel_timeout=channel_timeout,
+            backlog=backlog,
+            ident='Marstek',
+            clear_untrusted_proxy_headers=True
+        )
+        logger.info(f"Waitress: {threads} Worker-Threads, max. {connection_limit} Verbindungen, Backlog {backlog}")
+
+    def run(self):
+        """Blockiert bis close() aufgerufen wird"""
+        self.server.run()
+
+    def close(self):
+        """Beendet den Server und seine Worker-Threads"""
+        try:
+            self.server.close()
+            self.server.task_dispatcher.shutdown(cancel_pending=True, timeout=2)
+        except Exception as e:
+            logger.warning(f"Fehler beim Beenden des Web-Servers: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Auslastung des Worker-Pools und Länge der Warteschlange"""
+        dispatcher = self.server.task_dispatcher
+        return {
+            'threads': self.threads,
+            'active_threads': dispatcher.active_count,
+            'queue_depth': len(dispatcher.queue)
+        }
+
+
+def is_waitress_available() -> bool:
+    """Prüft, ob waitress installiert ist"""
+    try:
+        import waitress  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_server(app, host: str, port: int, web_config: Dict[str, Any]) -> Optional[WaitressServer]:
+    """Erstellt den konfigurierten Produktionsserver oder None für den Flask-Entwicklungsserver"""
+    server_type = web_config.get('server', 'waitress')
+    if server_type != 'waitress':
+        return None
+
+    if not is_waitress_available():
+        logger.warning("waitress nicht installiert - verwende Flask-Entwicklungsserver (pip install waitress)")
+        return None
+
+    return WaitressServer(
+        app,
+        host=host,
+        port=port,
+        threads=web_config.get('threads', 6),
+        connection_limit=web_config.get('connection_limit', 32),
+        channel_timeout=web_config.get('channel_timeout_seconds', 60),
+        backlog=web_config.get('backlog', 64)
+    )
@@ -20,6 +20,8 @@ from typing import Optional, Tuple, Dict, Any
 from shelly_client import ShellyClient
 from battery_client import BatteryManager
 from config_loader import ConfigLoader
+import metrics
+import timing
 
 logger = logging.getLogger(__name__)
 
@@ -54,35 +56,89 @@ class ZeroFeedController:
         self.enabled = True  # Flag für Setup-Modus
         
         # Trägheit für sanfte Regelung
-        self.max_power_change_rate = 750  # Maximale Änderung pro Zyklus in Watt
+        self.max_power_change_rate = control_config.get('max_power_change_watts', 750)  # Maximale Änderung pro Zyklus in Watt
+        self.start_threshold = control_config.get('start_threshold_watts', 50)  # Mindestabweichung für Start aus Stopp
+        
+        # Schreibunterdrückung: Totband, Hysterese und Mindest-Verweilzeiten
+        # schonen RS485-Bus und Akku-Firmware vor Mini-Anpassungen
+        self.power_deadband = control_config.get('power_deadband_watts', 40)
+        self.power_hysteresis = control_config.get('power_hysteresis_watts', 20)
+        self.min_setpoint_dwell = control_config.get('min_setpoint_dwell_seconds', 6)
+        self.min_mode_dwell = control_config.get('min_mode_dwell_seconds', 15)
+        self.dwell_bypass_power = control_config.get('dwell_bypass_watts', 300)
+        self.last_setpoint_time = 0.0
+        self.last_mode_change_time = 0.0
+        self.last_change_direction = 0  # +1 = erhöht, -1 = reduziert, 0 = unbekannt
+        self.writes_avoided = 0
+        self.writes_avoided_by_reason = {'deadband': 0, 'hysteresis': 0, 'setpoint_dwell': 0, 'mode_dwell': 0}
+        
+        # Ergebnis des letzten Regelzyklus (für Verlauf und Diagnose)
+        self.cycle_grid_power: Optional[float] = None
+        self.cycle_rate_limited = False
+        self.cycle_suppress_reason: Optional[str] = None
+        self.last_cycle: Optional[Dict[str, Any]] = None
+        self.last_reasoning = ''
         
         # Schutzregelung für niedrigen SoC
-        self.low_soc_threshold = 13  # Unter 13% SoC
-        self.low_soc_min_surplus = -100  # Mindestens 100W Überschuss nötig
+        self.low_soc_threshold = control_config.get('low_soc_threshold_percent', 13)  # Unter 13% SoC
+        self.low_soc_min_surplus = control_config.get('low_soc_min_surplus_watts', -100)  # Mindestens 100W Überschuss nötig
         
         logger.info("Zero-Feed-Controller initialisiert (v3.4 - Web-Integration)")
         logger.info(f"Grid-Ziele: Laden bis {self.target_grid_power_charge}W, Entladen bis {self.target_grid_power_discharge}W")
         logger.info(f"Akku-Grenzen: {self.min_power_per_battery}-{self.max_power_per_battery}W, SoC {self.min_soc_discharge}-{self.max_soc_charge}%")
         logger.info(f"Änderungsrate begrenzt auf: {self.max_power_change_rate}W/Zyklus")
+        logger.info(f"Schreibunterdrückung: Totband {self.power_deadband}W, Hysterese {self.power_hysteresis}W, "
+                    f"Verweilzeit Leistung {self.min_setpoint_dwell}s / Modus {self.min_mode_dwell}s")
         logger.info(f"Niedrig-SoC Schutz: <{self.low_soc_threshold}% benötigt >{abs(self.low_soc_min_surplus)}W Überschuss")
 
     def execute_control_cycle(self) -> Tuple[bool, str]:
-        """Führt einen kompletten Regelzyklus aus"""
+        """Führt einen kompletten Regelzyklus aus und merkt sich dessen Ergebnis (last_cycle)"""
+        self.cycle_grid_power = None
+        self.cycle_rate_limited = False
+        self.cycle_suppress_reason = None
+        with timing.TIMINGS.cycle() as cycle_span:
+            success, status = self._run_control_cycle()
+            cycle_span.info = {'success': success, 'mode': self.current_mode,
+                               'power': self.current_total_power, 'reasoning': status}
+        metrics.CONTROL_CYCLE_SECONDS.observe(cycle_span.duration)
+        metrics.CONTROLLER_MODE.set(self.current_mode)
+        metrics.CONTROLLER_SETPOINT.set(self.current_total_power)
+        self.last_reasoning = status
+        self.last_cycle = {
+            'timestamp': time.time(),
+            'success': success,
+            'grid_power': self.cycle_grid_power,
+            'mode': self.current_mode,
+            'power': self.current_total_power,
+            'rate_limited': self.cycle_rate_limited,
+            'suppress_reason': self.cycle_suppress_reason,
+            'duration_ms': round(cycle_span.duration * 1000, 1),
+            'reasoning': status
+        }
+        return success, status
+    
+    def _run_control_cycle(self) -> Tuple[bool, str]:
+        """Regelzyklus: Messwert holen, Sollwert berechnen, Akkus ansteuern"""
         # Prüfe ob Controller aktiviert ist
         if not self.enabled:
             return True, "Controller deaktiviert (Setup-Modus)"
         
         try:
             grid_power = self.energy_meter.get_current_power_direct()
+            self.cycle_grid_power = grid_power
             if grid_power is None:
                 meter_type = self.config.get_energy_meter_type()
                 return False, f"{meter_type}-Daten nicht verfügbar"
             
             avg_soc = self.batteries.get_average_soc()
+            if avg_soc is None:
+                # Vor der ersten SoC-Lesung nichts schreiben - insbesondere nicht alle Akkus stoppen
+                return True, "Warte auf erste SoC-Lesung - Zyklus übersprungen"
             
-            success, new_mode, new_power, reasoning = self._calculate_optimal_control(
-                grid_power, avg_soc, self.current_mode, self.current_total_power
-            )
+            with timing.span('compute'):
+                success, new_mode, new_power, reasoning = self._calculate_optimal_control(
+                    grid_power, avg_soc, self.current_mode, self.current_total_power
+                )
             
             if not success:
                 self.batteries.stop_all()
@@ -91,13 +147,23 @@ class ZeroFeedController:
                 return False, reasoning
             
             # Trägheit anwenden
-            new_mode, new_power, rate_limited = self._apply_rate_limiting(new_mode, new_power)
+            with timing.span('rate_limit'):
+                new_mode, new_power, rate_limited = self._apply_rate_limiting(new_mode, new_power)
+            self.cycle_rate_limited = rate_limited
             
-            # Nur bei Änderungen handeln
+            # Nur bei relevanten Änderungen schreiben (Totband/Hysterese/Verweilzeit)
             mode_changed = (new_mode != self.current_mode)
-            power_changed_significantly = abs(new_power - self.current_total_power) > self.min_power_per_battery / 2
+            write_needed, suppress_reason = self._evaluate_write(new_mode, new_power)
+            self.cycle_suppress_reason = suppress_reason
+            
+            if suppress_reason:
+                self.writes_avoided += 1
+                self.writes_avoided_by_reason[suppress_reason] += 1
+                metrics.CONTROLLER_WRITES_AVOIDED.labels(suppress_reason).inc()
+                logger.debug(f"Schreibvorgang unterdrückt ({suppress_reason}): "
+                             f"Modus {self.current_mode}->{new_mode}, {self.current_total_power:.0f}W -> {new_power:.0f}W")
 
-            if mode_changed or power_changed_significantly:
+            if write_needed:
                 # **STRUKTURIERTER LOG für Konsole UND Web-Interface**
                 old_mode_text = {0: 'Stop', 1: 'Laden', 2: 'Entladen'}.get(self.current_mode, 'Unbekannt')
                 new_mode_text = {0: 'Stop', 1: 'Laden', 2: 'Entladen'}.get(new_mode, 'Unbekannt')
@@ -122,8 +188,15 @@ class ZeroFeedController:
                 # Akku-Steuerung ausführen
                 success = self._execute_battery_control(new_mode, new_power)
                 if success:
+                    now = time.time()
                     if mode_changed:
                         self.mode_change_count += 1
+                        metrics.CONTROLLER_MODE_CHANGES.inc()
+                        self.last_mode_change_time = now
+                        self.last_change_direction = 0
+                    elif new_power != self.current_total_power:
+                        self.last_change_direction = 1 if new_power > self.current_total_power else -1
+                    self.last_setpoint_time = now
                     
                     self.current_mode = new_mode
                     self.current_total_power = new_power
@@ -133,11 +206,16 @@ class ZeroFeedController:
                     if self.web_server:
                         self.web_server.add_log_entry('error', error_msg)
                     return False, error_msg
+            elif self.current_mode != 0:
+                # Unterdrückter Schreibvorgang: lange unveränderte Sollwerte trotzdem auffrischen
+                self.batteries.refresh_setpoints()
             
             self.last_grid_power = grid_power
             mode_text = {0: 'Stop', 1: 'Laden', 2: 'Entladen'}.get(new_mode, 'Unbekannt')
             
             status_suffix = " [GEDÄMPFT]" if rate_limited else ""
+            if suppress_reason in ('setpoint_dwell', 'mode_dwell'):
+                status_suffix += f" [GEHALTEN: {suppress_reason}]"
             status = f"{mode_text} {new_power:.0f}W | SoC: {avg_soc:.0f}% | {reasoning}{status_suffix}"
             return True, status
             
@@ -191,6 +269,47 @@ class ZeroFeedController:
                 limited_power = max(0, limited_power)
                 return target_mode, limited_power, True
 
+    def _evaluate_write(self, new_mode: int, new_power: float) -> Tuple[bool, Optional[str]]:
+        """
+        Entscheidet, ob ein neuer Sollwert an die Akkus geschrieben wird
+        
+        Stopp-Befehle werden immer sofort ausgeführt (Sicherheit). Leistungsänderungen
+        im gleichen Modus müssen das Totband überschreiten, Richtungsumkehr zusätzlich
+        die Hysterese. Mindest-Verweilzeiten halten Sollwert und Modus stabil.
+        
+        Returns: (schreiben, Grund der Unterdrückung oder None)
+        """
+        now = time.time()
+        
+        # Modus-Wechsel
+        if new_mode != self.current_mode:
+            if new_mode == 0:
+                return True, None
+            if now - self.last_mode_change_time < self.min_mode_dwell:
+                return False, 'mode_dwell'
+            return True, None
+        
+        # Gleicher Modus
+        if new_mode == 0:
+            return False, None
+        
+        power_change = new_power - self.current_total_power
+        if abs(power_change) < 1:
+            return False, None  # Keine echte Änderung (Leistung wird ganzzahlig geschrieben)
+        
+        if abs(power_change) <= self.power_deadband:
+            return False, 'deadband'
+        
+        direction = 1 if power_change > 0 else -1
+        if (self.last_change_direction != 0 and direction != self.last_change_direction
+                and abs(power_change) <= self.power_deadband + self.power_hysteresis):
+            return False, 'hysteresis'
+        
+        if now - self.last_setpoint_time < self.min_setpoint_dwell and abs(power_change) < self.dwell_bypass_power:
+            return False, 'setpoint_dwell'
+        
+        return True, None
+
     def _calculate_optimal_control(self, grid_power: float, avg_soc: float, current_mode: int, current_power: float) -> Tuple[bool, int, float, str]:
         """
         Berechnet optimale Akkuregelung mit korrekter Physik
@@ -290,7 +409,7 @@ class ZeroFeedController:
         else:
             
             # Schwellenwerte für Start aus Stop-Modus
-            START_THRESHOLD = 50  # Mindestens 50W Abweichung für Start
+            START_THRESHOLD = self.start_threshold  # Mindestabweichung für Start (Standard 50W)
             
             # PV-Überschuss?
             if grid_power < (self.target_grid_power_charge - START_THRESHOLD):
@@ -345,14 +464,16 @@ class ZeroFeedController:
     def _count_available_batteries_for_charging(self) -> int:
         count = 0
         for battery in self.batteries.batteries.values():
-            if battery.last_soc is not None and battery.last_soc < self.max_soc_charge:
+            soc = battery.get_soc()
+            if soc is not None and soc < self.max_soc_charge:
                 count += 1
         return count
     
     def _count_available_batteries_for_discharging(self) -> int:
         count = 0
         for battery in self.batteries.batteries.values():
-            if battery.last_soc is not None and battery.last_soc > self.min_soc_discharge:
+            soc = battery.get_soc()
+            if soc is not None and soc > self.min_soc_discharge:
                 count += 1
         return count
     
@@ -396,6 +517,15 @@ class ZeroFeedController:
             'target_grid_charge': self.target_grid_power_charge,
             'target_grid_discharge': self.target_grid_power_discharge,
             'max_power_change_rate': self.max_power_change_rate,
+            'write_suppression': {
+                'deadband': self.power_deadband,
+                'hysteresis': self.power_hysteresis,
+                'min_setpoint_dwell': self.min_setpoint_dwell,
+                'min_mode_dwell': self.min_mode_dwell,
+                'dwell_bypass': self.dwell_bypass_power
+            },
+            'writes_avoided': self.writes_avoided,
+            'writes_avoided_by_reason': dict(self.writes_avoided_by_reason),
             'low_soc_protection': {
                 'threshold': self.low_soc_threshold,
                 'min_surplus': self.low_soc_min_surplus
@@ -405,4 +535,6 @@ class ZeroFeedController:
     
     def reset_statistics(self):
         self.mode_change_count = 0
+        self.writes_avoided = 0
+        self.writes_avoided_by_reason = {reason: 0 for reason in self.writes_avoided_by_reason}
         logger.info("Controller-Statistiken zurückgesetzt")
\ No newline at end of file